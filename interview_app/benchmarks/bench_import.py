@@ -0,0 +1,100 @@
+"""Cold-start benchmark for a worker importing wsgi.py.
+
+Each sample runs a fresh interpreter that imports ``wsgi`` (which builds the
+app) and reports how long that took and how long until /health answers.
+With ``--preload`` the simulator is built as well, as in a gunicorn master
+started with --preload. The slowest modules come from ``python -X importtime``.
+Run from the interview_app directory:
+
+    python -m benchmarks.bench_import run --repeat=5
+    python -m benchmarks.bench_import run --preload
+    python -m benchmarks.bench_import run --save_baseline
+    python -m benchmarks.bench_import run --compare=benchmarks/baseline_import.json
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+import fire
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline_import.json")
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+SAMPLE_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import wsgi
+imported = time.perf_counter()
+if {preload}:
+    from skillsense_ai import preload
+    preload(wsgi.application)
+preloaded = time.perf_counter()
+wsgi.application.test_client().get("/health")
+print(json.dumps({{"import_s": imported - started, "preload_s": preloaded - imported,
+                  "first_request_s": time.perf_counter() - started}}))
+"""
+
+
+def sample(preload):
+    output = subprocess.run([sys.executable, "-c", SAMPLE_SCRIPT.format(preload=bool(preload))],
+                            cwd=APP_DIR, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(top):
+    """Modules with the largest cumulative import time, from ``-X importtime``."""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import wsgi"],
+                            cwd=APP_DIR, check=True, capture_output=True, text=True).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        modules.append((int(cumulative), name.strip()))
+    return [{"module": name, "cumulative_ms": cumulative / 1000}
+            for cumulative, name in sorted(modules, reverse=True)[:top]]
+
+
+def run(repeat=5, preload=False, top=15, save_baseline=False, output=None, compare=None, tolerance=0.25):
+    """Run the benchmark and print (and optionally store) the JSON report."""
+    samples = [sample(preload) for _ in range(repeat)]
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "parameters": {"repeat": repeat, "preload": bool(preload)},
+        "python": sys.version.split()[0],
+    }
+    for metric in ("import_s", "preload_s", "first_request_s"):
+        values = [s[metric] for s in samples]
+        report[metric] = {"min": min(values), "median": statistics.median(values), "max": max(values)}
+    report["slowest_imports"] = slowest_imports(top)
+    print(json.dumps(report, indent=2))
+
+    if save_baseline or output:
+        with open(output or BASELINE_PATH, "w") as f:
+            json.dump(report, f, indent=2)
+    if compare:
+        regressions = compare_reports(report, compare, tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+def compare_reports(report, baseline_path, tolerance):
+    """List the timings whose median grew by more than ``tolerance``."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for metric in ("import_s", "first_request_s"):
+        base = baseline[metric]["median"]
+        current = report[metric]["median"]
+        if base and current > base * (1 + tolerance):
+            regressions.append(f"{metric}: {base * 1000:.1f}ms -> {current * 1000:.1f}ms")
+    return regressions
+
+
+if __name__ == "__main__":
+    fire.Fire()
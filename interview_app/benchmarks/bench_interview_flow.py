@@ -0,0 +1,204 @@
+"""Load test of the full interview flow against the Flask app.
+
+Drives concurrent synthetic interviews through
+create -> record -> (interviewer -> select -> student) x turns -> end
+with the mocked knowledge profile from the conversation tests and a fake LLM
+latency, then reports latency percentiles per route, throughput and DB query
+counts. Run from the interview_app directory:
+
+    python -m benchmarks.bench_interview_flow run --interviews=50 --concurrency=8 --latency=0.2
+    python -m benchmarks.bench_interview_flow run --database=mysql --save_baseline
+    python -m benchmarks.bench_interview_flow run --compare=benchmarks/baseline_interview_flow.json
+"""
+import json
+import os
+import platform
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest.mock import DEFAULT
+
+import fire
+from peewee import SqliteDatabase
+
+from skillsense_ai import create_app
+from db.config import CONFIG
+from db.db_utils import create_tables, populate_test_db, init_real_db
+from db.models import database_proxy
+from defaultsettings import config
+from tests.test_conversation import setup_mock_knowledge_profile
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline_interview_flow.json")
+ROUTES = ["create", "record", "interviewer", "select", "student", "end"]
+
+
+class QueryCounter:
+    """Counts the SQL statements executed per benchmarked route."""
+
+    def __init__(self, db):
+        self.counts = defaultdict(int)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        execute_sql = db.execute_sql
+
+        def counted_execute_sql(sql, params=None, *args, **kwargs):
+            route = getattr(self._local, "route", None)
+            if route is not None:
+                with self._lock:
+                    self.counts[route] += 1
+            return execute_sql(sql, params, *args, **kwargs)
+
+        db.execute_sql = counted_execute_sql
+
+    def route(self, name):
+        self._local.route = name
+
+
+def init_bench_db(database):
+    if database == "sqlite":
+        path = os.path.join(tempfile.mkdtemp(prefix="skillsense-bench-"), "bench.db")
+        db = SqliteDatabase(path, pragmas={"journal_mode": "wal"}, timeout=30)
+        database_proxy.initialize(db)
+    elif database == "mysql":
+        # Points at the [db] section of config.ini, e.g. a local MySQL container.
+        db = init_real_db(config=CONFIG)
+    else:
+        raise ValueError(f"Unknown database {database!r}, use sqlite or mysql")
+    if create_tables(db):
+        populate_test_db()
+    return db
+
+
+def with_latency(mock, latency):
+    """Make a MagicMock sleep like an LLM call before returning its return_value."""
+    def delayed(*args, **kwargs):
+        time.sleep(latency)
+        return DEFAULT
+    mock.side_effect = delayed
+
+
+def build_app(database, latency, policy):
+    app = create_app(config["testing"])
+    app.db = init_bench_db(database)
+    simulator = app.config["simulator"]
+    simulator.db = app.db
+    setup_mock_knowledge_profile(simulator, policy)
+    knowledge_profile = simulator.initialize_knowledge_profile.return_value
+    with_latency(knowledge_profile.get_next_interaction, latency)
+    with_latency(knowledge_profile.get_kcs_from_answer, latency)
+    with_latency(simulator.get_student_response, latency)
+    return app
+
+
+def environment():
+    """Where the report was measured, since latencies only compare on the same setup."""
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run_interview(app, level, turns, timings, queries, lock):
+    client = app.test_client()
+
+    def call(route, url, **kwargs):
+        queries.route(route)
+        method = client.post if "json" in kwargs else client.get
+        started = time.perf_counter()
+        response = method(url, **kwargs)
+        elapsed = time.perf_counter() - started
+        queries.route(None)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{route} {url} returned {response.status_code}")
+        with lock:
+            timings[route].append(elapsed)
+        return response
+
+    response = call("create", f"/api/interview/{level}")
+    interview_id = int(response.headers["Location"].rstrip("/").rsplit("/", 1)[-1])
+    call("record", f"/api/interview/record/{interview_id}")
+    for _ in range(turns):
+        call("interviewer", f"/api/conversation/interviewer/{interview_id}")
+        call("select", f"/api/conversation/interviewer/select_suggested_conversation/{interview_id}/0")
+        call("student", f"/api/conversation/student/{interview_id}", json={"response": "Synthetic answer."})
+    call("end", f"/api/conversation/interview/end/{interview_id}")
+
+
+def run(interviews=20, concurrency=4, turns=2, latency=0.05, policy=1, level="beginner",
+        database="sqlite", save_baseline=False, output=None, compare=None, tolerance=0.25):
+    """Run the benchmark and print (and optionally store) the JSON report."""
+    app = build_app(database, latency, policy)
+    queries = QueryCounter(app.db)
+    timings = defaultdict(list)
+    lock = threading.Lock()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_interview, app, level, turns, timings, queries, lock)
+                   for _ in range(interviews)]
+        errors = [str(future.exception()) for future in futures if future.exception()]
+    wall_time = time.perf_counter() - started
+
+    routes = {}
+    for route in ROUTES:
+        samples = timings.get(route)
+        if not samples:
+            continue
+        routes[route] = {
+            "requests": len(samples),
+            "p50_ms": percentile(samples, 0.50) * 1000,
+            "p95_ms": percentile(samples, 0.95) * 1000,
+            "p99_ms": percentile(samples, 0.99) * 1000,
+            "mean_ms": sum(samples) / len(samples) * 1000,
+            "queries_per_request": queries.counts[route] / len(samples),
+        }
+    total_requests = sum(len(samples) for samples in timings.values())
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "parameters": {"interviews": interviews, "concurrency": concurrency, "turns": turns,
+                       "latency": latency, "policy": policy, "level": level, "database": database},
+        "environment": environment(),
+        "wall_time_s": wall_time,
+        "interviews_per_s": (interviews - len(errors)) / wall_time,
+        "requests_per_s": total_requests / wall_time,
+        "total_queries": sum(queries.counts.values()),
+        "errors": errors,
+        "routes": routes,
+    }
+    print(json.dumps(report, indent=2))
+
+    if save_baseline or output:
+        with open(output or BASELINE_PATH, "w") as f:
+            json.dump(report, f, indent=2)
+    if compare:
+        regressions = compare_reports(report, compare, tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+def compare_reports(report, baseline_path, tolerance):
+    """List routes whose p95 latency or query count grew by more than ``tolerance``."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for route, stats in report["routes"].items():
+        base = baseline["routes"].get(route)
+        if base is None:
+            continue
+        for metric in ("p95_ms", "queries_per_request"):
+            if base[metric] and stats[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{route} {metric}: {base[metric]:.2f} -> {stats[metric]:.2f}")
+    return regressions
+
+
+if __name__ == "__main__":
+    fire.Fire()
@@ -0,0 +1,92 @@
+import threading
+import time
+
+from playhouse.pool import PooledMySQLDatabase, MaxConnectionsExceeded
+from playhouse.shortcuts import ReconnectMixin
+
+
+class ReconnectMySQLDatabase(ReconnectMixin, PooledMySQLDatabase):
+    """Pooled MySQL database that reconnects when the server has gone away.
+
+    Connections are pinged when they are checked out of the pool (see
+    ``PooledMySQLDatabase._is_closed``) so dead ones are discarded instead of
+    handed to a request. Queries failing with a lost-connection error outside
+    of a transaction are retried up to ``max_retries`` times on a fresh
+    connection.
+    """
+
+    def __init__(self, database, max_retries=3, retry_delay=1, **kwargs):
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._stats_lock = threading.Lock()
+        self._waiting = threading.local()
+        self.checkouts = 0
+        self.waits = 0
+        self.reconnects = 0
+        super(ReconnectMySQLDatabase, self).__init__(database, **kwargs)
+
+    def connect(self, reuse_if_open=False):
+        self._waiting.flag = False
+        try:
+            return super(ReconnectMySQLDatabase, self).connect(reuse_if_open)
+        finally:
+            if self._waiting.flag:
+                with self._stats_lock:
+                    self.waits += 1
+
+    def _connect(self):
+        try:
+            conn = super(ReconnectMySQLDatabase, self)._connect()
+        except MaxConnectionsExceeded:
+            # The pool is exhausted; connect() sleeps and tries again.
+            self._waiting.flag = True
+            raise
+        with self._stats_lock:
+            self.checkouts += 1
+        return conn
+
+    def _is_reconnect_error(self, exc):
+        fragments = self._reconnect_errors.get(type(exc))
+        if fragments is None:
+            return False
+        message = str(exc).lower()
+        return any(fragment in message for fragment in fragments)
+
+    def _reconnect(self, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as exc:
+                # Inside a transaction a silent reconnect could lose changes.
+                if (attempt >= self.max_retries or self.in_transaction()
+                        or not self._is_reconnect_error(exc)):
+                    raise
+            attempt += 1
+            with self._stats_lock:
+                self.reconnects += 1
+            if not self.is_closed():
+                # Drop the broken connection instead of returning it to the pool.
+                self.manual_close()
+            if attempt > 1:
+                time.sleep(self.retry_delay)
+            self.connect()
+
+    def is_connection_usable(self):
+        if self.is_closed():
+            return False
+        return not self._is_closed(self.connection())
+
+    def pool_stats(self):
+        with self._pool_lock:
+            in_use = len(self._in_use)
+            idle = len(self._connections)
+        with self._stats_lock:
+            return {
+                'in_use': in_use,
+                'idle': idle,
+                'max_connections': self._max_connections,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'reconnects': self.reconnects,
+            }
@@ -1,6 +1,31 @@
+import json
 from db.models import StudentArtifact, Student, InterviewConversation, StudentInterviewRecord
 from datetime import datetime
 
+def parse_kcs(value):
+    """
+    Parses a stored KC column into a list of KC names. Handles JSON lists, the
+    {"concepts": [{"concept": ..., "score": ...}]} form and comma-joined strings.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return [kc.strip() for kc in value.split(",") if kc.strip()]
+    if isinstance(value, dict):
+        value = value.get("concepts", list(value.keys()))
+    if isinstance(value, str):
+        return [value]
+    kcs = []
+    for kc in value or []:
+        if isinstance(kc, dict):
+            kc = kc.get("concept")
+        if kc:
+            kcs.append(str(kc))
+    return kcs
+
 def save_student_artifact(extracted_kcs, problem_id, problem_solution, problem_statement):
     """
     Saves the extracted KCs and related problem information to the StudentArtifact table.
@@ -1,19 +1,24 @@
 import json
 import os
+import hashlib
+import pathlib
+import tempfile
 import importlib.resources
+import importlib.util
 from html import escape
 
 from peewee import *
-from db.models import Experiment, StudentArtifact, StudentInterviewRecord, Student, InterviewConversation, Artifact, database_proxy
+from db.models import Experiment, StudentArtifact, StudentInterviewRecord, Student, InterviewConversation, Artifact, TurnClaim, ArtifactHash, database_proxy
+from db.kc_sets import KC_SET_MODELS, KCDictionary, backfill_kc_sets
 from db.config import CONFIG
-from adaptive_concept_selection.utils.data_extraction_utilities import get_kcs
-# from db.connection_pool import ReconnectMySQLDatabase
+from db.connection_pool import ReconnectMySQLDatabase
 
 from flask import current_app, g
+from flask.cli import with_appcontext
 
 import click
 
-tables_alllocal = [Experiment, StudentArtifact, StudentInterviewRecord, Student, InterviewConversation, Artifact]
+tables_alllocal = [Experiment, StudentArtifact, StudentInterviewRecord, Student, InterviewConversation, Artifact, TurnClaim, ArtifactHash] + KC_SET_MODELS
 tables = tables_alllocal
 
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
@@ -27,6 +32,8 @@ def refresh_db_proxy(db, db_proxy):
     # Check if connection is usable (for ReconnectMySQLDatabase)
     if hasattr(db_proxy.obj, 'is_connection_usable'):
         if not db_proxy.obj.is_connection_usable():
+            if not db_proxy.obj.is_closed():
+                db_proxy.obj.manual_close()
             db_proxy.obj.connect()
     elif db_proxy.obj.is_closed():
         db_proxy.obj.connect()
@@ -43,30 +50,29 @@ def create_tables(db, reset=False):
     return created
 
 def init_real_db(config=None):
-    db = MySQLDatabase('adaptive_learning_concepts', **{'charset': 'utf8', 'sql_mode':
-    'PIPES_AS_CONCAT', 'use_unicode': True, 'host': config.get('db', 'host'),
-    'user': config.get('db', 'user'), 'password': config.get('db', 'password')})
+    if config is None:
+        config = CONFIG
+    db = ReconnectMySQLDatabase('adaptive_learning_concepts', **{
+        'charset': 'utf8',
+        'sql_mode': 'PIPES_AS_CONCAT',
+        'use_unicode': True,
+        'host': config.get('db', 'host'),
+        'user': config.get('db', 'user'),
+        'password': config.get('db', 'password'),
+        # Connection pool and timeout settings
+        'max_connections': config.getint('db', 'max_connections', fallback=20),
+        'stale_timeout': config.getint('db', 'stale_timeout', fallback=300),  # 5 minutes
+        'timeout': config.getint('db', 'pool_timeout', fallback=10),
+        'connect_timeout': config.getint('db', 'connect_timeout', fallback=10),
+        'read_timeout': config.getint('db', 'read_timeout', fallback=10),
+        'write_timeout': config.getint('db', 'write_timeout', fallback=10),
+        'autocommit': True,
+        'autoconnect': True,
+        # Custom retry settings
+        'max_retries': config.getint('db', 'max_retries', fallback=3),
+        'retry_delay': config.getfloat('db', 'retry_delay', fallback=1)
+    })
     database_proxy.initialize(db)
-    # db = ReconnectMySQLDatabase('adaptive_learning_concepts', **{
-    #     'charset': 'utf8',
-    #     'sql_mode': 'PIPES_AS_CONCAT',
-    #     'use_unicode': True,
-    #     'host': config.get('db', 'host'),
-    #     'user': config.get('db', 'user'),
-    #     'password': config.get('db', 'password'),
-    #     # Connection pool and timeout settings
-    #     'max_connections': 20,
-    #     'stale_timeout': 300,  # 5 minutes
-    #     'timeout': 10,
-    #     'connect_timeout': 10,
-    #     'read_timeout': 10,
-    #     'write_timeout': 10,
-    #     'autocommit': True,
-    #     'autoconnect': True,
-    #     # Custom retry settings
-    #     'max_retries': 3,
-    #     'retry_delay': 1
-    # })
     return db
 
 def init_test_db(reset=False):
@@ -88,53 +94,175 @@ def init_memory_db(reset=False):
         populate_test_db()
     return db
 
+def migrate_indexes(db, models=None):
+    """Create the indexes declared on the models that are missing from an existing database.
+
+    On MySQL the indexes are added in place without locking the table, so the
+    migration can run against a live database. Returns the created index names.
+    """
+    created = []
+    is_mysql = isinstance(db, MySQLDatabase)
+    for model in models or tables_alllocal:
+        table_name = model._meta.table_name
+        if not db.table_exists(table_name):
+            continue
+        existing = {index.name for index in db.get_indexes(table_name)}
+        for index in model._meta.fields_to_index():
+            if index._name in existing:
+                continue
+            if is_mysql:
+                columns = ", ".join(f"`{field.column_name}`" for field in index._expressions)
+                unique = "UNIQUE " if index._unique else ""
+                db.execute_sql(f"ALTER TABLE `{table_name}` ADD {unique}INDEX `{index._name}` ({columns}), "
+                               "ALGORITHM=INPLACE, LOCK=NONE")
+            else:
+                db.execute(index.safe(True))
+            created.append(index._name)
+    return created
+
+def migrate_interview_version(db):
+    """Add the ``interview_version`` column to an existing student_interview_record
+    table. Returns whether it was added."""
+    table_name = StudentInterviewRecord._meta.table_name
+    if any(column.name == 'interview_version' for column in db.get_columns(table_name)):
+        return False
+    if isinstance(db, MySQLDatabase):
+        db.execute_sql(f"ALTER TABLE `{table_name}` ADD COLUMN `interview_version` INT DEFAULT 0, "
+                       "ALGORITHM=INSTANT")
+    else:
+        db.execute_sql(f"ALTER TABLE {table_name} ADD COLUMN interview_version INTEGER DEFAULT 0")
+    return True
+
 def format_problem_html(problem):
     title_html = f"<h4>{escape(problem['title'])}</h4>"
     description_html = f"<p>{escape(problem['description'])}</p>"
     question_html = f"<p>Q. {escape(problem['question'])}</p>"
     return f"{title_html}\n{description_html}\n{question_html}"
 
-def write_student_artifact():
+SEED_LEVELS = ["beginner", "intermediate", "expert"]
+SEED_CACHE_DIR = os.environ.get("SKILLSENSE_SEED_CACHE", os.path.join(tempfile.gettempdir(), "skillsense-seed"))
+# Bump when the layout of the snapshot changes.
+SEED_SNAPSHOT_VERSION = 1
+SEED_BATCH_SIZE = 200
+_seed_snapshot = None
+
+def _read_resource_json(name):
+    return json.loads((importlib.resources.files("adaptive_concept_selection.resources.json") / name).read_text())
+
+def student_profile_rows():
+    """(student_k_cs, student_level) rows, one per level."""
+    from adaptive_concept_selection.utils.data_extraction_utilities import get_kcs
+    kcs = get_kcs()
+    return [(json.dumps(kcs[kcs[level] == 1]["concepts"].tolist()), level) for level in SEED_LEVELS]
+
+def student_artifact_rows():
+    """(problem_statement, problem_solution, extracted_kcs, student_level) rows."""
+    data = _read_resource_json("output_all.json")
     problem_records = []
-    data = json.loads((importlib.resources.files("adaptive_concept_selection.resources.json") / "output_all.json").read_text())
-    levels = ["beginner", "intermediate", "expert"]
-    artifacts = []
     for problem in data["problem"]:
-        problem_id = problem["problem_id"]
         problem_statement = problem["problem_statement"]
-        for level in levels:
+        for level in SEED_LEVELS:
             problem_solution = problem[level][0]["problem_solution"]
             problem_kcs = ",".join(problem[level][0]["kcs"])
-            student = Student.get_or_none(Student.student_level==level)
-            student_id = student.student_type_id
-            problem_records.append((problem_statement, problem_solution, problem_kcs, student_id))
-            # artifacts.append((level, problem_statement, problem_solution))
-    StudentArtifact.insert_many(problem_records, fields=[
-        StudentArtifact.problem_statement, StudentArtifact.problem_solution,
-        StudentArtifact.extracted_kcs,
-        StudentArtifact.student_id]).execute()
-
-    ds_data = json.loads((importlib.resources.files(
-        "adaptive_concept_selection.resources.json") / "ds_problems.json").read_text())
-    for problem in ds_data["problems"]:
-        problem_statement = format_problem_html(problem)
-        problem_solution = problem["solution"]
-        level = problem["level"]
-        artifacts.append((level, problem_statement, problem_solution, 1))
-    Artifact.insert_many(artifacts, fields=[
-        Artifact.artifact_level, Artifact.artifact_problem, Artifact.artifact_value, Artifact.artifact_valid]).execute()
+            problem_records.append((problem_statement, problem_solution, problem_kcs, level))
+    return problem_records
+
+def artifact_rows():
+    """(artifact_level, artifact_problem, artifact_value, artifact_valid) rows."""
+    ds_data = _read_resource_json("ds_problems.json")
+    return [(problem["level"], format_problem_html(problem), problem["solution"], 1)
+            for problem in ds_data["problems"]]
+
+def _insert_student_artifacts(rows):
+    # Resolve each level to the first student profile of that level.
+    student_ids = {}
+    for student in Student.select().order_by(Student.student_type_id):
+        student_ids.setdefault(student.student_level, student.student_type_id)
+    records = [(statement, solution, kcs, student_ids[level]) for statement, solution, kcs, level in rows]
+    for batch in chunked(records, SEED_BATCH_SIZE):
+        StudentArtifact.insert_many(batch, fields=[
+            StudentArtifact.problem_statement, StudentArtifact.problem_solution,
+            StudentArtifact.extracted_kcs,
+            StudentArtifact.student_id]).execute()
+
+def _insert_artifacts(rows):
+    for batch in chunked(rows, SEED_BATCH_SIZE):
+        Artifact.insert_many(batch, fields=[
+            Artifact.artifact_level, Artifact.artifact_problem, Artifact.artifact_value,
+            Artifact.artifact_valid]).execute()
+
+def write_student_artifact():
+    _insert_student_artifacts(student_artifact_rows())
+    _insert_artifacts(artifact_rows())
 
 def write_student_profile():
-    kcs = get_kcs()
-    student_data = []
-    for level in ["beginner", "intermediate", "expert"]:
-        kcs_level = kcs[kcs[level] == 1]["concepts"].tolist()
-        student_data.append((json.dumps(kcs_level), level))
-    recs = Student.insert_many(student_data, fields = [Student.student_k_cs, Student.student_level]).execute()
+    Student.insert_many(student_profile_rows(), fields=[Student.student_k_cs, Student.student_level]).execute()
+
+def _seed_source_files():
+    resources = [importlib.resources.files("adaptive_concept_selection.resources")]
+    while resources:
+        resource = resources.pop()
+        if resource.is_dir():
+            if resource.name != "__pycache__":
+                resources.extend(resource.iterdir())
+        else:
+            yield resource
+    # get_kcs may hold its concept table in code rather than in a resource file.
+    spec = importlib.util.find_spec("adaptive_concept_selection.utils.data_extraction_utilities")
+    if spec is not None and spec.origin:
+        yield pathlib.Path(spec.origin)
+
+def seed_snapshot_key():
+    """Hash of the seed snapshot's source files, changing whenever the seed data would."""
+    digest = hashlib.sha256(str(SEED_SNAPSHOT_VERSION).encode())
+    for resource in sorted(_seed_source_files(), key=str):
+        digest.update(str(resource).encode())
+        digest.update(resource.read_bytes())
+    return digest.hexdigest()[:16]
+
+def build_seed_snapshot():
+    return {
+        "students": student_profile_rows(),
+        "student_artifacts": student_artifact_rows(),
+        "artifacts": artifact_rows(),
+    }
+
+def load_seed_snapshot():
+    """Return the seed rows, parsed once per process and cached on disk across runs.
+
+    The JSON file in ``SEED_CACHE_DIR`` is named after ``seed_snapshot_key()``, so
+    it is rebuilt only when the resource files change. The snapshot is plain
+    data, so a file planted in the shared temporary directory cannot run code.
+    """
+    global _seed_snapshot
+    if _seed_snapshot is not None:
+        return _seed_snapshot
+    path = os.path.join(SEED_CACHE_DIR, f"seed-{seed_snapshot_key()}.json")
+    try:
+        with open(path, encoding="utf-8") as fileobj:
+            _seed_snapshot = {name: [tuple(row) for row in rows] for name, rows in json.load(fileobj).items()}
+        return _seed_snapshot
+    except (OSError, ValueError, TypeError, AttributeError):
+        pass
+    snapshot = build_seed_snapshot()
+    try:
+        os.makedirs(SEED_CACHE_DIR, mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=SEED_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as fileobj:
+            json.dump(snapshot, fileobj)
+        os.replace(tmp_path, path)
+    except OSError:
+        # A read-only cache directory only costs the rebuild next time.
+        pass
+    _seed_snapshot = snapshot
+    return snapshot
 
 def populate_test_db():
-    write_student_profile()
-    write_student_artifact()
+    snapshot = load_seed_snapshot()
+    with database_proxy.atomic():
+        Student.insert_many(snapshot["students"], fields=[Student.student_k_cs, Student.student_level]).execute()
+        _insert_student_artifacts(snapshot["student_artifacts"])
+        _insert_artifacts(snapshot["artifacts"])
 
 def get_db():
     if 'db' in g:
@@ -165,34 +293,52 @@ def init_test_db_command():
     init_test_db()
     click.echo('Initialized the test database.')
 
+@click.command('migrate-indexes')
+@with_appcontext
+def migrate_indexes_command():
+    """Add missing indexes to the existing tables."""
+    created = migrate_indexes(current_app.db)
+    for index_name in created:
+        click.echo(f'Created index {index_name}.')
+    click.echo(f'Created {len(created)} missing indexes.')
+
+@click.command('migrate-kc-sets')
+@click.option('--full', is_flag=True, help='Re-encode all rows instead of resuming after the last encoded one.')
+@click.option('--batch-size', type=int, default=1000)
+@with_appcontext
+def migrate_kc_sets_command(full, batch_size):
+    """Create the KC dictionary and bitset tables and encode the existing KC columns."""
+    refresh_db_proxy(current_app.db, database_proxy)
+    dictionary = current_app.config.get("kc_dictionary") or KCDictionary()
+    encoded = backfill_kc_sets(current_app.db, dictionary, full=full, batch_size=batch_size)
+    for table_name, count in encoded.items():
+        click.echo(f'Encoded {count} rows into {table_name}.')
+
+@click.command('migrate-turn-claims')
+@with_appcontext
+def migrate_turn_claims_command():
+    """Create the turn_claim table that keeps workers from stepping the same turn twice."""
+    refresh_db_proxy(current_app.db, database_proxy)
+    current_app.db.create_tables([TurnClaim], safe=True)
+    current_app.config["simulator_pool"].flights.available = True
+    click.echo('Created the turn_claim table.')
+
+@click.command('migrate-interview-version')
+@with_appcontext
+def migrate_interview_version_command():
+    """Add the write counter that validates cached sessions, ETags and summaries."""
+    refresh_db_proxy(current_app.db, database_proxy)
+    if migrate_interview_version(current_app.db):
+        click.echo('Added student_interview_record.interview_version.')
+    else:
+        click.echo('student_interview_record.interview_version already exists.')
+
 def init_app(app):
     #app.teardown_appcontext(close_db)
     app.teardown_request(close_db)
     app.cli.add_command(init_db_command)
     app.cli.add_command(init_test_db_command)
-
-# def db_retry(max_retries=3):
-#     """Decorator to retry database operations on connection failures"""
-#     def decorator(func):
-#         @wraps(func)
-#         def wrapper(*args, **kwargs):
-#             for attempt in range(max_retries):
-#                 try:
-#                     return func(*args, **kwargs)
-#                 except (OperationalError, InterfaceError) as e:
-#                     if "gone away" in str(e).lower() or "broken pipe" in str(e).lower():
-#                         if attempt < max_retries - 1:
-#                             # Try to reconnect
-#                             try:
-#                                 if database_proxy.obj and not database_proxy.obj.is_closed():
-#                                     database_proxy.obj.close()
-#                                 database_proxy.obj.connect()
-#                             except Exception:
-#                                 pass  # Will retry on next attempt
-#                         else:
-#                             raise e
-#                     else:
-#                         raise e
-#             return func(*args, **kwargs)
-#         return wrapper
-#     return decorator
\ No newline at end of file
+    app.cli.add_command(migrate_indexes_command)
+    app.cli.add_command(migrate_kc_sets_command)
+    app.cli.add_command(migrate_turn_claims_command)
+    app.cli.add_command(migrate_interview_version_command)
@@ -0,0 +1,51 @@
+from peewee import BlobField
+
+# numpy is imported in the functions below, so that importing the models does
+# not load it at worker boot.
+
+
+def encode_kc_set(kc_ids):
+    """Pack KC ids into a little-endian bitset: bit ``i`` is set when KC ``i`` is present."""
+    import numpy as np
+    kc_ids = np.asarray(sorted(set(kc_ids)), dtype=np.int64)
+    if not len(kc_ids):
+        return b''
+    mask = np.zeros(kc_ids[-1] + 1, dtype=bool)
+    mask[kc_ids] = True
+    return np.packbits(mask, bitorder='little').tobytes()
+
+
+def kc_mask(bitset, size=None):
+    """Boolean vector of a bitset, padded or cut to ``size`` KCs."""
+    import numpy as np
+    mask = np.unpackbits(np.frombuffer(bytes(bitset or b''), dtype=np.uint8), bitorder='little').astype(bool)
+    if size is None:
+        return mask
+    if len(mask) >= size:
+        return mask[:size]
+    return np.concatenate([mask, np.zeros(size - len(mask), dtype=bool)])
+
+
+def decode_kc_set(bitset):
+    import numpy as np
+    return frozenset(np.flatnonzero(kc_mask(bitset)).tolist())
+
+
+class KCSetField(BlobField):
+    """A set of KC ids (see ``KnowledgeComponent``) stored as a bitset.
+
+    Assign any iterable of ids; values read back are frozensets. A conversation
+    touching a handful of KCs out of a few hundred takes a few dozen bytes.
+    """
+
+    def db_value(self, value):
+        if value is None:
+            return None
+        if not isinstance(value, (bytes, bytearray, memoryview)):
+            value = encode_kc_set(value)
+        return super(KCSetField, self).db_value(value)
+
+    def python_value(self, value):
+        if value is None:
+            return None
+        return decode_kc_set(value)
@@ -0,0 +1,217 @@
+import threading
+from itertools import chain
+
+from peewee import JOIN, fn, chunked
+
+from db.fields import encode_kc_set
+from db.db_functions import parse_kcs
+from db.models import InterviewConversation, KnowledgeComponent, ConversationKCSet
+
+KC_SET_MODELS = [KnowledgeComponent, ConversationKCSet]
+
+# (bitset model, source model, primary key name, (KC column, ...), (copied column, ...))
+KC_SET_SOURCES = [
+    (ConversationKCSet, InterviewConversation, 'conversation_id',
+     ('conversation_k_cs', 'conversation_reference_kcs'), ('conversation_interview_id',)),
+]
+
+
+class KCDictionary:
+    """Cached view of the knowledge_component table, adding KC names on first sight."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._names = {}
+        self.available = None
+
+    def _load(self, names=None):
+        query = KnowledgeComponent.select(KnowledgeComponent.kc_id, KnowledgeComponent.kc_name)
+        if names is not None:
+            query = query.where(KnowledgeComponent.kc_name.in_(names))
+        for kc_id, name in query.tuples():
+            self._ids[name] = kc_id
+            self._names[kc_id] = name
+
+    def ids(self, names, create=True):
+        """Ids of ``names``; unknown names are added to the table unless ``create`` is False."""
+        names = list(dict.fromkeys(names))
+        missing = [name for name in names if name not in self._ids]
+        if missing:
+            with self._lock:
+                for batch in chunked(missing, 500):
+                    self._load(batch)
+                missing = [name for name in missing if name not in self._ids]
+                if missing and create:
+                    for batch in chunked(missing, 500):
+                        # Another worker may add the same names concurrently.
+                        (KnowledgeComponent.insert_many([(name,) for name in batch],
+                                                        fields=[KnowledgeComponent.kc_name])
+                         .on_conflict_ignore().execute())
+                        self._load(batch)
+        return [self._ids[name] for name in names if name in self._ids]
+
+    def names(self, kc_ids):
+        if any(kc_id not in self._names for kc_id in kc_ids):
+            with self._lock:
+                self._load()
+        return [self._names[kc_id] for kc_id in kc_ids if kc_id in self._names]
+
+    def encode(self, value):
+        """Bitset of a stored KC column value (JSON or comma-joined names)."""
+        if value is None:
+            return None
+        return encode_kc_set(self.ids(parse_kcs(value)))
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self._names.clear()
+            self.available = None
+
+
+def _upsert(model, rows, fields):
+    if rows:
+        model.insert_many(rows, fields=fields).on_conflict_replace().execute()
+
+
+def _encode_rows(dictionary, rows, kc_columns, copied_columns):
+    # rows are (key, *kc values, *copied values) tuples.
+    encoded = []
+    for row in rows:
+        kc_values = row[1:1 + len(kc_columns)]
+        encoded.append((row[0], *(dictionary.encode(value) for value in kc_values),
+                        *row[1 + len(kc_columns):]))
+    return encoded
+
+
+def backfill_kc_sets(db, dictionary, full=False, batch_size=1000):
+    """Create the KC dictionary and bitset tables if needed and encode the KC
+    columns of existing rows, in keyset-paginated batches.
+
+    Unless ``full`` is set, each table resumes after the highest row already
+    encoded. Returns the number of rows encoded per table.
+    """
+    db.create_tables(KC_SET_MODELS, safe=True)
+    dictionary.available = True
+    encoded = {}
+    for model, source, key, kc_columns, copied_columns in KC_SET_SOURCES:
+        source_key = getattr(source, key)
+        columns = [source_key] + [getattr(source, name) for name in kc_columns + copied_columns]
+        fields = [getattr(model, key)] + [getattr(model, name) for name in kc_columns + copied_columns]
+        last_key = 0 if full else (model.select(fn.MAX(getattr(model, key))).scalar() or 0)
+        count = 0
+        while True:
+            rows = list(source.select(*columns)
+                        .where(source_key > last_key)
+                        .order_by(source_key)
+                        .limit(batch_size)
+                        .tuples())
+            if not rows:
+                break
+            with db.atomic():
+                _upsert(model, _encode_rows(dictionary, rows, kc_columns, copied_columns), fields)
+            count += len(rows)
+            last_key = rows[-1][0]
+        encoded[model._meta.table_name] = count
+    return encoded
+
+
+def _store_conversation_kc_sets(dictionary, where):
+    rows = list(InterviewConversation.select(
+        InterviewConversation.conversation_id,
+        InterviewConversation.conversation_k_cs,
+        InterviewConversation.conversation_reference_kcs,
+        InterviewConversation.conversation_interview_id)
+        .where(where)
+        .tuples())
+    _upsert(ConversationKCSet,
+            _encode_rows(dictionary, rows, ('conversation_k_cs', 'conversation_reference_kcs'),
+                         ('conversation_interview_id',)),
+            [ConversationKCSet.conversation_id, ConversationKCSet.conversation_k_cs,
+             ConversationKCSet.conversation_reference_kcs, ConversationKCSet.conversation_interview_id])
+
+
+def refresh_conversation_kc_sets(dictionary, interview_id, turn_number=None):
+    """Encode the KC sets of an interview's conversations written since the last refresh.
+
+    Only rows after the interview's highest encoded conversation id are read,
+    so a turn costs its own rows. With ``turn_number``, that turn's rows are
+    re-encoded instead, e.g. after its reference concepts were selected.
+    """
+    if dictionary.available is None:
+        dictionary.available = ConversationKCSet.table_exists()
+    if not dictionary.available:
+        return
+    where = InterviewConversation.conversation_interview_id == interview_id
+    if turn_number is not None:
+        where &= InterviewConversation.conversation_turn_number == turn_number
+    else:
+        last_id = (ConversationKCSet.select(fn.MAX(ConversationKCSet.conversation_id))
+                   .where(ConversationKCSet.conversation_interview_id == interview_id)
+                   .scalar())
+        if last_id is not None:
+            where &= InterviewConversation.conversation_id > last_id
+    _store_conversation_kc_sets(dictionary, where)
+
+
+def kc_set_matrix(kc_sets, size=None):
+    """Boolean rows x KCs matrix of KC id sets."""
+    import numpy as np
+    kc_sets = [kc_set or () for kc_set in kc_sets]
+    columns = np.fromiter(chain.from_iterable(kc_sets), dtype=np.int64)
+    if size is None:
+        size = int(columns.max()) + 1 if len(columns) else 0
+    matrix = np.zeros((len(kc_sets), size), dtype=bool)
+    matrix[np.repeat(np.arange(len(kc_sets)), [len(kc_set) for kc_set in kc_sets]), columns] = True
+    return matrix
+
+
+def interview_kc_coverage(dictionary, interview_id):
+    """KC names of an interview's responded conversations, per turn and overall,
+    its reference KCs and their overlap, computed on the bitsets.
+
+    Rows the turn listener has not encoded (e.g. because it failed) are
+    encoded first.
+    """
+    import numpy as np
+    if dictionary.available is None:
+        dictionary.available = ConversationKCSet.table_exists()
+    if not dictionary.available:
+        raise RuntimeError('The KC set tables are missing; run "flask migrate-kc-sets".')
+    query = (InterviewConversation.select(
+        InterviewConversation.conversation_id,
+        InterviewConversation.conversation_turn_number,
+        InterviewConversation.conversation_responded,
+        ConversationKCSet.conversation_id,
+        ConversationKCSet.conversation_k_cs,
+        ConversationKCSet.conversation_reference_kcs)
+        .join(ConversationKCSet, JOIN.LEFT_OUTER,
+              on=(InterviewConversation.conversation_id == ConversationKCSet.conversation_id))
+        .where(InterviewConversation.conversation_interview_id == interview_id)
+        .tuples())
+    rows = list(query)
+    missing = [row[0] for row in rows if row[3] is None]
+    if missing:
+        _store_conversation_kc_sets(dictionary, InterviewConversation.conversation_id.in_(missing))
+        rows = list(query.clone())
+
+    kcs = [row[4] for row in rows]
+    reference_kcs = [row[5] for row in rows]
+    size = max(chain((kc_id + 1 for kc_set in kcs + reference_kcs for kc_id in kc_set or ()), [0]))
+    kc_matrix = kc_set_matrix(kcs, size)
+    responded = np.array([row[2] == 1 for row in rows], dtype=bool)
+    covered = kc_matrix[responded].any(axis=0)
+    reference = kc_set_matrix(reference_kcs, size).any(axis=0)
+
+    turn_rows = {}
+    for index, row in enumerate(rows):
+        if row[2] == 1:
+            turn_rows.setdefault(row[1], []).append(index)
+    return {
+        'turns': {turn_number: dictionary.names(np.flatnonzero(kc_matrix[indexes].any(axis=0)).tolist())
+                  for turn_number, indexes in turn_rows.items()},
+        'covered_kcs': sorted(dictionary.names(np.flatnonzero(covered).tolist())),
+        'reference_kcs': sorted(dictionary.names(np.flatnonzero(reference).tolist())),
+        'reference_kc_overlap': sorted(dictionary.names(np.flatnonzero(covered & reference).tolist())),
+    }
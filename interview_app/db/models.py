@@ -1,5 +1,6 @@
 from peewee import *
 from db.config import CONFIG
+from db.fields import KCSetField
 
 # database = MySQLDatabase('adaptive_learning_concepts', **{'charset': 'utf8', 'sql_mode':
 #     'PIPES_AS_CONCAT', 'use_unicode': True, 'host': CONFIG.get('db', 'host'),
@@ -27,6 +28,9 @@ class Artifact(BaseModel):
 
     class Meta:
         table_name = 'Artifact'
+        indexes = (
+            (('artifact_level', 'artifact_valid'), False),
+        )
 
 class Experiment(BaseModel):
     experiment_created_at = DateTimeField(constraints=[SQL("DEFAULT CURRENT_TIMESTAMP")], null=True)
@@ -52,6 +56,9 @@ class InterviewConversation(BaseModel):
 
     class Meta:
         table_name = 'interview_conversation'
+        indexes = (
+            (('conversation_interview_id', 'conversation_turn_number'), False),
+        )
 
 class Policy(BaseModel):
     policy_desc = CharField(null=True)
@@ -75,6 +82,9 @@ class Student(BaseModel):
 
     class Meta:
         table_name = 'student'
+        indexes = (
+            (('student_level',), False),
+        )
 
 class StudentArtifact(BaseModel):
     artifact_id = IntegerField(null=True)
@@ -97,7 +107,56 @@ class StudentInterviewRecord(BaseModel):
     interview_student_type_id = IntegerField(null=True)
     interview_timestamp = DateTimeField(null=True)
     interview_policy = IntegerField(null=True)
+    # Bumped in the transaction of every write to the interview's conversation
+    # rows (see services.session_cache); the simulator does not know it.
+    interview_version = IntegerField(constraints=[SQL("DEFAULT 0")], null=True)
 
     class Meta:
         table_name = 'student_interview_record'
+        indexes = (
+            (('interview_student_type_id',), False),
+        )
 
+
+class KnowledgeComponent(BaseModel):
+    kc_id = AutoField()
+    kc_name = CharField(unique=True)
+
+    class Meta:
+        table_name = 'knowledge_component'
+
+# Content hash of each Artifact row (see services.artifact_ingest), kept in a
+# side table since the simulator owns Artifact.
+class ArtifactHash(BaseModel):
+    artifact_id = IntegerField(primary_key=True)
+    content_hash = CharField(max_length=64, index=True)
+
+    class Meta:
+        table_name = 'artifact_hash'
+
+# Bitset-encoded KC sets (ids from knowledge_component) of the
+# interview_conversation rows. The original JSON columns stay, since the
+# simulator reads and writes them.
+class ConversationKCSet(BaseModel):
+    conversation_id = IntegerField(primary_key=True)
+    conversation_interview_id = IntegerField(index=True, null=True)
+    conversation_k_cs = KCSetField(null=True)
+    conversation_reference_kcs = KCSetField(null=True)
+
+    class Meta:
+        table_name = 'conversation_kc_set'
+
+class TurnClaim(BaseModel):
+    """One row per simulator step taken; the unique key keeps two workers from
+    taking the same step of an interview."""
+    claim_interview_id = IntegerField()
+    claim_turn_number = IntegerField()  # last turn of the other role, -1 for none
+    claim_turn_id = IntegerField()
+    claim_done = IntegerField(null=True)
+    claim_timestamp = DateTimeField(null=True)
+
+    class Meta:
+        table_name = 'turn_claim'
+        indexes = (
+            (('claim_interview_id', 'claim_turn_number', 'claim_turn_id'), True),
+        )
@@ -0,0 +1,66 @@
+import threading
+
+WRITE_STATEMENTS = {'INSERT', 'UPDATE', 'DELETE', 'REPLACE'}
+
+_local = threading.local()
+_install_lock = threading.Lock()
+
+
+def is_write(sql):
+    words = sql.lstrip().split(None, 1)
+    return bool(words) and words[0].upper() in WRITE_STATEMENTS
+
+
+def _install(db):
+    """Wrap ``db.execute_sql`` once so that a ``deferred_atomic`` block of the
+    calling thread begins its transaction right before its first write."""
+    with _install_lock:
+        if getattr(db, '_deferred_atomic', False):
+            return
+        execute_sql = db.execute_sql
+
+        def deferred_execute_sql(sql, params=None, *args, **kwargs):
+            block = getattr(_local, 'block', None)
+            if block is not None and block.db is db and block.transaction is None and is_write(sql):
+                block.begin()
+            return execute_sql(sql, params, *args, **kwargs)
+
+        db.execute_sql = deferred_execute_sql
+        db._deferred_atomic = True
+
+
+class deferred_atomic:
+    """Like ``db.atomic()``, but the transaction only begins at the first write
+    statement the block executes.
+
+    Reads and LLM calls before that run outside any transaction, so a
+    simulator step that generates its turn and then writes it holds the
+    database's write locks only while writing, yet its rows still commit or
+    roll back together. A block without writes never opens a transaction.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.transaction = None
+        self._helper = None
+        self._outer = None
+
+    def begin(self):
+        self.transaction = self.db.atomic()
+        self._helper = self.transaction.__enter__()
+
+    def rollback(self):
+        """Discard the block's writes so far; a no-op when it has not written."""
+        if self._helper is not None:
+            self._helper.rollback()
+
+    def __enter__(self):
+        _install(self.db)
+        self._outer = getattr(_local, 'block', None)
+        _local.block = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _local.block = self._outer
+        if self.transaction is not None:
+            return self.transaction.__exit__(exc_type, exc_val, exc_tb)
@@ -0,0 +1,60 @@
+import hmac
+
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
+from services.export import EXPORT_BATCH_SIZE, EXPORT_FORMATS, export_rows, parse_date, PARQUET_AVAILABLE
+
+bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+
+@bp.before_request
+def require_admin_token():
+    # Admin routes are disabled unless an admin token is configured.
+    token = current_app.config.get("ADMIN_TOKEN")
+    if not token:
+        return jsonify({'error': 'Not found'}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+        return jsonify({'error': 'Forbidden'}), 403
+
+@bp.route('/export', methods=['GET'])
+def export():
+    """Stream interview records and their conversations as gzipped NDJSON or Parquet."""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format {export_format}'}), 400
+    if export_format == 'parquet' and not PARQUET_AVAILABLE:
+        return jsonify({'error': 'Parquet export is not available'}), 501
+    try:
+        filters = {
+            'policy': request.args.get('policy', type=int),
+            'level': request.args.get('level'),
+            'since': parse_date(request.args.get('since')),
+            'until': parse_date(request.args.get('until')),
+        }
+    except ValueError:
+        return jsonify({'error': 'since and until must be ISO dates'}), 400
+    batch_size = max(1, min(request.args.get('batch_size', EXPORT_BATCH_SIZE, type=int), 10000))
+
+    mimetype, extension, chunks = EXPORT_FORMATS[export_format]
+    pages = export_rows(batch_size=batch_size, **filters)
+    response = Response(stream_with_context(chunks(pages)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=interviews{extension}'
+    return response
+
+@bp.route('/analytics/cohorts', methods=['GET'])
+def cohort_analytics():
+    """KC coverage and mastery rates per policy and student level, across all interviews."""
+    analytics = current_app.config["cohort_analytics"]
+    report = analytics.report(policy=request.args.get('policy', type=int),
+                              level=request.args.get('level'))
+    return jsonify(report), 200
+
+@bp.route('/artifacts/warm', methods=['POST'])
+def warm_artifacts():
+    """Queue bank artifacts for precomputing the LLM calls of interview creation."""
+    warmer = current_app.config["artifact_warmer"]
+    if not warmer.enabled:
+        return jsonify({'error': 'The LLM response cache is disabled'}), 501
+    artifact_ids = (request.get_json(silent=True) or {}).get('artifact_ids')
+    if not isinstance(artifact_ids, list) or not all(isinstance(artifact_id, int) for artifact_id in artifact_ids):
+        return jsonify({'error': 'artifact_ids must be a list of integers'}), 400
+    warmer.submit(artifact_ids)
+    return jsonify(warmer.stats()), 202
@@ -3,15 +3,21 @@ import logging
 import json
 import traceback
 import random
-from peewee import fn, OperationalError, InterfaceError
-from adaptive_concept_selection.db.db_utils import init_test_db
-from adaptive_concept_selection.question_generation.question_generation_cg import SimulatedStudentExperiment, StudentArtifactData
-from adaptive_concept_selection.db.models import database_proxy as acs_db_proxy
+from peewee import OperationalError, InterfaceError
 
-from flask import Blueprint, jsonify, session, request, current_app, redirect, url_for
+from flask import Blueprint, Response, jsonify, session, request, current_app, redirect, url_for, stream_with_context
 from datetime import datetime
 from db.models import Student, StudentArtifact, StudentInterviewRecord, InterviewConversation, Artifact, database_proxy
 from db.config import CONFIG
+from db.transactions import deferred_atomic
+from db.kc_sets import refresh_conversation_kc_sets
+from services.turns import interviewer_turn, student_turn, turn_job_key
+from services.streaming import interviewer_events, student_events
+from services.metrics import llm_timer
+from services.llm_cache import llm_context_scope
+from services.artifact_warmup import normalize_code, submission_hash
+from services.session_cache import bump_interview_version, interview_version, record_etag
+from services.interview_summary import interview_summary
 
 bp = Blueprint('interview', __name__, url_prefix='/api')
 
@@ -20,9 +26,6 @@ bp = Blueprint('interview', __name__, url_prefix='/api')
 @bp.route('/interview/<string:student_type>/<int:interview_policy>', methods=['GET'])
 @bp.route('/interview/<string:student_type>/<int:interview_policy>/<int:artifact_id>', methods=['GET'])
 def interview(student_type, interview_policy=None, artifact_id=None):
-    rand_fn = fn.Rand
-    if current_app.config['TESTING']:
-        rand_fn = fn.Random
     types = ['beginner', 'intermediate', 'expert']
     # If student type is provided in a route, it should be one of the types.
     # If not provided, a student with a None type is created to be estimated later.
@@ -42,6 +45,7 @@ def interview(student_type, interview_policy=None, artifact_id=None):
         # Handle POST request with submitted code when no student type is provided
         artifact = None
         student_artifact_data = None
+        artifact_hash = None
         args = {}
         if request.method == 'POST':
             submitted_data = request.get_json()
@@ -49,17 +53,20 @@ def interview(student_type, interview_policy=None, artifact_id=None):
                 return jsonify({'error': 'Submitted code is required'}), 400
 
             submitted_problem = submitted_data.get('submitted_problem')
-            submitted_code = submitted_data['submitted_code']
+            # Normalized so a resubmitted solution produces the same, cached, prompts.
+            submitted_code = normalize_code(submitted_data['submitted_code'])
             submitted_code_level = submitted_data.get(
                 'submitted_code_level', None)
             if submitted_code_level not in types:
                 submitted_code_level = None
+            from adaptive_concept_selection.question_generation.question_generation_cg import StudentArtifactData
             student_artifact_data = StudentArtifactData(
                 problem_level=submitted_code_level,
                 problem_statement=submitted_problem,
                 problem_solution=submitted_code
             )
             args["provided_artifact"] = student_artifact_data
+            artifact_hash = submission_hash(submitted_problem, submitted_code, submitted_code_level)
 
             # Get interview_policy from POST request body if provided
             if 'interview_policy' in submitted_data:
@@ -72,6 +79,9 @@ def interview(student_type, interview_policy=None, artifact_id=None):
                 'error': 'Either student type is required or artifact data needs to be posted.'
             }), 400
 
+        if artifact_id is None and student_type:
+            # Pick the problem from the cached id set instead of ORDER BY RAND() over Artifact.
+            artifact_id = current_app.config["artifact_sampler"].sample(student_type)
         if artifact_id is not None:
             args["artifact_id"] = artifact_id
 
@@ -79,9 +89,10 @@ def interview(student_type, interview_policy=None, artifact_id=None):
         if interview_policy is None:
             interview_policy = random.choice(current_app.config["ALLOWED_POLICIES"])
         args["interview_policy"] = interview_policy
-        simulator = current_app.config["simulator"]
-        simulator.initialize_db_proxy(current_app.db)
-        interview_record, current_knowledge_state, knowledge_profile, G, student, artifact = simulator.create_and_initialize_interview(**args)
+        simulator = current_app.config["simulator_pool"].spawn()
+        with llm_timer(), llm_context_scope(artifact_id=artifact_id, artifact_hash=artifact_hash,
+                                            policy=interview_policy):
+            interview_record, current_knowledge_state, knowledge_profile, G, student, artifact = simulator.create_and_initialize_interview(**args)
         return redirect(url_for("interview.get_interview_record", interview_id=interview_record.interview_id))
         # return jsonify({
         #     'student_id': student.student_type_id,
@@ -98,14 +109,32 @@ def interview(student_type, interview_policy=None, artifact_id=None):
 
 @bp.route('/interview/record/<int:interview_id>', methods=['GET'])
 def get_interview_record(interview_id):
+    """Return the interview record. With ``?since_turn=N`` only conversation rows
+    after turn N are included. Answers 304 when the client's ETag is current."""
+    since_turn = request.args.get("since_turn", type=int)
     try:
-        simulator = current_app.config["simulator"]
-        simulator.initialize_db_proxy(current_app.db)
-        obs, _ = simulator.reset(interview_id)
-        interview_data = obs["interview_data"]
+        version = interview_version(interview_id)
+        if version is None:
+            return jsonify({'error': 'Interview not found'}), 404
+        etag = record_etag(interview_id, version, since_turn)
+        # Weak comparison: compressed responses carry the ETag as a weak one.
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        with current_app.config["simulator_pool"].checkout(interview_id, version) as session:
+            interview_data = session.obs["interview_data"]
 
         if not interview_data:
             return jsonify({'error': 'Interview not found'}), 404
+        if since_turn is not None:
+            interview_data = interview_data.model_copy(update={
+                "interview_conversation_history": [
+                    conv for conv in interview_data.interview_conversation_history
+                    if conv.conversation_turn_number is not None and conv.conversation_turn_number > since_turn
+                ]
+            })
     except (OperationalError, InterfaceError) as e:
         current_app.logger.error(f"Database connection error retrieving interview {interview_id}: {str(e)}")
         return jsonify({'error': 'Database connection error, please try again'}), 503
@@ -113,38 +142,38 @@ def get_interview_record(interview_id):
         current_app.logger.error(f"Error retrieving interview {interview_id}: {str(e)}")
         return jsonify({'error': 'Interview not found'}), 404
 
-    return jsonify(interview_data.model_dump()), 200
+    response = jsonify(interview_data)
+    response.set_etag(etag)
+    # Let browsers keep the record but revalidate it on every use.
+    response.headers['Cache-Control'] = 'no-cache'
+    return response, 200
 
 @bp.route('/conversation/interview/end/<int:interview_id>', methods=['GET'])
 def end_interview(interview_id):
     """End the current interview session."""
-    interview_record = None
+    # The write counter doubles as the existence check.
     try:
-        interview_record = StudentInterviewRecord.select().where(StudentInterviewRecord.interview_id==interview_id).get_or_none()
-        if not interview_record:
+        version = interview_version(interview_id)
+        if version is None:
             return jsonify({'error': 'Interview not found'}), 404
     except Exception as e:
         current_app.logger.error(f"Error retrieving interview: {str(e)}")
         return jsonify({'error': 'Interview not found'}), 404
 
-    # End the interview by updating the record
+    # Summarize the interview from its conversation rows; cached while its version is unchanged.
     try:
-        simulator = current_app.config["simulator"]
-        simulator.initialize_db_proxy(current_app.db)
-        obs, _ = simulator.reset(interview_id)
-        total_conversation_turns = len(obs["conversation_history_data"])
-        turn_start = obs["conversation_history_data"][0].conversation_timestamp if total_conversation_turns > 0 else None
-        turn_end = obs["conversation_history_data"
-        ][-1].conversation_timestamp if total_conversation_turns > 0 else None
-        interview_duration = str(turn_end - turn_start) if turn_start and turn_end else None
-        # Convert interview duration into a human-readable format
+        summaries = current_app.config["interview_summaries"]
+        summary = summaries.get(interview_id, version)
+        if summary is None:
+            summary = interview_summary(interview_id, current_app.config["kc_dictionary"])
+            summaries.put(interview_id, version, summary)
 
-        return jsonify({
+        response = {
             'status': 'Interview ended successfully',
-            'total_conversation_turns': total_conversation_turns,
-            'total_time_taken': interview_duration,
             'interview_id': interview_id
-        }), 200
+        }
+        response.update(summary)
+        return jsonify(response), 200
     except Exception as e:
         current_app.logger.error(f"Error ending interview: {str(e)}")
         return jsonify({'error': 'Failed to end interview'}), 500
@@ -152,11 +181,14 @@ def end_interview(interview_id):
 @bp.route('/conversation/interviewer/select_suggested_conversation/<int:interview_id>/<int:conv_index>', methods=['GET'])
 def mark_as_responded(interview_id, conv_index):
     try:
-        simulator = current_app.config["simulator"]
-        simulator.initialize_db_proxy(current_app.db)
-        obs, _ = simulator.reset(interview_id)
-        last_turn_number = simulator.get_last_turn_number(interview_id)
-        simulator.mark_selected_conversation_as_responded(interview_id, last_turn_number, conv_index)
+        simulator_pool = current_app.config["simulator_pool"]
+        with simulator_pool.checkout(interview_id) as session:
+            simulator = session.simulator
+            last_turn_number = simulator.get_last_turn_number(interview_id)
+            with deferred_atomic(database_proxy.obj):
+                simulator.mark_selected_conversation_as_responded(interview_id, last_turn_number, conv_index)
+                bump_interview_version(interview_id)
+            simulator_pool.invalidate(interview_id)
         return jsonify({'status': 'success'}), 200
     except Exception as e:
         current_app.logger.error(f"Error marking as responded: {str(e)}")
@@ -166,11 +198,17 @@ def mark_as_responded(interview_id, conv_index):
 def select_reference_concepts(interview_id, turn_number):
     try:
         concepts = request.args.getlist("concepts")
-        simulator = current_app.config["simulator"]
-        simulator.initialize_db_proxy(current_app.db)
-        obs, _ = simulator.reset(interview_id)
-        last_turn_number = simulator.get_last_turn_number(interview_id)
-        simulator.select_reference_concepts_for_conversation(interview_id, turn_number, concepts)
+        simulator_pool = current_app.config["simulator_pool"]
+        with simulator_pool.checkout(interview_id) as session:
+            simulator = session.simulator
+            with deferred_atomic(database_proxy.obj):
+                simulator.select_reference_concepts_for_conversation(interview_id, turn_number, concepts)
+                bump_interview_version(interview_id)
+            simulator_pool.invalidate(interview_id)
+        try:
+            refresh_conversation_kc_sets(current_app.config["kc_dictionary"], interview_id, turn_number)
+        except Exception as e:
+            current_app.logger.warning(f"Could not encode KC sets of interview {interview_id}: {e}")
         return jsonify({'status': 'success'}), 200
     except Exception as e:
         current_app.logger.error(f"Error selecting reference concepts: {str(e)}")
@@ -197,28 +235,24 @@ def conversation_interviewer(interview_id):
     # TODO: question = generate_question(interview_id, student_problem, conversation)
 
     # This will resume the experiment with the given interview_id
-    #simulator = current_app.config["simulator"]
-    creds_file = "azure_auth.json"
-    simulator = current_app.config["simulator"]
-    simulator.initialize_db_proxy(current_app.db)
-    obs, _ = simulator.reset(interview_id)
-    last_turn_number = simulator.get_last_turn_number(interview_id)
-    obs, _, done, _, _ = simulator.step(turn_id=0)
-
-    turn_number = simulator.get_last_turn_number(interview_id)
-    # simulator.mark_selected_conversation_as_responded(interview_id, turn_number, 0)
+    simulator_pool = current_app.config["simulator_pool"]
+    if request.args.get("async", type=int):
+        return enqueue_turn(interview_id, "interviewer", interviewer_turn, simulator_pool, interview_id)
+
+    # Serve suggestions prefetched after the student's last answer when available;
+    # one that is not done within the timeout is generated here instead.
+    prefetched = current_app.config["turn_jobs"].wait(turn_job_key(interview_id, "interviewer"),
+                                                      timeout=current_app.config["PREFETCH_WAIT_TIMEOUT"])
+    if prefetched is not None and prefetched.status == 'done':
+        response, done = prefetched.result, prefetched.done
+    else:
+        response, done = interviewer_turn(simulator_pool, interview_id)
 
     # If the interview is done, we need to redirect to the end of the interview.
     if done:
         return redirect(url_for("interview.end_interview", interview_id=interview_id))
 
-    conversations = obs["conversation_history_data"]
-    suggested_conversations = [conv.model_dump() for conv in conversations if conv.conversation_turn_number == turn_number]
-
-    return jsonify({
-        "suggested_conversations": suggested_conversations,
-        "status": "success"
-    }), 200
+    return jsonify(response), 200
 
 @bp.route('/conversation/student/<int:interview_id>', methods=['POST'])
 @bp.route('/conversation/student/<int:interview_id>', methods=['GET'])
@@ -236,22 +270,81 @@ def conversation_student(interview_id):
         student_answer = request.args.get("response")
     elif request.method == 'POST':
         student_answer = request.json.get("response")
-    simulator = current_app.config["simulator"]
-    simulator.initialize_db_proxy(current_app.db)
     # This will resume the experiment with the given interview_id
-    obs, _ = simulator.reset(interview_id)
-    obs, _, done, _, _ = simulator.step(action=student_answer, turn_id=1)
-    turn_number = simulator.get_last_turn_number(interview_id)
-    conversations = obs["conversation_history_data"]
-    conversations = [conv for conv in conversations if conv.conversation_turn_number == turn_number]
+    simulator_pool = current_app.config["simulator_pool"]
+    prefetch_jobs = current_app.config["turn_jobs"] if current_app.config["PREFETCH_QUESTIONS"] else None
+    if request.args.get("async", type=int):
+        return enqueue_turn(interview_id, "student", student_turn, simulator_pool, interview_id, student_answer,
+                            prefetch_jobs)
 
-    # conversations = obs["conversation_history_data"]
-
-    last_response = conversations[-1] if conversations else None
-
-    response = {"status": "success"}
-    response.update(last_response.model_dump())
+    response, done = student_turn(simulator_pool, interview_id, student_answer, prefetch_jobs)
 
     # Return the question
     return jsonify(response), 200
 
+@bp.route('/conversation/interviewer/<int:interview_id>/stream', methods=['GET'])
+def conversation_interviewer_stream(interview_id):
+    """Server-Sent Events variant of conversation_interviewer."""
+    try:
+        interview_record = StudentInterviewRecord.select().where(StudentInterviewRecord.interview_id==interview_id).get_or_none()
+        if not interview_record:
+            return jsonify({'error': 'Interview not found'}), 404
+    except Exception as e:
+        current_app.logger.error(f"Error retrieving interview: {str(e)}")
+        return jsonify({'error': 'Interview not found'}), 404
+
+    job = current_app.config["turn_jobs"].submit(
+        turn_job_key(interview_id, "interviewer"),
+        interviewer_turn, current_app.config["simulator_pool"], interview_id)
+    end_url = url_for("interview.end_interview", interview_id=interview_id)
+    return event_stream(interviewer_events(job, end_url, current_app.config["SSE_HEARTBEAT_INTERVAL"]))
+
+@bp.route('/conversation/student/<int:interview_id>/stream', methods=['GET', 'POST'])
+def conversation_student_stream(interview_id):
+    """Server-Sent Events variant of conversation_student."""
+    try:
+        interview_record = StudentInterviewRecord.select().where(StudentInterviewRecord.interview_id==interview_id).get_or_none()
+        if not interview_record:
+            return jsonify({'error': 'Interview not found'}), 404
+    except Exception as e:
+        current_app.logger.error(f"Error retrieving interview: {str(e)}")
+        return jsonify({'error': 'Interview not found'}), 404
+
+    student_answer = None
+    if "response" in request.args:
+        student_answer = request.args.get("response")
+    elif request.method == 'POST':
+        student_answer = request.json.get("response")
+    prefetch_jobs = current_app.config["turn_jobs"] if current_app.config["PREFETCH_QUESTIONS"] else None
+    job = current_app.config["turn_jobs"].submit(
+        turn_job_key(interview_id, "student"),
+        student_turn, current_app.config["simulator_pool"], interview_id, student_answer, prefetch_jobs)
+    return event_stream(student_events(job, current_app.config["SSE_HEARTBEAT_INTERVAL"]))
+
+def event_stream(events):
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream.
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def enqueue_turn(interview_id, role, turn_fn, *args):
+    """Queue a turn generation in the background and answer 202 with the job to poll."""
+    turn_jobs = current_app.config["turn_jobs"]
+    job = turn_jobs.submit(turn_job_key(interview_id, role), turn_fn, *args)
+    response = jsonify(job.to_dict())
+    response.headers["Location"] = url_for("interview.turn_job_status", job_id=job.job_id)
+    return response, 202
+
+@bp.route('/conversation/job/<string:job_id>', methods=['GET'])
+def turn_job_status(job_id):
+    """Report the status of a background turn, with its result once ready."""
+    job = current_app.config["turn_jobs"].get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    data = job.to_dict()
+    if job.status == 'done' and job.done and job.key[2] == 'interviewer':
+        data['redirect'] = url_for("interview.end_interview", interview_id=job.key[0])
+    if not job.finished:
+        return jsonify(data), 202
+    return jsonify(data), 200
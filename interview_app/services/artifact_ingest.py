@@ -0,0 +1,211 @@
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from peewee import JOIN, chunked, fn
+
+from db.db_utils import SEED_LEVELS, format_problem_html, refresh_db_proxy
+from db.models import Artifact, ArtifactHash, database_proxy
+from services.artifact_warmup import normalize_code, submission_hash
+
+INGEST_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+
+def read_problem_lines(path):
+    """Yield ``(line_number, line)`` for the non-blank lines of a (gzipped) JSONL file."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                yield line_number, line
+
+
+def validate_problem(item):
+    """Parse, check and format one JSONL problem; runs in the validation pool.
+
+    Returns ``(line_number, error, row, content_hash)`` with ``row`` an
+    ``(artifact_level, artifact_problem, artifact_value, artifact_valid)``
+    tuple, or ``error`` set when the line is not a usable problem.
+    """
+    line_number, line = item
+    try:
+        problem = json.loads(line)
+    except ValueError as e:
+        return line_number, f'invalid JSON: {e}', None, None
+    if not isinstance(problem, dict):
+        return line_number, 'not a JSON object', None, None
+    missing = [key for key in ('title', 'description', 'question', 'solution', 'level') if not problem.get(key)]
+    if missing:
+        return line_number, f'missing {", ".join(missing)}', None, None
+    if problem['level'] not in SEED_LEVELS:
+        return line_number, f'unknown level {problem["level"]}', None, None
+    solution = normalize_code(problem['solution'])
+    try:
+        compile(solution, '<solution>', 'exec')
+    except (SyntaxError, ValueError) as e:
+        return line_number, f'solution does not compile: {e}', None, None
+    problem_html = format_problem_html(problem)
+    return (line_number, None, (problem['level'], problem_html, solution, 1),
+            submission_hash(problem_html, solution, problem['level']))
+
+
+def backfill_artifact_hashes(batch_size=INGEST_BATCH_SIZE):
+    """Hash the Artifact rows that have no ``artifact_hash`` row yet, e.g. those
+    the simulator created for submitted code. Returns the number hashed."""
+    hashed = 0
+    last_id = 0
+    while True:
+        rows = list(Artifact.select(Artifact.artifact_id, Artifact.artifact_level,
+                                    Artifact.artifact_problem, Artifact.artifact_value)
+                    .join(ArtifactHash, JOIN.LEFT_OUTER, on=(Artifact.artifact_id == ArtifactHash.artifact_id))
+                    .where((Artifact.artifact_id > last_id) & ArtifactHash.artifact_id.is_null())
+                    .order_by(Artifact.artifact_id)
+                    .limit(batch_size)
+                    .tuples())
+        if not rows:
+            return hashed
+        with database_proxy.atomic():
+            ArtifactHash.insert_many(
+                [(artifact_id, submission_hash(problem, value, level)) for artifact_id, level, problem, value in rows],
+                fields=[ArtifactHash.artifact_id, ArtifactHash.content_hash]).execute()
+        hashed += len(rows)
+        last_id = rows[-1][0]
+
+
+def _insert_batch(rows):
+    """Insert ``(row, content_hash)`` pairs as artifacts and record their hashes;
+    returns the new artifact ids."""
+    with database_proxy.atomic():
+        last_id = Artifact.select(fn.MAX(Artifact.artifact_id)).scalar() or 0
+        for batch in chunked([row for row, _ in rows], 200):
+            Artifact.insert_many(batch, fields=[
+                Artifact.artifact_level, Artifact.artifact_problem, Artifact.artifact_value,
+                Artifact.artifact_valid]).execute()
+        # insert_many does not return the ids on MySQL; read them back by content.
+        ids = {}
+        for artifact_id, level, problem, value in (
+                Artifact.select(Artifact.artifact_id, Artifact.artifact_level,
+                                Artifact.artifact_problem, Artifact.artifact_value)
+                .where(Artifact.artifact_id > last_id).order_by(Artifact.artifact_id).tuples()):
+            ids.setdefault(submission_hash(problem, value, level), artifact_id)
+        hashes = [(ids[content_hash], content_hash) for _, content_hash in rows if content_hash in ids]
+        for batch in chunked(hashes, 500):
+            ArtifactHash.insert_many(batch, fields=[ArtifactHash.artifact_id, ArtifactHash.content_hash]).execute()
+    return [artifact_id for artifact_id, _ in hashes]
+
+
+class IngestReport:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.read = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+        self.artifact_ids = []
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.read / elapsed if elapsed else 0.0
+
+    def summary(self):
+        return (f'{self.read} problems read, {self.inserted} inserted, {self.duplicates} duplicates, '
+                f'{self.invalid} invalid in {time.perf_counter() - self.started:.1f}s ({self.rate:.0f} rows/s)')
+
+
+def _write_results(results, seen, report):
+    rows = []
+    for line_number, error, row, content_hash in results:
+        report.read += 1
+        if error is not None:
+            report.invalid += 1
+            if len(report.errors) < MAX_REPORTED_ERRORS:
+                report.errors.append((line_number, error))
+        elif content_hash in seen:
+            report.duplicates += 1
+        else:
+            seen.add(content_hash)
+            rows.append((row, content_hash))
+    hashes = [content_hash for _, content_hash in rows]
+    existing = set()
+    for batch in chunked(hashes, 500):
+        existing.update(row[0] for row in ArtifactHash.select(ArtifactHash.content_hash)
+                        .where(ArtifactHash.content_hash.in_(batch)).tuples())
+    new_rows = [(row, content_hash) for row, content_hash in rows if content_hash not in existing]
+    report.duplicates += len(rows) - len(new_rows)
+    if new_rows:
+        artifact_ids = _insert_batch(new_rows)
+        report.inserted += len(artifact_ids)
+        report.artifact_ids.extend(artifact_ids)
+
+
+def ingest_artifacts(lines, batch_size=INGEST_BATCH_SIZE, workers=None, progress=None):
+    """Validate ``(line_number, line)`` problems and insert the new ones into Artifact.
+
+    Problems are validated in a process pool (``workers`` processes; 0 validates
+    in this process), one batch ahead of the batched inserts. Problems whose
+    content hash is already in ``artifact_hash``, or earlier in the input, are
+    skipped. ``progress(report)`` is called after every batch.
+    """
+    database_proxy.obj.create_tables([ArtifactHash], safe=True)
+    backfill_artifact_hashes()
+    report = IngestReport()
+    seen = set()
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    executor = ProcessPoolExecutor(max_workers=workers) if workers else None
+    try:
+        pending = None
+        for batch in chunked(lines, batch_size):
+            if executor is None:
+                results = map(validate_problem, batch)
+            else:
+                chunksize = max(1, len(batch) // (4 * workers))
+                results = executor.map(validate_problem, batch, chunksize=chunksize)
+            if pending is not None:
+                _write_results(pending, seen, report)
+                if progress is not None:
+                    progress(report)
+            pending = results
+        if pending is not None:
+            _write_results(pending, seen, report)
+            if progress is not None:
+                progress(report)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return report
+
+
+@click.command('ingest-artifacts')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', type=int, default=INGEST_BATCH_SIZE)
+@click.option('--workers', type=int, default=None, help='Validation processes (default: CPU count; 0 for none).')
+@click.option('--warm', is_flag=True, help='Warm the LLM response cache for the inserted artifacts.')
+@with_appcontext
+def ingest_artifacts_command(path, batch_size, workers, warm):
+    """Load a JSONL problem bank (title, description, question, solution, level per line) into Artifact."""
+    refresh_db_proxy(current_app.db, database_proxy)
+    report = ingest_artifacts(read_problem_lines(path), batch_size=batch_size, workers=workers,
+                              progress=lambda report: click.echo(report.summary()))
+    for line_number, error in report.errors[:20]:
+        click.echo(f'line {line_number}: {error}', err=True)
+    if report.invalid > 20:
+        click.echo(f'... and {report.invalid - 20} more invalid lines', err=True)
+    current_app.config["artifact_sampler"].invalidate()
+    if warm and report.artifact_ids:
+        warmer = current_app.config["artifact_warmer"]
+        if not warmer.enabled:
+            raise click.ClickException('Set llm_cache = true in config.ini to warm the inserted artifacts.')
+        click.echo(f'Warmed {warmer.warm(report.artifact_ids)} artifact/policy pairs.')
+    click.echo(f'Done: {report.summary()}')
+
+
+def init_app(app):
+    app.cli.add_command(ingest_artifacts_command)
@@ -0,0 +1,167 @@
+import hashlib
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from db.db_utils import refresh_db_proxy
+from db.models import Artifact, database_proxy
+from db.transactions import deferred_atomic
+from services.llm_cache import llm_context_scope
+from services.llm_scheduler import llm_priority_scope, PRIORITY_SPECULATIVE
+
+
+def normalize_code(code):
+    """Submitted code with uniform line endings and no trailing whitespace, so
+    resubmissions that differ only in those produce the same prompts."""
+    lines = code.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip('\n')
+
+
+def submission_hash(problem_statement, code, level=None):
+    """Content hash of a submitted artifact; scopes its cached LLM responses the
+    way ``artifact_id`` does for bank problems."""
+    payload = '\x1e'.join([problem_statement or '', normalize_code(code or ''), level or ''])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def warm_artifact(simulator, artifact_id, level, policy):
+    """Run interview creation for a bank artifact and roll it back.
+
+    Nothing is written, but every LLM call creation makes (KC extraction,
+    reference material, the initial knowledge profile) lands in the LLM
+    response cache under the same context the create route uses, so the
+    next interview on this artifact and policy reads them from there.
+    Creation makes its LLM calls before it writes the interview, so in
+    ``deferred_atomic`` they run outside any transaction and no write lock is
+    held while the background warmer waits on the LLM.
+    """
+    with llm_priority_scope(PRIORITY_SPECULATIVE), llm_context_scope(artifact_id=artifact_id, policy=policy):
+        with deferred_atomic(database_proxy.obj) as block:
+            simulator.create_and_initialize_interview(
+                student_level=level, artifact_id=artifact_id, interview_policy=policy)
+            block.rollback()
+
+
+class ArtifactWarmer:
+    """Warms the LLM response cache for bank artifacts on a background thread.
+
+    ``submit`` queues artifact ids (e.g. right after they are ingested); each is
+    warmed once per policy in ``policies``. Requires the LLM response cache.
+    """
+
+    def __init__(self, app, policies, max_workers=1):
+        self.app = app
+        self.policies = list(policies)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='artifact-warmup')
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.warmed = 0
+        self.failed = 0
+        self.seconds = 0.0
+
+    @property
+    def enabled(self):
+        return self.app.config["llm_cache"] is not None
+
+    def warm(self, artifact_ids, policies=None):
+        """Warm ``artifact_ids`` in this thread; returns the number of (artifact, policy) pairs warmed."""
+        simulator = self.app.config["simulator_pool"].spawn()
+        levels = dict(Artifact.select(Artifact.artifact_id, Artifact.artifact_level)
+                      .where(Artifact.artifact_id.in_(list(artifact_ids))).tuples())
+        warmed = 0
+        for artifact_id in artifact_ids:
+            if artifact_id not in levels:
+                continue
+            for policy in policies or self.policies:
+                started = time.perf_counter()
+                try:
+                    warm_artifact(simulator, artifact_id, levels[artifact_id], policy)
+                except Exception:
+                    self.app.logger.warning(f"Could not warm artifact {artifact_id} for policy {policy}: "
+                                            f"{traceback.format_exc()}")
+                    with self._lock:
+                        self.failed += 1
+                    continue
+                with self._lock:
+                    self.warmed += 1
+                    self.seconds += time.perf_counter() - started
+                warmed += 1
+        return warmed
+
+    def submit(self, artifact_ids):
+        """Queue ``artifact_ids`` for warming; a no-op without the LLM response cache."""
+        artifact_ids = list(artifact_ids)
+        if not self.enabled or not artifact_ids:
+            return None
+        with self._lock:
+            self.pending += len(artifact_ids)
+        return self._executor.submit(self._run, artifact_ids)
+
+    def _run(self, artifact_ids):
+        with self.app.app_context():
+            try:
+                refresh_db_proxy(self.app.db, database_proxy)
+                return self.warm(artifact_ids)
+            finally:
+                with self._lock:
+                    self.pending -= len(artifact_ids)
+                if not self.app.db.is_closed():
+                    self.app.db.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'pending': self.pending,
+                'warmed': self.warmed,
+                'failed': self.failed,
+                'seconds': round(self.seconds, 3),
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+@click.command('warm-artifacts')
+@click.option('--level', default=None, help='Only artifacts of this level.')
+@click.option('--policy', 'policies', type=int, multiple=True, help='Policies to warm (default: allowed_policies).')
+@click.option('--after-id', type=int, default=0, help='Resume after this artifact id.')
+@click.option('--limit', type=int, default=None)
+@click.option('--batch-size', type=int, default=100)
+@with_appcontext
+def warm_artifacts_command(level, policies, after_id, limit, batch_size):
+    """Precompute the LLM calls of interview creation for bank artifacts."""
+    warmer = current_app.config["artifact_warmer"]
+    if not warmer.enabled:
+        raise click.ClickException('Set llm_cache = true in config.ini; warmed responses are stored in the LLM response cache.')
+    refresh_db_proxy(current_app.db, database_proxy)
+    cache = current_app.config["llm_cache"]
+    before = cache.stats()
+    started = time.perf_counter()
+    warmed = 0
+    remaining = limit
+    while remaining is None or remaining > 0:
+        query = Artifact.select(Artifact.artifact_id).where(Artifact.artifact_id > after_id)
+        if level is not None:
+            query = query.where(Artifact.artifact_level == level)
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        artifact_ids = [row[0] for row in query.order_by(Artifact.artifact_id).limit(size).tuples()]
+        if not artifact_ids:
+            break
+        warmed += warmer.warm(artifact_ids, policies or None)
+        after_id = artifact_ids[-1]
+        if remaining is not None:
+            remaining -= len(artifact_ids)
+        click.echo(f'Warmed up to artifact {after_id} ({warmed} artifact/policy pairs).')
+    after = cache.stats()
+    click.echo(f'Warmed {warmed} artifact/policy pairs in {time.perf_counter() - started:.1f}s: '
+               f'{after["stores"] - before["stores"]} responses stored, {after["hits"] - before["hits"]} already cached.')
+
+
+def init_app(app):
+    app.cli.add_command(warm_artifacts_command)
@@ -0,0 +1,218 @@
+import json
+import threading
+import time
+
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import with_appcontext
+from peewee import JOIN, chunked
+
+from db.models import InterviewConversation, StudentInterviewRecord, Student, database_proxy
+from db.db_utils import refresh_db_proxy
+
+
+class CohortAnalytics:
+    """Interview x KC knowledge-state matrix for cohort-level coverage and mastery.
+
+    Each cell holds the latest value an interview's ``changed_knowledge_state``
+    metadata assigned to a KC, NaN when the KC never came up. A KC is covered
+    when it has a value and mastered when that value is at least
+    ``mastery_threshold``. The matrix is extended incrementally: ``refresh``
+    only reads conversations after the last one it has seen, and runs at most
+    every ``refresh_interval`` seconds unless a turn was written in this
+    process since (see ``mark_dirty``).
+    """
+
+    def __init__(self, mastery_threshold=1.0, refresh_interval=30, batch_size=5000):
+        self.mastery_threshold = mastery_threshold
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self.watermark = 0
+        self.kc_names = []
+        self._kc_columns = {}
+        self._interview_rows = {}
+        self.interview_ids = np.zeros(0, dtype=np.int64)
+        self.policies = np.zeros(0, dtype=np.int64)
+        self.levels = []
+        self.state = np.full((0, 0), np.nan, dtype=np.float32)
+        self._refreshed_at = None
+        self._dirty = True
+        self._report = None
+        self.loads = 0
+
+    def mark_dirty(self, interview_id=None):
+        self._dirty = True
+
+    def _grow(self, interviews, kcs):
+        rows, columns = self.state.shape
+        if interviews <= rows and kcs <= columns:
+            return
+        # Grow geometrically so appending interviews stays amortized O(1).
+        new_rows = max(interviews, rows * 2 if interviews > rows else rows, 64)
+        new_columns = max(kcs, columns * 2 if kcs > columns else columns, 32)
+        state = np.full((new_rows, new_columns), np.nan, dtype=np.float32)
+        state[:rows, :columns] = self.state
+        self.state = state
+        if new_rows > len(self.interview_ids):
+            self.interview_ids = np.concatenate([self.interview_ids, np.zeros(new_rows - rows, dtype=np.int64)])
+            self.policies = np.concatenate([self.policies, np.full(new_rows - rows, -1, dtype=np.int64)])
+
+    def _row(self, interview_id):
+        row = self._interview_rows.get(interview_id)
+        if row is None:
+            row = self._interview_rows[interview_id] = len(self._interview_rows)
+            self.levels.append(None)
+        return row
+
+    def _column(self, kc):
+        column = self._kc_columns.get(kc)
+        if column is None:
+            column = self._kc_columns[kc] = len(self.kc_names)
+            self.kc_names.append(kc)
+        return column
+
+    def _load_interviews(self, interview_ids):
+        for batch in chunked(interview_ids, 500):
+            query = (StudentInterviewRecord.select(StudentInterviewRecord.interview_id,
+                                                   StudentInterviewRecord.interview_policy,
+                                                   Student.student_level)
+                     .join(Student, JOIN.LEFT_OUTER, on=(
+                         StudentInterviewRecord.interview_student_type_id == Student.student_type_id))
+                     .where(StudentInterviewRecord.interview_id.in_(batch)))
+            for interview_id, policy, level in query.tuples():
+                row = self._interview_rows[interview_id]
+                self.interview_ids[row] = interview_id
+                self.policies[row] = -1 if policy is None else policy
+                self.levels[row] = level
+
+    def _apply(self, rows):
+        cells_rows, cells_columns, values = [], [], []
+        new_interviews = []
+        for conversation_id, interview_id, metadata in rows:
+            try:
+                changed = json.loads(metadata).get("changed_knowledge_state")
+            except (ValueError, TypeError, AttributeError):
+                continue
+            if not isinstance(changed, dict) or not changed:
+                continue
+            if interview_id not in self._interview_rows:
+                new_interviews.append(interview_id)
+            row = self._row(interview_id)
+            for kc, value in changed.items():
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue
+                cells_rows.append(row)
+                cells_columns.append(self._column(kc))
+                values.append(value)
+        self._grow(len(self._interview_rows), len(self.kc_names))
+        if new_interviews:
+            self._load_interviews(new_interviews)
+        if values:
+            # Rows arrive in conversation order; keep the last value per cell.
+            cells = np.array(cells_rows, dtype=np.int64) * self.state.shape[1] + np.array(cells_columns)
+            _, last = np.unique(cells[::-1], return_index=True)
+            last = len(cells) - 1 - last
+            self.state.flat[cells[last]] = np.array(values, dtype=np.float32)[last]
+        return bool(values)
+
+    def refresh(self, force=False):
+        """Read the conversations written since the last refresh; returns True if the matrix changed."""
+        with self._lock:
+            now = time.monotonic()
+            if (not force and not self._dirty and self._refreshed_at is not None
+                    and now - self._refreshed_at < self.refresh_interval):
+                return False
+            self._dirty = False
+            self._refreshed_at = now
+            changed = False
+            while True:
+                rows = list(InterviewConversation.select(
+                    InterviewConversation.conversation_id,
+                    InterviewConversation.conversation_interview_id,
+                    InterviewConversation.conversation_metadata)
+                    .where((InterviewConversation.conversation_id > self.watermark) &
+                           InterviewConversation.conversation_metadata.contains('changed_knowledge_state'))
+                    .order_by(InterviewConversation.conversation_id)
+                    .limit(self.batch_size)
+                    .tuples())
+                if not rows:
+                    break
+                self.loads += 1
+                changed = self._apply(rows) or changed
+                self.watermark = rows[-1][0]
+                if len(rows) < self.batch_size:
+                    break
+            if changed:
+                self._report = None
+            return changed
+
+    def report(self, policy=None, level=None):
+        """Coverage and mastery rates per KC for every (policy, level) cohort."""
+        self.refresh()
+        with self._lock:
+            if self._report is None:
+                self._report = self._build_report()
+            report = self._report
+        cohorts = [cohort for cohort in report['cohorts']
+                   if (policy is None or cohort['policy'] == policy)
+                   and (level is None or cohort['level'] == level)]
+        return dict(report, cohorts=cohorts)
+
+    def _build_report(self):
+        interviews = len(self._interview_rows)
+        state = self.state[:interviews, :len(self.kc_names)]
+        covered = ~np.isnan(state)
+        with np.errstate(invalid='ignore'):
+            mastered = state >= self.mastery_threshold
+
+        # One matrix product per measure: cohorts x interviews @ interviews x KCs.
+        keys = [(int(policy), level) for policy, level in zip(self.policies[:interviews], self.levels)]
+        cohort_keys = sorted(set(keys), key=lambda key: (key[0], key[1] or ''))
+        cohort_index = {key: index for index, key in enumerate(cohort_keys)}
+        membership = np.zeros((len(cohort_keys), interviews), dtype=np.float32)
+        membership[[cohort_index[key] for key in keys], np.arange(interviews)] = 1
+        sizes = membership.sum(axis=1)
+        coverage = membership @ covered.astype(np.float32)
+        mastery = membership @ mastered.astype(np.float32)
+
+        cohorts = []
+        for index, (policy, level) in enumerate(cohort_keys):
+            kcs = {}
+            for column in np.flatnonzero(coverage[index]):
+                kcs[self.kc_names[column]] = {
+                    'coverage': float(coverage[index, column] / sizes[index]),
+                    'mastery': float(mastery[index, column] / sizes[index]),
+                }
+            cohorts.append({
+                'policy': None if policy < 0 else policy,
+                'level': level,
+                'interviews': int(sizes[index]),
+                'kcs': kcs,
+            })
+        return {
+            'interviews': interviews,
+            'kcs': len(self.kc_names),
+            'watermark': self.watermark,
+            'mastery_threshold': self.mastery_threshold,
+            'cohorts': cohorts,
+        }
+
+
+@click.command('cohort-analytics')
+@click.option('--policy', type=int, default=None)
+@click.option('--level', default=None)
+@click.option('--mastery-threshold', type=float, default=1.0)
+@with_appcontext
+def cohort_analytics_command(policy, level, mastery_threshold):
+    """Print per-policy, per-level KC coverage and mastery rates as JSON."""
+    refresh_db_proxy(current_app.db, database_proxy)
+    analytics = CohortAnalytics(mastery_threshold=mastery_threshold)
+    click.echo(json.dumps(analytics.report(policy=policy, level=level), indent=2))
+
+
+def init_app(app):
+    app.cli.add_command(cohort_analytics_command)
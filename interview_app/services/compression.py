@@ -0,0 +1,54 @@
+import gzip
+import time
+
+from flask import g, request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript'}
+
+
+def _encode(encoding, data, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level['br'])
+    return gzip.compress(data, compresslevel=level['gzip'])
+
+
+def init_app(app, min_size=1024, gzip_level=6, brotli_quality=5):
+    """Compress responses of at least ``min_size`` bytes with brotli or gzip,
+    whichever the client accepts (brotli first, when installed).
+
+    Streamed responses (SSE turns, exports) and responses that already carry
+    a Content-Encoding are left alone. Compressed responses get a weak ETag,
+    since their bytes differ from the uncompressed representation.
+    """
+    encodings = (['br'] if brotli is not None else []) + ['gzip']
+    level = {'gzip': gzip_level, 'br': brotli_quality}
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(encodings)
+        if encoding is None:
+            return response
+        started = time.perf_counter()
+        response.set_data(_encode(encoding, data, level))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        timings = g.get('timings')
+        if timings is not None:
+            timings['compress'] += time.perf_counter() - started
+        return response
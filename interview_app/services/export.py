@@ -0,0 +1,252 @@
+import importlib.util
+import json
+import zlib
+from datetime import date, datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from peewee import JOIN
+
+from db.models import InterviewConversation, StudentInterviewRecord, Student, database_proxy
+from db.db_utils import refresh_db_proxy
+
+# Parquet export is optional; pyarrow is imported on first use since it is slow to import.
+PARQUET_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+EXPORT_BATCH_SIZE = 1000
+
+# Column order of an exported row; the *_metadata and *_kcs columns hold decoded JSON.
+EXPORT_COLUMNS = (
+    'conversation_id', 'interview_id', 'interview_policy', 'interview_timestamp',
+    'interview_experiment_id', 'interview_problem_id', 'interview_student_type_id',
+    'student_level', 'interview_metadata', 'conversation_turn_number',
+    'conversation_turn_id', 'conversation_timestamp', 'conversation_responded',
+    'conversation_response', 'conversation_reference', 'conversation_metadata',
+    'conversation_kcs', 'conversation_reference_kcs',
+)
+JSON_COLUMNS = ('interview_metadata', 'conversation_metadata', 'conversation_kcs',
+                'conversation_reference_kcs')
+
+
+def parse_date(value):
+    """Parses an ISO date or datetime filter value; ``None`` and '' mean unbounded."""
+    if not value:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def _export_query(policy=None, level=None, since=None, until=None, without_conversations=False):
+    """Interview records joined with their conversations, or, with
+    ``without_conversations``, the records that have none (their conversation
+    columns are NULL)."""
+    columns = (
+        InterviewConversation.conversation_id,
+        StudentInterviewRecord.interview_id,
+        StudentInterviewRecord.interview_policy,
+        StudentInterviewRecord.interview_timestamp,
+        StudentInterviewRecord.interview_experiment_id,
+        StudentInterviewRecord.interview_problem_id,
+        StudentInterviewRecord.interview_student_type_id,
+        Student.student_level,
+        StudentInterviewRecord.interview_metadata,
+        InterviewConversation.conversation_turn_number,
+        InterviewConversation.conversation_turn_id,
+        InterviewConversation.conversation_timestamp,
+        InterviewConversation.conversation_responded,
+        InterviewConversation.conversation_response,
+        InterviewConversation.conversation_reference,
+        InterviewConversation.conversation_metadata,
+        InterviewConversation.conversation_k_cs,
+        InterviewConversation.conversation_reference_kcs)
+    on_interview = InterviewConversation.conversation_interview_id == StudentInterviewRecord.interview_id
+    if without_conversations:
+        query = (StudentInterviewRecord.select(*columns)
+                 .join(InterviewConversation, JOIN.LEFT_OUTER, on=on_interview)
+                 .where(InterviewConversation.conversation_id.is_null()))
+    else:
+        query = InterviewConversation.select(*columns).join(StudentInterviewRecord, on=on_interview)
+    query = query.join(Student, JOIN.LEFT_OUTER, on=(
+        StudentInterviewRecord.interview_student_type_id == Student.student_type_id))
+    if policy is not None:
+        query = query.where(StudentInterviewRecord.interview_policy == policy)
+    if level is not None:
+        query = query.where(Student.student_level == level)
+    if since is not None:
+        query = query.where(StudentInterviewRecord.interview_timestamp >= since)
+    if until is not None:
+        query = query.where(StudentInterviewRecord.interview_timestamp < until)
+    return query
+
+
+def decode_json_column(values):
+    """Decodes one column of a page. Repeated values (the interview metadata of
+    every row of an interview, common KC sets) are parsed once; values that are
+    not JSON are kept as strings."""
+    decoded = {}
+    result = []
+    for value in values:
+        if not value:
+            result.append(None)
+            continue
+        if value not in decoded:
+            try:
+                decoded[value] = json.loads(value)
+            except ValueError:
+                decoded[value] = value
+        result.append(decoded[value])
+    return result
+
+
+def _pages(query, key, batch_size):
+    # Keyset pagination on ``key``, the first or second exported column.
+    index = EXPORT_COLUMNS.index(key.name)
+    last_id = 0
+    while True:
+        page = list(query
+                    .where(key > last_id)
+                    .order_by(key)
+                    .limit(batch_size)
+                    .tuples())
+        if not page:
+            return
+        columns = dict(zip(EXPORT_COLUMNS, zip(*page)))
+        for name in JSON_COLUMNS:
+            columns[name] = decode_json_column(columns[name])
+        yield [dict(zip(EXPORT_COLUMNS, row)) for row in zip(*columns.values())]
+        if len(page) < batch_size:
+            return
+        last_id = page[-1][index]
+
+
+def export_rows(policy=None, level=None, since=None, until=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yields pages of flattened interview/conversation rows as lists of dicts.
+
+    Conversation rows come first, fetched with keyset pagination on
+    ``conversation_id``, so each page is an indexed range scan and at most one
+    page is held in memory. Interviews without any conversation follow, one
+    row each with the conversation columns empty, paged on ``interview_id``.
+    """
+    filters = (policy, level, parse_date(since), parse_date(until))
+    yield from _pages(_export_query(*filters), InterviewConversation.conversation_id, batch_size)
+    yield from _pages(_export_query(*filters, without_conversations=True),
+                      StudentInterviewRecord.interview_id, batch_size)
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def ndjson_chunks(pages):
+    """Gzip-compressed NDJSON, one compressed chunk per page."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for rows in pages:
+        lines = ''.join(json.dumps(row, default=_json_default) + '\n' for row in rows)
+        chunk = compressor.compress(lines.encode('utf-8'))
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+class _ChunkSink:
+    """Write-only file object collecting what the Parquet writer emits so it can
+    be streamed out between row groups."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet_schema(pyarrow):
+    return pyarrow.schema([
+        (name, pyarrow.timestamp('us') if name.endswith('_timestamp')
+         else pyarrow.int64() if name.endswith(('_id', '_policy', '_number', '_responded'))
+         else pyarrow.string())
+        for name in EXPORT_COLUMNS])
+
+
+def parquet_chunks(pages):
+    """Zstd-compressed Parquet with one row group per page. The decoded JSON
+    columns are written back as normalized JSON text, since their shape varies
+    between rows."""
+    if not PARQUET_AVAILABLE:
+        raise RuntimeError('Parquet export requires pyarrow.')
+    import pyarrow
+    import pyarrow.parquet
+    schema = _parquet_schema(pyarrow)
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode='w'), schema,
+                                           compression='zstd')
+    for rows in pages:
+        for row in rows:
+            for name in JSON_COLUMNS:
+                if row[name] is not None:
+                    row[name] = json.dumps(row[name], default=_json_default)
+        writer.write_table(pyarrow.Table.from_pylist(rows, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+# format -> (mimetype, file extension, chunk writer)
+EXPORT_FORMATS = {
+    'ndjson': ('application/gzip', '.ndjson.gz', ndjson_chunks),
+    'parquet': ('application/vnd.apache.parquet', '.parquet', parquet_chunks),
+}
+
+
+@click.command('export-interviews')
+@click.argument('output', type=click.Path(dir_okay=False))
+@click.option('--format', 'export_format', type=click.Choice(sorted(EXPORT_FORMATS)), default='ndjson')
+@click.option('--policy', type=int, default=None, help='Only interviews run with this policy.')
+@click.option('--level', default=None, help='Only interviews of students at this level.')
+@click.option('--since', default=None, help='Only interviews started at or after this ISO date.')
+@click.option('--until', default=None, help='Only interviews started before this ISO date.')
+@click.option('--batch-size', type=int, default=EXPORT_BATCH_SIZE)
+@with_appcontext
+def export_interviews_command(output, export_format, policy, level, since, until, batch_size):
+    """Export interview records and their conversations for analysis."""
+    if export_format == 'parquet' and not PARQUET_AVAILABLE:
+        raise click.ClickException('Parquet export requires pyarrow.')
+    refresh_db_proxy(current_app.db, database_proxy)
+    exported = 0
+
+    def counted(pages):
+        nonlocal exported
+        for rows in pages:
+            exported += len(rows)
+            yield rows
+
+    pages = export_rows(policy, level, since, until, batch_size=batch_size)
+    with open(output, 'wb') as fileobj:
+        for chunk in EXPORT_FORMATS[export_format][2](counted(pages)):
+            fileobj.write(chunk)
+    click.echo(f'Exported {exported} rows to {output}.')
+
+
+def init_app(app):
+    app.cli.add_command(export_interviews_command)
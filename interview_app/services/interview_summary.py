@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+
+from peewee import fn
+from db.models import InterviewConversation
+from db.kc_sets import interview_kc_coverage
+
+
+def interview_summary(interview_id, dictionary):
+    """Statistics of an interview from an aggregate query over its conversation rows.
+
+    Counts conversations and responded suggestions and takes the first and last
+    timestamps per turn. The KCs of the responded rows, per turn, and their
+    overlap with the reference KCs come from the rows' bitsets (see
+    ``db.kc_sets.interview_kc_coverage``).
+    """
+    rows = (InterviewConversation.select(
+        InterviewConversation.conversation_turn_number,
+        fn.COUNT(InterviewConversation.conversation_id),
+        fn.MIN(InterviewConversation.conversation_timestamp),
+        fn.MAX(InterviewConversation.conversation_timestamp),
+        fn.SUM(InterviewConversation.conversation_responded))
+        .where(InterviewConversation.conversation_interview_id == interview_id)
+        .group_by(InterviewConversation.conversation_turn_number)
+        .order_by(InterviewConversation.conversation_turn_number)
+        .tuples())
+    coverage = interview_kc_coverage(dictionary, interview_id)
+
+    turns = []
+    turn_start = turn_end = None
+    for turn_number, conversations, first, last, responded in rows:
+        if first is not None and (turn_start is None or first < turn_start):
+            turn_start = first
+        if last is not None and (turn_end is None or last > turn_end):
+            turn_end = last
+        turns.append({
+            'turn_number': turn_number,
+            'conversations': conversations,
+            'responded': int(responded or 0),
+            'kcs': coverage['turns'].get(turn_number, []),
+        })
+
+    return {
+        'total_conversation_turns': sum(turn['conversations'] for turn in turns),
+        'total_time_taken': str(turn_end - turn_start) if turn_start and turn_end else None,
+        'responded_suggestions': sum(turn['responded'] for turn in turns),
+        'kc_coverage': len(coverage['covered_kcs']),
+        'covered_kcs': coverage['covered_kcs'],
+        'reference_kcs': coverage['reference_kcs'],
+        'reference_kc_overlap': coverage['reference_kc_overlap'],
+        'turns': turns,
+    }
+
+
+class InterviewSummaryCache:
+    """Interview summaries keyed on the interview version they were computed at.
+
+    A summary is only served while the interview still has that version (see
+    ``services.session_cache.interview_version``), so a turn or update written
+    by another worker is never hidden; turns stepped by this worker drop the
+    entry right away.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._summaries = OrderedDict()
+
+    def get(self, interview_id, version):
+        with self._lock:
+            entry = self._summaries.get(interview_id)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                del self._summaries[interview_id]
+                return None
+            self._summaries.move_to_end(interview_id)
+            return entry[1]
+
+    def put(self, interview_id, version, summary):
+        with self._lock:
+            self._summaries[interview_id] = (version, summary)
+            self._summaries.move_to_end(interview_id)
+            while len(self._summaries) > self.max_size:
+                self._summaries.popitem(last=False)
+
+    def discard(self, interview_id):
+        with self._lock:
+            self._summaries.pop(interview_id, None)
+
+    def __contains__(self, interview_id):
+        with self._lock:
+            return interview_id in self._summaries
@@ -0,0 +1,149 @@
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from db.db_utils import refresh_db_proxy
+from db.models import database_proxy
+
+
+class TurnJob:
+    """A turn generation running in the background."""
+
+    def __init__(self, key):
+        self.job_id = uuid.uuid4().hex
+        self.key = key
+        self.status = 'queued'
+        self.result = None
+        self.done = False
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self):
+        data = {
+            'job_id': self.job_id,
+            'status': self.status,
+            'interview_id': self.key[0],
+            'turn_number': self.key[1],
+            'role': self.key[2],
+        }
+        if self.status == 'done':
+            data['result'] = self.result
+            data['interview_done'] = self.done
+        elif self.status == 'failed':
+            data['error'] = self.error
+        return data
+
+
+class TurnJobQueue:
+    """Runs turn generations on a local thread pool.
+
+    Jobs are idempotent on ``(interview_id, turn_number, role)``: submitting the
+    same key again returns the existing job instead of starting a second LLM
+    call. Failed jobs are replaced on re-submission so they can be retried.
+    """
+
+    def __init__(self, app, max_workers=4, max_jobs=1024):
+        self.app = app
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='turn-job')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._by_key = {}
+        self.submitted = 0
+        self.deduplicated = 0
+        self.failed = 0
+
+    def submit(self, key, fn, *args):
+        """Queue ``fn(*args)`` for ``key`` unless an equivalent job exists; return the job."""
+        with self._lock:
+            job = self._by_key.get(key)
+            if job is not None and job.status != 'failed':
+                self.deduplicated += 1
+                return job
+            job = TurnJob(key)
+            self._jobs[job.job_id] = job
+            self._by_key[key] = job
+            self.submitted += 1
+            self._prune()
+        job.future = self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def find(self, key):
+        with self._lock:
+            return self._by_key.get(key)
+
+    def wait(self, key, timeout=None):
+        """Wait for the job queued under ``key``, if any, and return it once finished;
+        None if there is none or it did not finish within ``timeout`` seconds."""
+        job = self.find(key)
+        if job is None:
+            return None
+        try:
+            job.future.result(timeout=timeout)
+        except TimeoutError:
+            return None
+        return job
+
+    def discard(self, interview_id):
+        """Stop serving the interview's jobs by key, e.g. questions prefetched before
+        its rows were updated; the jobs can still be polled by id."""
+        with self._lock:
+            for key in [key for key in self._by_key if key[0] == interview_id]:
+                del self._by_key[key]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        # Drop the oldest finished jobs once the table is full.
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished]:
+            job = self._jobs.pop(job_id)
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+            if len(self._jobs) <= self.max_jobs:
+                break
+
+    def _run(self, job, fn, args):
+        job.status = 'running'
+        with self.app.app_context():
+            try:
+                refresh_db_proxy(self.app.db, database_proxy)
+                job.result, job.done = fn(*args)
+                job.status = 'done'
+            except Exception as e:
+                self.app.logger.error(f"Turn job {job.job_id} for {job.key} failed: {traceback.format_exc()}")
+                job.error = str(e)
+                job.status = 'failed'
+                with self._lock:
+                    self.failed += 1
+            finally:
+                job.finished_at = time.time()
+                if not self.app.db.is_closed():
+                    self.app.db.close()
+        return job
+
+    def stats(self):
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if not job.finished)
+            return {
+                'jobs': len(self._jobs),
+                'pending': pending,
+                'submitted': self.submitted,
+                'deduplicated': self.deduplicated,
+                'failed': self.failed,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,52 @@
+try:
+    import orjson
+except ImportError:  # optional; the app falls back to TimedJSONProvider
+    orjson = None
+
+from services.metrics import TimedJSONProvider, serialize_timer
+
+ORJSON_AVAILABLE = orjson is not None
+
+
+class ORJSONProvider(TimedJSONProvider):
+    """JSON provider backed by orjson, producing the same documents as Flask's.
+
+    Keys are sorted and dates use Flask's HTTP date format, as with the default
+    provider; non-ASCII text is written as UTF-8 rather than escaped, and
+    non-string keys are sorted as strings.
+    Pretty-printed output (debug mode, or ``dumps`` with extra arguments) goes
+    through the default provider.
+    """
+
+    options = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+               | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS) if ORJSON_AVAILABLE else 0
+
+    def _encode(self, obj):
+        return orjson.dumps(obj, default=self.default, option=self.options)
+
+    def _compact(self):
+        return self.compact or (self.compact is None and not self._app.debug)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs and kwargs != {'separators': (',', ':')}:
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if not self._compact():
+            return super().response(*args, **kwargs)
+        with serialize_timer():
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(self._encode(obj) + b'\n', mimetype=self.mimetype)
+
+
+def init_app(app, enabled=True):
+    """Serve JSON with orjson when it is installed and ``enabled``."""
+    if enabled and ORJSON_AVAILABLE:
+        app.json_provider_class = ORJSONProvider
+        app.json = ORJSONProvider(app)
@@ -0,0 +1,48 @@
+import threading
+
+
+class LazySimulator:
+    """Stands in for the simulator prototype until an interview first needs it.
+
+    Importing ``adaptive_concept_selection`` (pgmpy, pandas, the LLM client) and
+    building ``SimulatedStudentExperiment`` is the slowest part of a worker boot,
+    so ``create_app`` stores this proxy instead and ``factory`` runs on the first
+    attribute access, or on ``load()`` from a preload hook. Attribute reads and
+    writes are forwarded to the built simulator.
+    """
+
+    def __init__(self, factory):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_instance', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    @property
+    def loaded(self):
+        return self._instance is not None
+
+    def load(self):
+        """Build the simulator if needed and return it."""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                instance = self._instance
+                if instance is None:
+                    instance = self._factory()
+                    object.__setattr__(self, '_instance', instance)
+        return instance
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.load(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self.load(), name)
+
+
+def resolve_simulator(simulator):
+    """The simulator behind ``simulator``, building it if it is still lazy."""
+    if isinstance(simulator, LazySimulator):
+        return simulator.load()
+    return simulator
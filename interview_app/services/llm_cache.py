@@ -0,0 +1,249 @@
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Request-level inputs of LLM calls that are not part of their arguments
+# (artifact id, policy); part of the cache key.
+llm_context = contextvars.ContextVar('llm_context', default=None)
+
+
+@contextmanager
+def llm_context_scope(**context):
+    token = llm_context.set({key: value for key, value in context.items() if value is not None})
+    try:
+        yield
+    finally:
+        llm_context.reset(token)
+
+
+class LLMProxy:
+    """Forwards attribute access to the simulator's LLM client, routing calls to
+    its public methods through ``_call`` so subclasses can intercept them."""
+
+    def __init__(self, llm):
+        object.__setattr__(self, 'llm', llm)
+
+    def __getattr__(self, name):
+        attr = getattr(self.llm, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            return self._call(name, attr, args, kwargs)
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self.llm, name, value)
+
+    def _call(self, name, method, args, kwargs):
+        return method(*args, **kwargs)
+
+
+def _normalize(value):
+    if hasattr(value, 'model_dump'):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    # Unknown objects key on their repr; one with an id in it simply never hits.
+    return repr(value)
+
+
+def response_key(name, args, kwargs, context=None):
+    """Hash of an LLM call: method, arguments (dicts, such as knowledge states, with
+    sorted keys) and the request context."""
+    payload = json.dumps([name, args, kwargs, context or {}], sort_keys=True, default=_normalize)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def encode_response(value):
+    """JSON-compatible form of an LLM response that ``decode_response`` turns back
+    into the same value.
+
+    Tuples, dicts and pydantic models are tagged so they come back as such;
+    a model is rebuilt through its own class. Raises TypeError for anything else.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, list):
+        return [encode_response(item) for item in value]
+    if isinstance(value, tuple):
+        return {'tuple': [encode_response(item) for item in value]}
+    if isinstance(value, dict):
+        if not all(isinstance(key, str) for key in value):
+            raise TypeError('LLM responses with non-string dict keys are not cached')
+        return {'dict': {key: encode_response(item) for key, item in value.items()}}
+    model = type(value)
+    if hasattr(value, 'model_dump') and hasattr(model, 'model_validate'):
+        return {'model': f'{model.__module__}:{model.__qualname__}', 'value': value.model_dump(mode='json')}
+    raise TypeError(f'LLM responses of type {model.__name__} are not cached')
+
+
+def decode_response(data):
+    if isinstance(data, list):
+        return [decode_response(item) for item in data]
+    if not isinstance(data, dict):
+        return data
+    if 'tuple' in data:
+        return tuple(decode_response(item) for item in data['tuple'])
+    if 'dict' in data:
+        return {key: decode_response(item) for key, item in data['dict'].items()}
+    # Only classes of modules that are already loaded; the cache file never
+    # makes the process import anything.
+    module_name, _, qualname = data['model'].partition(':')
+    model = sys.modules[module_name]
+    for name in qualname.split('.'):
+        model = getattr(model, name)
+    if not isinstance(model, type) or not hasattr(model, 'model_validate'):
+        raise TypeError(f'{data["model"]} is not a response model')
+    return model.model_validate(data['value'])
+
+
+class ResponseCache:
+    """Persistent LLM response cache in a SQLite file shared by all workers.
+
+    Entries expire ``ttl`` seconds after they were stored. Once more than
+    ``max_entries`` are stored, the least recently used are deleted. Responses
+    are stored as JSON (see ``encode_response``). Each thread of each process
+    opens its own connection on first use, so a worker forked from the
+    gunicorn master never uses a connection the master opened.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=100000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS llm_response ('
+                         'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                         'created_at REAL NOT NULL, accessed_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS llm_response_accessed_at ON llm_response (accessed_at)')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        # A connection inherited through fork() is dropped, never used or closed.
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        """Close this thread's connection, e.g. in the gunicorn master before it forks."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key):
+        """Return ``(True, value)`` for a live entry, ``(False, None)`` otherwise."""
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute('SELECT value, created_at FROM llm_response WHERE key = ?', (key,)).fetchone()
+        if row is None or (self.ttl and now - row[1] > self.ttl):
+            self._count('misses')
+            return False, None
+        try:
+            value = decode_response(json.loads(row[0]))
+        except Exception:
+            self._count('misses')
+            return False, None
+        conn.execute('UPDATE llm_response SET accessed_at = ? WHERE key = ?', (now, key))
+        self._count('hits')
+        return True, value
+
+    def put(self, key, value):
+        try:
+            blob = json.dumps(encode_response(value))
+        except (TypeError, ValueError):
+            return False
+        now = time.time()
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO llm_response (key, value, created_at, accessed_at) '
+                     'VALUES (?, ?, ?, ?)', (key, blob, now, now))
+        self._count('stores')
+        # Enforce the size cap every few hundred stores rather than on every one.
+        if self.stores % 256 == 0:
+            self.prune()
+        return True
+
+    def prune(self):
+        """Delete expired entries and the least recently used ones above ``max_entries``."""
+        conn = self._connection()
+        deleted = 0
+        if self.ttl:
+            deleted += conn.execute('DELETE FROM llm_response WHERE created_at < ?',
+                                    (time.time() - self.ttl,)).rowcount
+        excess = conn.execute('SELECT COUNT(*) FROM llm_response').fetchone()[0] - self.max_entries
+        if excess > 0:
+            deleted += conn.execute('DELETE FROM llm_response WHERE key IN ('
+                                    'SELECT key FROM llm_response ORDER BY accessed_at LIMIT ?)',
+                                    (excess,)).rowcount
+        with self._lock:
+            self.evictions += deleted
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class CachingLLM(LLMProxy):
+    """Serves repeated LLM calls from a ``ResponseCache``.
+
+    The key covers the method, its arguments (the prompt, with any knowledge
+    state in it) and the current ``llm_context`` (artifact id, policy).
+    ``methods`` limits caching to the named methods; by default every public
+    method is cached.
+    """
+
+    def __init__(self, llm, cache, methods=None):
+        super(CachingLLM, self).__init__(llm)
+        object.__setattr__(self, 'cache', cache)
+        object.__setattr__(self, 'methods', set(methods) if methods else None)
+
+    def _call(self, name, method, args, kwargs):
+        if self.methods is not None and name not in self.methods:
+            return super(CachingLLM, self)._call(name, method, args, kwargs)
+        key = response_key(name, args, kwargs, llm_context.get())
+        found, value = self.cache.get(key)
+        if found:
+            return value
+        value = super(CachingLLM, self)._call(name, method, args, kwargs)
+        self.cache.put(key, value)
+        return value
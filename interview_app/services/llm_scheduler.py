@@ -0,0 +1,151 @@
+import contextvars
+import heapq
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from services import metrics
+from services.llm_cache import LLMProxy, response_key
+
+# Lower runs first.
+PRIORITY_HIGH = 0        # processing a student's answer, which a user is waiting on
+PRIORITY_NORMAL = 1      # interviewer turns and interview creation
+PRIORITY_SPECULATIVE = 2  # prefetching the next question
+
+llm_priority = contextvars.ContextVar('llm_priority', default=PRIORITY_NORMAL)
+
+llm_queue_wait = metrics.registry.histogram(
+    'skillsense_llm_queue_wait_seconds', 'Time LLM calls waited for a slot in the scheduler.')
+
+
+@contextmanager
+def llm_priority_scope(priority):
+    token = llm_priority.set(priority)
+    try:
+        yield
+    finally:
+        llm_priority.reset(token)
+
+
+def estimate_tokens(args, kwargs):
+    """Rough prompt size: about four characters per token."""
+    return max(1, len(json.dumps([args, kwargs], default=repr)) // 4)
+
+
+class LLMScheduler:
+    """Process-wide admission control for the simulator's LLM calls.
+
+    At most ``max_in_flight`` calls run at once, and calls are admitted while
+    the token bucket (``tokens_per_minute``, refilled continuously; 0 disables
+    it) has room for their estimated prompt plus ``completion_tokens``.
+    Waiting calls are admitted by priority, then arrival. A call identical to
+    one already running waits for that call's result instead of running again.
+    """
+
+    def __init__(self, max_in_flight=8, tokens_per_minute=0, completion_tokens=500):
+        self.max_in_flight = max_in_flight
+        self.tokens_per_minute = tokens_per_minute
+        self.completion_tokens = completion_tokens
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._in_flight = {}
+        self.running = 0
+        self.tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self.calls = 0
+        self.coalesced = 0
+        self.tokens_used = 0
+
+    def _refill(self, now):
+        if self.tokens_per_minute:
+            elapsed = now - self._refilled_at
+            self.tokens = min(float(self.tokens_per_minute), self.tokens + elapsed * self.tokens_per_minute / 60.0)
+        self._refilled_at = now
+
+    def _acquire(self, priority, cost):
+        entry = (priority, next(self._sequence))
+        started = time.monotonic()
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = None
+                if self._waiting[0] == entry and self.running < self.max_in_flight:
+                    if not self.tokens_per_minute or self.tokens >= cost:
+                        break
+                    # Sleep until the bucket holds enough tokens.
+                    wait = (cost - self.tokens) * 60.0 / self.tokens_per_minute
+                self._condition.wait(wait)
+            heapq.heappop(self._waiting)
+            self.running += 1
+            if self.tokens_per_minute:
+                self.tokens -= cost
+            self.tokens_used += cost
+            # The next waiter may be admissible too.
+            self._condition.notify_all()
+        llm_queue_wait.observe(time.monotonic() - started, priority=priority)
+
+    def _release(self):
+        with self._condition:
+            self.running -= 1
+            self._condition.notify_all()
+
+    def call(self, name, method, args, kwargs):
+        key = response_key(name, args, kwargs)
+        with self._condition:
+            self.calls += 1
+            leader = self._in_flight.get(key)
+            if leader is None:
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if leader is not None:
+            return leader.result()
+
+        cost = estimate_tokens(args, kwargs) + self.completion_tokens
+        if self.tokens_per_minute:
+            cost = min(cost, self.tokens_per_minute)
+        try:
+            self._acquire(llm_priority.get(), cost)
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                self._release()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._condition:
+                self._in_flight.pop(key, None)
+
+    def stats(self):
+        with self._condition:
+            self._refill(time.monotonic())
+            return {
+                'running': self.running,
+                'queued': len(self._waiting),
+                'max_in_flight': self.max_in_flight,
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'tokens_used': self.tokens_used,
+                'tokens_available': self.tokens if self.tokens_per_minute else None,
+            }
+
+
+class ScheduledLLM(LLMProxy):
+    """Routes the LLM client's method calls through an ``LLMScheduler``."""
+
+    def __init__(self, llm, scheduler):
+        super(ScheduledLLM, self).__init__(llm)
+        object.__setattr__(self, 'scheduler', scheduler)
+
+    def _call(self, name, method, args, kwargs):
+        return self.scheduler.call(name, method, args, kwargs)
@@ -0,0 +1,215 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context, has_request_context, request, Response
+from flask.json.provider import DefaultJSONProvider
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{_format_labels(key + (("le", bound),))} {cumulative}')
+                lines.append(f'{self.name}_bucket{_format_labels(key + (("le", "+Inf"),))} {count}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide metrics rendered in the Prometheus text exposition format.
+
+    Besides histograms, /metrics evaluates collectors registered on the app:
+    callables returning ``(name, type, documentation, value)`` tuples, where
+    ``value`` is a number or a dict mapping label tuples to numbers.
+    """
+
+    def __init__(self):
+        self.histograms = []
+
+    def histogram(self, name, documentation, buckets=DURATION_BUCKETS):
+        histogram = Histogram(name, documentation, buckets)
+        self.histograms.append(histogram)
+        return histogram
+
+    def render(self, collectors=()):
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.render())
+        for collector in collectors:
+            for name, metric_type, documentation, value in collector():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                series = value if isinstance(value, dict) else {(): value}
+                for labels, series_value in series.items():
+                    lines.append(f'{name}{_format_labels(labels)} {float(series_value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+request_duration = registry.histogram(
+    'skillsense_request_duration_seconds', 'Time spent handling a request.')
+db_query_duration = registry.histogram(
+    'skillsense_db_query_duration_seconds', 'Time spent in a single SQL statement.')
+db_queries_per_request = registry.histogram(
+    'skillsense_db_queries_per_request', 'SQL statements issued while handling a request.', COUNT_BUCKETS)
+db_time_per_request = registry.histogram(
+    'skillsense_db_time_per_request_seconds', 'Time spent in SQL statements per request.')
+llm_time_per_request = registry.histogram(
+    'skillsense_llm_time_per_request_seconds', 'Time spent in simulator LLM calls per request.')
+
+
+def current_endpoint():
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return 'background'
+
+
+def _timings():
+    """Per-request (or per background job) accumulators, kept on ``g``."""
+    if not has_app_context():
+        return None
+    if 'timings' not in g:
+        g.timings = {'db_queries': 0, 'db': 0.0, 'llm': 0.0, 'serialize': 0.0, 'compress': 0.0}
+    return g.timings
+
+
+def instrument_database(db):
+    """Count and time every statement ``db`` executes. Safe to call repeatedly."""
+    if getattr(db, '_metrics_instrumented', False):
+        return db
+    execute_sql = db.execute_sql
+
+    def timed_execute_sql(sql, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return execute_sql(sql, params, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            db_query_duration.observe(elapsed, endpoint=current_endpoint())
+            timings = _timings()
+            if timings is not None:
+                timings['db_queries'] += 1
+                timings['db'] += elapsed
+
+    db.execute_sql = timed_execute_sql
+    db._metrics_instrumented = True
+    return db
+
+
+@contextmanager
+def llm_timer():
+    """Attribute the time spent in a simulator call, minus its SQL time, to the LLM."""
+    timings = _timings()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    db_before = timings['db']
+    try:
+        yield
+    finally:
+        timings['llm'] += time.perf_counter() - started - (timings['db'] - db_before)
+
+
+@contextmanager
+def serialize_timer():
+    """Attribute the time spent building a response body to serialization."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _timings()
+        if timings is not None:
+            timings['serialize'] += time.perf_counter() - started
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Default JSON provider that records serialization time for Server-Timing.
+    Pydantic models are serialized through their ``model_dump``."""
+
+    @staticmethod
+    def default(o):
+        if hasattr(o, 'model_dump'):
+            return o.model_dump()
+        return DefaultJSONProvider.default(o)
+
+    def response(self, *args, **kwargs):
+        with serialize_timer():
+            return super().response(*args, **kwargs)
+
+
+def register_collector(app, collector):
+    app.extensions.setdefault('metrics_collectors', []).append(collector)
+
+
+def init_app(app):
+    app.json_provider_class = TimedJSONProvider
+    app.json = TimedJSONProvider(app)
+    app.extensions.setdefault('metrics_collectors', [])
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        _timings()
+
+    @app.after_request
+    def record_request_metrics(response):
+        timings = _timings()
+        started = g.pop('request_started', None)
+        if started is None or timings is None:
+            return response
+        total = time.perf_counter() - started
+        endpoint = current_endpoint()
+        request_duration.observe(total, endpoint=endpoint, method=request.method,
+                                 status=response.status_code)
+        db_queries_per_request.observe(timings['db_queries'], endpoint=endpoint)
+        db_time_per_request.observe(timings['db'], endpoint=endpoint)
+        llm_time_per_request.observe(timings['llm'], endpoint=endpoint)
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;desc="{timings["db_queries"]} queries";dur={timings["db"] * 1000:.2f}',
+            f'llm;dur={timings["llm"] * 1000:.2f}',
+            f'serialize;dur={timings["serialize"] * 1000:.2f}',
+            f'compress;dur={timings["compress"] * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(app.extensions['metrics_collectors']),
+                        mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,61 @@
+import random
+import threading
+import time
+
+from db.models import Artifact
+
+
+class ArtifactSampler:
+    """Picks a random valid artifact for a level without ORDER BY RAND().
+
+    The ids of valid artifacts are loaded once per level with an indexed query
+    on (artifact_level, artifact_valid) and cached in memory; a pick is then a
+    constant-time choice from the cached list. The cache is refreshed after
+    ``ttl`` seconds, and code inserting artifacts calls ``invalidate`` (or
+    ``add``) so new problems are picked up immediately.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._loaded_at = {}
+        self.loads = 0
+
+    def _load(self, level):
+        ids = [row[0] for row in Artifact.select(Artifact.artifact_id).where(
+            (Artifact.artifact_level == level) & (Artifact.artifact_valid == 1)).tuples()]
+        with self._lock:
+            self._ids[level] = ids
+            self._loaded_at[level] = time.monotonic()
+            self.loads += 1
+        return ids
+
+    def ids(self, level):
+        with self._lock:
+            ids = self._ids.get(level)
+            loaded_at = self._loaded_at.get(level, 0)
+        if ids is None or (self.ttl and time.monotonic() - loaded_at > self.ttl):
+            ids = self._load(level)
+        return ids
+
+    def sample(self, level):
+        """Return a random valid artifact id for ``level``, or None if there is none."""
+        ids = self.ids(level)
+        if not ids:
+            return None
+        return random.choice(ids)
+
+    def add(self, level, artifact_id):
+        with self._lock:
+            if level in self._ids:
+                self._ids[level] = self._ids[level] + [artifact_id]
+
+    def invalidate(self, level=None):
+        with self._lock:
+            if level is None:
+                self._ids.clear()
+                self._loaded_at.clear()
+            else:
+                self._ids.pop(level, None)
+                self._loaded_at.pop(level, None)
@@ -0,0 +1,167 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from peewee import fn
+
+from db.models import StudentInterviewRecord, database_proxy
+from db.transactions import deferred_atomic
+from services.metrics import llm_timer
+from services.llm_cache import llm_context_scope
+from services.single_flight import TurnClaimed
+
+
+def interview_version(interview_id):
+    """The interview's write counter, read with one primary-key lookup; None
+    for an unknown interview."""
+    return (StudentInterviewRecord
+            .select(fn.COALESCE(StudentInterviewRecord.interview_version, 0))
+            .where(StudentInterviewRecord.interview_id == interview_id)
+            .scalar())
+
+
+def bump_interview_version(interview_id):
+    """Increment the interview's write counter and return the new value.
+
+    Call it inside the transaction of the conversation writes it stands for,
+    so that the writes and the new version commit together and another worker
+    never sees one without the other.
+    """
+    (StudentInterviewRecord
+     .update(interview_version=fn.COALESCE(StudentInterviewRecord.interview_version, 0) + 1)
+     .where(StudentInterviewRecord.interview_id == interview_id)
+     .execute())
+    return interview_version(interview_id)
+
+
+def record_etag(interview_id, version, since_turn=None):
+    """Strong ETag of an interview record, derived from its write counter.
+
+    Every write to the conversation rows the record returns bumps the counter;
+    the interview, artifact and student fields are not changed after creation.
+    """
+    value = f"{interview_id}:{since_turn}:{version}"
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+
+class InterviewSession:
+    """A live interview: its own simulator instance positioned on the interview by
+    ``reset``, plus the latest observation."""
+
+    def __init__(self, interview_id, simulator, obs, info, version, on_step=None, llm_context=None):
+        self.interview_id = interview_id
+        self.simulator = simulator
+        self.obs = obs
+        self.info = info
+        self.version = version
+        self.on_step = on_step
+        self.llm_context = llm_context or {}
+        self.updated_at = time.monotonic()
+
+    def step(self, flights=None, key=None, **kwargs):
+        """Run ``simulator.step`` and update the session in place with the new turn.
+
+        The simulator generates the turn (its LLM calls) outside any
+        transaction; the rows it then writes commit together with the
+        interview's bumped version in one short transaction (see
+        ``deferred_atomic``), before the caller can respond, and a failed step
+        leaves no partial turn behind. With ``flights`` and the step's ``key``,
+        the step is first claimed in its own short transaction; if another
+        worker already took it, the session is reset onto the committed turn
+        instead of stepping again.
+        """
+        try:
+            claim = flights.claim(key) if flights is not None else None
+        except TurnClaimed as claimed:
+            obs, self.info = self.simulator.reset(self.interview_id)
+            result = (obs, 0, claimed.done, False, self.info)
+            self.version = interview_version(self.interview_id)
+        else:
+            try:
+                with deferred_atomic(database_proxy.obj), llm_timer(), llm_context_scope(**self.llm_context):
+                    result = self.simulator.step(**kwargs)
+                    self.version = bump_interview_version(self.interview_id)
+                    if flights is not None:
+                        flights.finish(claim, result[2])
+            except BaseException:
+                if flights is not None:
+                    flights.release(claim)
+                raise
+        self.obs = result[0]
+        self.updated_at = time.monotonic()
+        if self.on_step is not None:
+            self.on_step(self.interview_id)
+        return result
+
+
+class InterviewSessionCache:
+    """Bounded LRU cache of interview sessions with a time-to-live per entry."""
+
+    def __init__(self, max_size=256, ttl=900):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, interview_id, version=None):
+        """Return the cached session, or None if missing, expired or older than ``version``."""
+        with self._lock:
+            session = self._sessions.get(interview_id)
+            if session is None:
+                self.misses += 1
+                return None
+            if self.ttl and time.monotonic() - session.updated_at > self.ttl:
+                del self._sessions[interview_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if version is not None and session.version != version:
+                del self._sessions[interview_id]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(interview_id)
+            self.hits += 1
+            return session
+
+    def put(self, session):
+        with self._lock:
+            self._sessions[session.interview_id] = session
+            self._sessions.move_to_end(session.interview_id)
+            while len(self._sessions) > self.max_size:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, interview_id):
+        with self._lock:
+            if self._sessions.pop(interview_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._sessions),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
@@ -0,0 +1,131 @@
+import copy
+import threading
+from contextlib import contextmanager
+
+from db.models import StudentInterviewRecord
+from services.session_cache import InterviewSession, interview_version
+from services.lazy_simulator import resolve_simulator
+from services.single_flight import TurnSingleFlight
+
+
+class SimulatorPool:
+    """Hands out per-interview simulator instances built from a shared prototype.
+
+    Each instance is a deep copy of the prototype that shares only the pieces
+    in ``SHARED_ATTRIBUTES`` (LLM client, logger, database) and callables set
+    on the prototype (e.g. patched methods); its KC list, concept graph and
+    every other container are its own, so the state that ``reset`` and
+    ``step`` change never leaks between interviews. Requests for
+    the same interview are serialized with a per-interview lock; requests for
+    different interviews run concurrently. ``flights`` makes each turn's step
+    run once however many requests ask for it.
+    """
+
+    # Kept by reference in every instance: the LLM client with its cache and
+    # scheduler wrappers (connections, locks), the logger and the database.
+    SHARED_ATTRIBUTES = ('llm', 'logger', 'db')
+
+    def __init__(self, app, prototype, session_cache, turn_jobs=None):
+        self.app = app
+        self.prototype = prototype
+        self.session_cache = session_cache
+        self.turn_jobs = turn_jobs
+        self._guard = threading.Lock()
+        self._locks = {}
+        self.turn_listeners = []
+        self.flights = TurnSingleFlight()
+        self.checkouts = 0
+        self.lock_waits = 0
+
+    def add_turn_listener(self, listener):
+        """Call ``listener(interview_id)`` whenever an interview's conversation rows change."""
+        self.turn_listeners.append(listener)
+
+    def _turn_written(self, interview_id):
+        for listener in self.turn_listeners:
+            listener(interview_id)
+
+    def spawn(self):
+        """Create a fresh simulator instance sharing only the prototype's ``SHARED_ATTRIBUTES``
+        and callables."""
+        prototype = resolve_simulator(self.prototype)
+        shared = [getattr(prototype, name, None) for name in self.SHARED_ATTRIBUTES]
+        shared += [value for value in vars(prototype).values() if callable(value)]
+        simulator = copy.deepcopy(prototype, {id(value): value for value in shared if value is not None})
+        simulator.initialize_db_proxy(self.app.db)
+        return simulator
+
+    def _acquire(self, interview_id):
+        with self._guard:
+            entry = self._locks.get(interview_id)
+            if entry is None:
+                entry = self._locks[interview_id] = [threading.Lock(), 0]
+            entry[1] += 1
+            self.checkouts += 1
+        if not entry[0].acquire(blocking=False):
+            with self._guard:
+                self.lock_waits += 1
+            entry[0].acquire()
+        return entry
+
+    def _release(self, interview_id, entry):
+        entry[0].release()
+        with self._guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[interview_id]
+
+    def _llm_context(self, interview_id):
+        """Artifact and policy of the interview, which scope its cached LLM responses."""
+        record = (StudentInterviewRecord
+                  .select(StudentInterviewRecord.interview_problem_id, StudentInterviewRecord.interview_policy)
+                  .where(StudentInterviewRecord.interview_id == interview_id)
+                  .tuples().first())
+        if record is None:
+            return {}
+        return {'artifact_id': record[0], 'policy': record[1]}
+
+    @contextmanager
+    def checkout(self, interview_id, version=None):
+        """Lock ``interview_id`` and yield its session, resetting a new simulator
+        instance on a cache miss. ``version`` may be passed when the caller has
+        just read it."""
+        entry = self._acquire(interview_id)
+        try:
+            self.prototype.initialize_db_proxy(self.app.db)
+            if version is None:
+                version = interview_version(interview_id)
+            session = self.session_cache.get(interview_id, version)
+            if session is None:
+                simulator = self.spawn()
+                obs, info = simulator.reset(interview_id)
+                session = InterviewSession(interview_id, simulator, obs, info, version,
+                                           on_step=self._turn_written,
+                                           llm_context=self._llm_context(interview_id))
+                self.session_cache.put(session)
+            try:
+                yield session
+            except BaseException:
+                # The simulator may have advanced in memory past what was committed.
+                self.session_cache.discard(interview_id)
+                raise
+        finally:
+            self._release(interview_id, entry)
+
+    def invalidate(self, interview_id):
+        """Drop the cached session, stored step results and finished turn jobs (e.g.
+        prefetched questions) after the interview's rows were updated outside ``step``."""
+        self.session_cache.discard(interview_id)
+        self.flights.discard(interview_id)
+        if self.turn_jobs is not None:
+            self.turn_jobs.discard(interview_id)
+        self._turn_written(interview_id)
+
+    def stats(self):
+        with self._guard:
+            return {
+                'active_interviews': len(self._locks),
+                'checkouts': self.checkouts,
+                'lock_waits': self.lock_waits,
+                **self.flights.stats(),
+            }
@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+from peewee import IntegrityError
+
+from db.models import TurnClaim, database_proxy
+
+
+class TurnClaimed(Exception):
+    """The step was already taken, by another worker, for the same turn."""
+
+    def __init__(self, key, done):
+        super(TurnClaimed, self).__init__(f"Turn {key} was already taken")
+        self.key = key
+        self.done = done
+
+
+class TurnSingleFlight:
+    """Runs each interview step at most once per ``(interview_id, turn_number, turn_id)``.
+
+    ``turn_number`` is the last turn of the other role (see ``turns.turn_key``),
+    so a double-submitted answer, the same turn requested through GET and POST,
+    or a turn requested after it was prefetched, maps to one key. Callers that
+    arrive while the step runs wait for it and share its result; callers that
+    arrive shortly after get the stored result. Across workers the
+    ``turn_claim`` table's unique key does the same: the claim is committed
+    before the step's LLM calls, and a second worker waits for the claim to be
+    finished and then replays the committed turn (see ``claim``).
+    """
+
+    def __init__(self, max_results=256, claim_timeout=300, claim_poll_interval=0.05):
+        self.max_results = max_results
+        self.claim_timeout = claim_timeout
+        self.claim_poll_interval = claim_poll_interval
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._results = OrderedDict()
+        self.available = None
+        self.steps = 0
+        self.joined = 0
+        self.replayed = 0
+        self.claim_conflicts = 0
+
+    def run(self, key, fn, *args):
+        """Return ``fn(*args)`` for the step ``key``, running it only if no caller
+        has already run it or is running it."""
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.replayed += 1
+                return self._results[key]
+            leader = self._flights.get(key)
+            if leader is None:
+                future = self._flights[key] = Future()
+                self.steps += 1
+            else:
+                self.joined += 1
+        if leader is not None:
+            return leader.result()
+        try:
+            result = fn(*args)
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            with self._lock:
+                self._results[key] = result
+                while len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+            return result
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def claim(self, key):
+        """Commit the claim for ``key`` in its own short transaction; call it
+        before the step, outside any transaction.
+
+        If another worker holds the claim, wait until that worker finishes the
+        step and raise ``TurnClaimed``. A claim released by a failed step, or
+        left unfinished for ``claim_timeout`` seconds by a worker that died, is
+        taken over.
+        """
+        if self.available is None:
+            self.available = TurnClaim.table_exists()
+        if not self.available:
+            return None
+        interview_id, turn_number, turn_id = key
+        where = ((TurnClaim.claim_interview_id == interview_id) &
+                 (TurnClaim.claim_turn_number == turn_number) &
+                 (TurnClaim.claim_turn_id == turn_id))
+        conflict = False
+        while True:
+            try:
+                with database_proxy.atomic():
+                    return TurnClaim.create(claim_interview_id=interview_id, claim_turn_number=turn_number,
+                                            claim_turn_id=turn_id, claim_timestamp=datetime.now())
+            except IntegrityError:
+                pass
+            if not conflict:
+                conflict = True
+                with self._lock:
+                    self.claim_conflicts += 1
+            while True:
+                row = TurnClaim.select(TurnClaim.claim_done, TurnClaim.claim_timestamp).where(where).tuples().first()
+                if row is None:
+                    break
+                done, claimed_at = row
+                if done is not None:
+                    raise TurnClaimed(key, bool(done))
+                if claimed_at is None or claimed_at < datetime.now() - timedelta(seconds=self.claim_timeout):
+                    TurnClaim.delete().where(where & TurnClaim.claim_done.is_null()).execute()
+                    break
+                time.sleep(self.claim_poll_interval)
+
+    def finish(self, claim, done):
+        """Mark the claim's step finished; call it with the step's writes."""
+        if claim is not None:
+            TurnClaim.update(claim_done=int(bool(done))).where(TurnClaim.id == claim.id).execute()
+
+    def release(self, claim):
+        """Drop the claim of a failed step so that the turn can be retried."""
+        if claim is not None:
+            TurnClaim.delete().where(TurnClaim.id == claim.id).execute()
+
+    def discard(self, interview_id):
+        """Forget stored results of an interview whose rows changed outside a step."""
+        with self._lock:
+            for key in [key for key in self._results if key[0] == interview_id]:
+                del self._results[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._flights),
+                'steps': self.steps,
+                'joined': self.joined,
+                'replayed': self.replayed,
+                'claim_conflicts': self.claim_conflicts,
+            }
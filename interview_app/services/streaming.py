@@ -0,0 +1,56 @@
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from flask import current_app
+
+STUDENT_FIELDS = ("processed_answer", "reference_answer", "metadata")
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {current_app.json.dumps(data)}\n\n"
+
+
+def wait_for_turn(job, heartbeat_interval=15):
+    """Yield keep-alive comments until the turn job has finished.
+
+    ``simulator.step`` returns a whole turn at once and offers no hook for
+    partial output, so there is nothing to stream before the job finishes;
+    the content events are split from its result afterwards.
+    """
+    yield sse_event("accepted", {"job_id": job.job_id, "turn_number": job.key[1]})
+    while True:
+        try:
+            job.future.result(timeout=heartbeat_interval)
+            return
+        except FutureTimeoutError:
+            yield ": keep-alive\n\n"
+
+
+def interviewer_events(job, end_url, heartbeat_interval=15):
+    """Stream an interviewer turn: one event per suggested conversation, then ``done``."""
+    yield from wait_for_turn(job, heartbeat_interval)
+    if job.status == 'failed':
+        yield sse_event("error", {"job_id": job.job_id, "error": job.error})
+        return
+    if job.done:
+        yield sse_event("done", {"status": "success", "interview_done": True, "redirect": end_url})
+        return
+    suggested_conversations = job.result["suggested_conversations"]
+    for conversation in suggested_conversations:
+        yield sse_event("suggestion", conversation)
+    yield sse_event("done", {"status": "success", "interview_done": False,
+                             "suggestion_count": len(suggested_conversations)})
+
+
+def student_events(job, heartbeat_interval=15):
+    """Stream a student turn: the processed answer, reference answer and metadata as
+    separate events, then the remaining conversation fields with ``done``."""
+    yield from wait_for_turn(job, heartbeat_interval)
+    if job.status == 'failed':
+        yield sse_event("error", {"job_id": job.job_id, "error": job.error})
+        return
+    response = dict(job.result)
+    for field in STUDENT_FIELDS:
+        yield sse_event(field, {field: response.pop(field, None)})
+    response["interview_done"] = job.done
+    yield sse_event("done", response)
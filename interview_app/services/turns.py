@@ -0,0 +1,97 @@
+from peewee import fn
+from db.models import InterviewConversation
+from services.llm_scheduler import llm_priority_scope, PRIORITY_HIGH, PRIORITY_SPECULATIVE
+
+TURN_IDS = {"interviewer": 0, "student": 1}
+
+
+def last_turn_number(interview_id, turn_id=None):
+    """Latest conversation turn number written for the interview, or None before the first turn.
+    With ``turn_id``, only turns of that role (0 interviewer, 1 student) count."""
+    query = (InterviewConversation
+             .select(fn.MAX(InterviewConversation.conversation_turn_number))
+             .where(InterviewConversation.conversation_interview_id == interview_id))
+    if turn_id is not None:
+        query = query.where(InterviewConversation.conversation_turn_id == turn_id)
+    return query.scalar()
+
+
+def turn_key(interview_id, turn_id):
+    """Identity of role ``turn_id``'s next step: the interview, the last turn of
+    the other role (-1 before any) and the role.
+
+    It stays the same once the step has written its turn, so a request that
+    arrives after a prefetched or double-submitted step has committed maps to
+    that step and replays it instead of stepping again.
+    """
+    turn_number = last_turn_number(interview_id, 1 - turn_id)
+    return (interview_id, -1 if turn_number is None else turn_number, turn_id)
+
+
+def turn_job_key(interview_id, role):
+    """Key of the background job generating ``role``'s next turn: the step's
+    ``turn_key`` with the role name, so the job answering a student turn (e.g.
+    the prefetch) is found under the key the interviewer route computes."""
+    return turn_key(interview_id, TURN_IDS[role])[:2] + (role,)
+
+
+def interviewer_turn(simulator_pool, interview_id):
+    """Generate (or re-serve) the interviewer's suggested conversations for the next turn.
+
+    Returns the response payload and whether the interview is done. Concurrent
+    requests for the same turn share one step.
+    """
+    key = turn_key(interview_id, 0)
+    return simulator_pool.flights.run(key, _interviewer_turn, simulator_pool, key)
+
+
+def _interviewer_turn(simulator_pool, key):
+    interview_id = key[0]
+    with simulator_pool.checkout(interview_id) as session:
+        obs, _, done, _, _ = session.step(simulator_pool.flights, key, turn_id=0)
+        turn_number = session.simulator.get_last_turn_number(interview_id)
+    if done:
+        return None, True
+
+    conversations = obs["conversation_history_data"]
+    suggested_conversations = [conv.model_dump() for conv in conversations if conv.conversation_turn_number == turn_number]
+    return {
+        "suggested_conversations": suggested_conversations,
+        "status": "success"
+    }, False
+
+
+def prefetch_interviewer_turn(simulator_pool, interview_id):
+    """``interviewer_turn`` for questions generated ahead of the request; its LLM
+    calls yield to those of turns a user is waiting on."""
+    with llm_priority_scope(PRIORITY_SPECULATIVE):
+        return interviewer_turn(simulator_pool, interview_id)
+
+
+def student_turn(simulator_pool, interview_id, student_answer, prefetch_jobs=None):
+    """Process the student's answer (or simulate one when ``student_answer`` is None).
+
+    When ``prefetch_jobs`` is given, the next interviewer turn starts generating
+    in the background as soon as the answer is committed. Concurrent or repeated
+    submissions of the same turn share one step.
+    """
+    key = turn_key(interview_id, 1)
+    return simulator_pool.flights.run(key, _student_turn, simulator_pool, key, student_answer, prefetch_jobs)
+
+
+def _student_turn(simulator_pool, key, student_answer, prefetch_jobs):
+    interview_id = key[0]
+    with llm_priority_scope(PRIORITY_HIGH), simulator_pool.checkout(interview_id) as session:
+        obs, _, done, _, _ = session.step(simulator_pool.flights, key, action=student_answer, turn_id=1)
+        turn_number = session.simulator.get_last_turn_number(interview_id)
+    if prefetch_jobs is not None and not done:
+        prefetch_jobs.submit(turn_job_key(interview_id, "interviewer"),
+                             prefetch_interviewer_turn, simulator_pool, interview_id)
+    conversations = obs["conversation_history_data"]
+    conversations = [conv for conv in conversations if conv.conversation_turn_number == turn_number]
+
+    last_response = conversations[-1] if conversations else None
+
+    response = {"status": "success"}
+    response.update(last_response.model_dump())
+    return response, done
@@ -1,9 +1,8 @@
-import pdb
+import gc
 import os
 import logging
 from logging.config import dictConfig
 import json
-from adaptive_concept_selection.question_generation.question_generation_cg import SimulatedStudentExperiment
 from db.config import CONFIG
 from db.db_utils import tables
 from db.db_utils import init_real_db, init_test_db, init_memory_db, refresh_db_proxy
@@ -15,7 +14,19 @@ from datetime import datetime
 from db.models import Student, StudentInterviewRecord, database_proxy
 from db.db_utils import get_db
 from defaultsettings import config
-from routes import interview, messages
+from routes import interview, messages, admin
+from services.session_cache import InterviewSessionCache
+from services.simulator_pool import SimulatorPool
+from services.lazy_simulator import LazySimulator
+from services.llm_cache import ResponseCache, CachingLLM
+from services.llm_scheduler import LLMScheduler, ScheduledLLM
+from db.kc_sets import KCDictionary, refresh_conversation_kc_sets
+from services.jobs import TurnJobQueue
+from services.sampler import ArtifactSampler
+from services.interview_summary import InterviewSummaryCache
+from services.artifact_warmup import ArtifactWarmer
+from services import metrics, export, cohort_analytics, artifact_warmup, artifact_ingest
+from services import json_provider, compression
 
 # dictConfig({
 #     'version': 1,
@@ -33,6 +44,81 @@ from routes import interview, messages
 #     }
 # })
 
+def collect_component_metrics(app):
+    """Expose the cache, pool and job counters on /metrics."""
+    session_cache = app.config["session_cache"].stats()
+    simulator_pool = app.config["simulator_pool"].stats()
+    turn_jobs = app.config["turn_jobs"].stats()
+    collected = [
+        ('skillsense_session_cache_hits_total', 'counter', 'Interview session cache hits.', session_cache['hits']),
+        ('skillsense_session_cache_misses_total', 'counter', 'Interview session cache misses.', session_cache['misses']),
+        ('skillsense_session_cache_evictions_total', 'counter', 'Interview sessions evicted from the cache.',
+         session_cache['evictions']),
+        ('skillsense_session_cache_size', 'gauge', 'Interview sessions in the cache.', session_cache['size']),
+        ('skillsense_simulator_lock_waits_total', 'counter', 'Checkouts that waited for an interview lock.',
+         simulator_pool['lock_waits']),
+        ('skillsense_turn_steps_joined_total', 'counter', 'Turn requests that joined a step already running.',
+         simulator_pool['joined']),
+        ('skillsense_turn_steps_replayed_total', 'counter', 'Turn requests answered with the result of a finished step.',
+         simulator_pool['replayed']),
+        ('skillsense_turn_claim_conflicts_total', 'counter', 'Steps another worker had already taken.',
+         simulator_pool['claim_conflicts']),
+        ('skillsense_turn_jobs_pending', 'gauge', 'Background turn jobs queued or running.', turn_jobs['pending']),
+        ('skillsense_turn_jobs_deduplicated_total', 'counter', 'Turn requests joined to an existing job.',
+         turn_jobs['deduplicated']),
+    ]
+    llm_scheduler = app.config["llm_scheduler"].stats()
+    collected.extend([
+        ('skillsense_llm_in_flight', 'gauge', 'LLM calls running.', llm_scheduler['running']),
+        ('skillsense_llm_queue_depth', 'gauge', 'LLM calls waiting for a scheduler slot.', llm_scheduler['queued']),
+        ('skillsense_llm_calls_total', 'counter', 'LLM calls made through the scheduler.', llm_scheduler['calls']),
+        ('skillsense_llm_coalesced_total', 'counter', 'LLM calls that joined an identical call in flight.',
+         llm_scheduler['coalesced']),
+        ('skillsense_llm_tokens_total', 'counter', 'Estimated LLM tokens admitted by the scheduler.',
+         llm_scheduler['tokens_used']),
+    ])
+    if app.config["llm_cache"] is not None:
+        llm_cache = app.config["llm_cache"].stats()
+        collected.extend([
+            ('skillsense_llm_cache_hits_total', 'counter', 'LLM calls served from the response cache.',
+             llm_cache['hits']),
+            ('skillsense_llm_cache_misses_total', 'counter', 'LLM calls not found in the response cache.',
+             llm_cache['misses']),
+            ('skillsense_llm_cache_evictions_total', 'counter', 'LLM responses expired or evicted.',
+             llm_cache['evictions']),
+        ])
+    if hasattr(database_proxy.obj, 'pool_stats'):
+        pool_stats = database_proxy.obj.pool_stats()
+        collected.extend([
+            ('skillsense_db_pool_in_use', 'gauge', 'Pooled connections checked out.', pool_stats['in_use']),
+            ('skillsense_db_pool_idle', 'gauge', 'Pooled connections idle.', pool_stats['idle']),
+            ('skillsense_db_pool_waits_total', 'counter', 'Connects that waited for a free connection.',
+             pool_stats['waits']),
+            ('skillsense_db_pool_reconnects_total', 'counter', 'Reconnects after lost connections.',
+             pool_stats['reconnects']),
+        ])
+    return collected
+
+def preload(app):
+    """Build the simulator in the gunicorn master so --preload workers inherit it
+    copy-on-write.
+
+    Connections opened while building it, including the LLM response cache's
+    SQLite connection, are closed so the forked workers do not share them.
+    Everything allocated so far is then moved out of the garbage collector's
+    reach, so collections in the workers do not write to (and un-share) those
+    pages.
+    """
+    app.config["simulator"].load()
+    if hasattr(app.db, 'close_all'):
+        app.db.close_all()
+    elif not app.db.is_closed():
+        app.db.close()
+    if app.config["llm_cache"] is not None:
+        app.config["llm_cache"].close()
+    gc.collect()
+    gc.freeze()
+
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__, instance_relative_config=True)
@@ -71,6 +157,18 @@ def create_app(test_config=None):
 
     from db import db_utils
     db_utils.init_app(app)
+    metrics.init_app(app)
+    json_provider.init_app(app, enabled=CONFIG.getboolean("app", "orjson", fallback=True))
+    if CONFIG.getboolean("app", "compress_responses", fallback=True):
+        # Registered after metrics, so it runs first and its time shows in Server-Timing.
+        compression.init_app(app,
+                             min_size=CONFIG.getint("app", "compress_min_size", fallback=1024),
+                             gzip_level=CONFIG.getint("app", "compress_gzip_level", fallback=6),
+                             brotli_quality=CONFIG.getint("app", "compress_brotli_quality", fallback=5))
+    export.init_app(app)
+    cohort_analytics.init_app(app)
+    artifact_warmup.init_app(app)
+    artifact_ingest.init_app(app)
 
     # ensure the instance folder exists
     try:
@@ -86,9 +184,65 @@ def create_app(test_config=None):
     else:
         app.db = init_real_db(config=CONFIG)
 
-    app.config["simulator"] = SimulatedStudentExperiment(
-        logger=logger,db=app.db, simulation=False, llm_creds=creds_file,
-        question_limit=int(CONFIG.get("app", "turns")), prod=is_production)
+    app.config["llm_cache"] = None
+    if CONFIG.getboolean("app", "llm_cache", fallback=False):
+        app.config["llm_cache"] = ResponseCache(
+            CONFIG.get("app", "llm_cache_path", fallback=os.path.join(app.instance_path, "llm_cache.sqlite")),
+            ttl=CONFIG.getint("app", "llm_cache_ttl", fallback=7 * 24 * 3600),
+            max_entries=CONFIG.getint("app", "llm_cache_max_entries", fallback=100000))
+    app.config["llm_scheduler"] = LLMScheduler(
+        max_in_flight=CONFIG.getint("app", "llm_max_in_flight", fallback=8),
+        tokens_per_minute=CONFIG.getint("app", "llm_tokens_per_minute", fallback=0),
+        completion_tokens=CONFIG.getint("app", "llm_completion_tokens", fallback=500))
+
+    def build_simulator():
+        # Imported here: adaptive_concept_selection pulls in pgmpy, pandas and the LLM client.
+        from adaptive_concept_selection.question_generation.question_generation_cg import SimulatedStudentExperiment
+        simulator = SimulatedStudentExperiment(
+            logger=logger,db=app.db, simulation=False, llm_creds=creds_file,
+            question_limit=int(CONFIG.get("app", "turns")), prod=is_production)
+        # Cache outermost, so cached responses never wait for a scheduler slot.
+        simulator.llm = ScheduledLLM(simulator.llm, app.config["llm_scheduler"])
+        if app.config["llm_cache"] is not None:
+            methods = CONFIG.get("app", "llm_cache_methods", fallback="")
+            simulator.llm = CachingLLM(simulator.llm, app.config["llm_cache"],
+                                       methods=[method.strip() for method in methods.split(",") if method.strip()])
+        return simulator
+
+    # Built on first use, or by preload() before gunicorn forks its workers.
+    app.config["simulator"] = LazySimulator(build_simulator)
+    app.config["session_cache"] = InterviewSessionCache(
+        max_size=CONFIG.getint("app", "session_cache_size", fallback=256),
+        ttl=CONFIG.getint("app", "session_cache_ttl", fallback=900))
+    app.config["turn_jobs"] = TurnJobQueue(
+        app, max_workers=CONFIG.getint("app", "turn_job_workers", fallback=4))
+    # Shared prototype; each interview gets its own lightweight copy from the pool.
+    app.config["simulator_pool"] = SimulatorPool(
+        app, app.config["simulator"], app.config["session_cache"], app.config["turn_jobs"])
+    app.config["interview_summaries"] = InterviewSummaryCache()
+    app.config["simulator_pool"].add_turn_listener(app.config["interview_summaries"].discard)
+    app.config["kc_dictionary"] = KCDictionary()
+
+    def refresh_kc_sets(interview_id):
+        # Keep the bitset copies of the conversation KCs current; never fail the turn over it.
+        try:
+            refresh_conversation_kc_sets(app.config["kc_dictionary"], interview_id)
+        except Exception as e:
+            app.logger.warning(f"Could not encode KC sets of interview {interview_id}: {e}")
+
+    app.config["simulator_pool"].add_turn_listener(refresh_kc_sets)
+    app.config["cohort_analytics"] = cohort_analytics.CohortAnalytics(
+        mastery_threshold=CONFIG.getfloat("app", "mastery_threshold", fallback=1.0),
+        refresh_interval=CONFIG.getfloat("app", "cohort_refresh_interval", fallback=30))
+    app.config["simulator_pool"].add_turn_listener(app.config["cohort_analytics"].mark_dirty)
+    app.config["artifact_sampler"] = ArtifactSampler(
+        ttl=CONFIG.getint("app", "artifact_sampler_ttl", fallback=300))
+    app.config["artifact_warmer"] = ArtifactWarmer(app, app.config["ALLOWED_POLICIES"])
+    metrics.register_collector(app, lambda: collect_component_metrics(app))
+    app.config["PREFETCH_QUESTIONS"] = CONFIG.getboolean("app", "prefetch_questions", fallback=False)
+    app.config["PREFETCH_WAIT_TIMEOUT"] = CONFIG.getfloat("app", "prefetch_wait_timeout", fallback=30)
+    app.config["ADMIN_TOKEN"] = CONFIG.get("app", "admin_token", fallback=None)
+    app.config["SSE_HEARTBEAT_INTERVAL"] = CONFIG.getfloat("app", "sse_heartbeat_interval", fallback=15)
 
     # a simple page that says hello
     @app.route('/hello')
@@ -125,11 +279,13 @@ def create_app(test_config=None):
     # Register blueprints
     app.register_blueprint(interview.bp)
     app.register_blueprint(messages.bp)
+    app.register_blueprint(admin.bp)
 
     @app.before_request
     def connect_db():
         try:
             refresh_db_proxy(app.db, database_proxy)
+            metrics.instrument_database(database_proxy.obj)
         except Exception as e:
             app.logger.error(
                 f"Database connection error in before_request: {e}")
@@ -137,9 +293,9 @@ def create_app(test_config=None):
 
     @app.teardown_appcontext
     def close_db(exception):
-        # Don't close connections in production to maintain connection pool
-        # Only close on exceptions or in development
-        if exception or app.debug:
+        # Pooled databases get their connection back at the end of every request.
+        # Otherwise don't close connections in production, only on exceptions or in development
+        if exception or app.debug or hasattr(database_proxy.obj, 'pool_stats'):
             try:
                 if database_proxy.obj and not database_proxy.obj.is_closed():
                     database_proxy.obj.close()
@@ -151,9 +307,17 @@ def create_app(test_config=None):
         try:
             # Test database connection
             database_proxy.obj.execute_sql('SELECT 1')
+            pool_stats = database_proxy.obj.pool_stats() if hasattr(database_proxy.obj, 'pool_stats') else None
             return jsonify({
                 'status': 'healthy',
                 'database': 'connected',
+                'database_pool': pool_stats,
+                'session_cache': app.config["session_cache"].stats(),
+                'simulator_pool': app.config["simulator_pool"].stats(),
+                'turn_jobs': app.config["turn_jobs"].stats(),
+                'llm_scheduler': app.config["llm_scheduler"].stats(),
+                'artifact_warmer': app.config["artifact_warmer"].stats(),
+                'llm_cache': app.config["llm_cache"].stats() if app.config["llm_cache"] is not None else None,
                 'timestamp': datetime.now().isoformat()
             }), 200
         except Exception as e:
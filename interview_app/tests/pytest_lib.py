@@ -16,8 +16,8 @@ def app():
     with app.app_context():
         db = init_memory_db()  # This should create all the tables
         # db.bind(tables_alllocal)
+        # The simulator is built lazily from app.db on first use.
         app.db = db
-        app.config["simulator"].db = db
         yield app
     return app
 
@@ -0,0 +1,56 @@
+import json
+
+from db.models import Artifact, ArtifactHash
+from tests.pytest_lib import app, client, runner
+
+def write_bank(path, problems):
+    with open(path, "w") as f:
+        for problem in problems:
+            f.write((problem if isinstance(problem, str) else json.dumps(problem)) + "\n")
+
+def problem(index, level="beginner", solution=None):
+    return {"title": f"Problem {index}", "description": "Sum the numbers.", "question": "What is the complexity?",
+            "solution": solution or f"def f{index}(xs):\n    return sum(xs)\n", "level": level}
+
+def test_ingest_artifacts(app, runner, tmp_path):
+    """Problems are validated, deduplicated by content and inserted in batches."""
+    last_id = Artifact.select(Artifact.artifact_id).order_by(Artifact.artifact_id.desc()).scalar()
+    try:
+        check_ingest(app, runner, tmp_path)
+    finally:
+        # The in-memory database is shared by the tests of this run.
+        Artifact.delete().where(Artifact.artifact_id > last_id).execute()
+        ArtifactHash.delete().execute()
+
+def check_ingest(app, runner, tmp_path):
+    sampler = app.config["artifact_sampler"]
+    sampled = len(sampler.ids("beginner"))
+    artifacts = Artifact.select().count()
+    bank = tmp_path / "bank.jsonl"
+    write_bank(bank, [
+        problem(1),
+        problem(2, level="expert"),
+        problem(1, solution="def f1(xs):  \r\n    return sum(xs)"),  # same content as line 1
+        problem(3, solution="def broken(:\n"),
+        problem(4, level="guru"),
+        "{not json",
+        problem(5),
+    ])
+    result = runner.invoke(args=["ingest-artifacts", str(bank), "--batch-size", "3", "--workers", "2"])
+    assert result.exit_code == 0, result.output
+    assert "7 problems read, 3 inserted, 1 duplicates, 3 invalid" in result.output
+    assert "rows/s" in result.output
+    assert "line 4: solution does not compile" in result.output
+    assert Artifact.select().count() == artifacts + 3
+    # Existing rows were hashed too, so every artifact has exactly one hash row.
+    assert ArtifactHash.select().count() == Artifact.select().count()
+    inserted = Artifact.get(Artifact.artifact_problem.contains("Problem 2"))
+    assert inserted.artifact_level == "expert" and inserted.artifact_valid == 1
+    assert inserted.artifact_problem.startswith("<h4>Problem 2</h4>")
+    assert len(sampler.ids("beginner")) == sampled + 2
+
+    # Re-ingesting the same bank inserts nothing.
+    result = runner.invoke(args=["ingest-artifacts", str(bank), "--workers", "0"])
+    assert result.exit_code == 0, result.output
+    assert "0 inserted, 4 duplicates" in result.output
+    assert Artifact.select().count() == artifacts + 3
@@ -0,0 +1,86 @@
+from unittest.mock import MagicMock, patch
+
+import peewee
+import pytest
+from peewee import OperationalError
+
+from db.connection_pool import ReconnectMySQLDatabase
+
+GONE_AWAY = OperationalError("(2006, 'MySQL server has gone away')")
+LOST = OperationalError("(2013, 'Lost connection to MySQL server during query')")
+
+
+@pytest.fixture
+def mysql_db():
+    """A ReconnectMySQLDatabase whose driver connections and queries are mocked."""
+    with patch.object(peewee.MySQLDatabase, "_connect", side_effect=lambda: MagicMock(server_version="8.0.36")), \
+            patch.object(ReconnectMySQLDatabase, "_is_closed", return_value=False), \
+            patch("db.connection_pool.time.sleep") as sleep:
+        db = ReconnectMySQLDatabase("skillsense", max_retries=2, retry_delay=0.5, max_connections=4)
+        db.sleep = sleep
+        yield db
+        if not db.is_closed():
+            db.close()
+
+
+def run_sql(db, *results):
+    """Call ``db.execute_sql`` with the driver returning (or raising) ``results`` in turn."""
+    with patch.object(peewee.Database, "execute_sql", side_effect=list(results)) as execute_sql:
+        try:
+            return db.execute_sql("SELECT 1")
+        finally:
+            db.execute_sql_calls = execute_sql.call_count
+
+def test_reconnects_when_server_has_gone_away(mysql_db):
+    """A 2006 error drops the dead connection and retries once on a fresh one."""
+    mysql_db.connect()
+    broken = mysql_db.connection()
+    cursor = MagicMock()
+    assert run_sql(mysql_db, GONE_AWAY, cursor) is cursor
+    assert mysql_db.execute_sql_calls == 2
+    assert mysql_db.connection() is not broken
+    broken.close.assert_called_once()
+    mysql_db.sleep.assert_not_called()
+    stats = mysql_db.pool_stats()
+    assert stats["reconnects"] == 1
+    assert stats["checkouts"] == 2
+    assert stats["in_use"] == 1
+
+def test_gives_up_after_max_retries(mysql_db):
+    """Lost connections are retried max_retries times, sleeping retry_delay between attempts."""
+    mysql_db.connect()
+    with pytest.raises(OperationalError, match="2013"):
+        run_sql(mysql_db, LOST, LOST, LOST, MagicMock())
+    assert mysql_db.execute_sql_calls == 3
+    assert mysql_db.pool_stats()["reconnects"] == 2
+    # The first retry is immediate, later ones wait retry_delay.
+    assert [call.args for call in mysql_db.sleep.call_args_list] == [(0.5,)]
+
+def test_does_not_retry_other_errors_or_transactions(mysql_db):
+    """Other errors, and errors inside a transaction, are raised without reconnecting."""
+    mysql_db.connect()
+    with pytest.raises(OperationalError, match="1064"):
+        run_sql(mysql_db, OperationalError("(1064, 'You have an error in your SQL syntax')"), MagicMock())
+    assert mysql_db.execute_sql_calls == 1
+
+    with patch.object(mysql_db, "in_transaction", return_value=True):
+        with pytest.raises(OperationalError, match="2006"):
+            run_sql(mysql_db, GONE_AWAY, MagicMock())
+    assert mysql_db.execute_sql_calls == 1
+    assert mysql_db.pool_stats()["reconnects"] == 0
+
+def test_pool_stats(mysql_db):
+    """Connections returned to the pool are reported as idle and reused."""
+    mysql_db.connect()
+    assert mysql_db.is_connection_usable()
+    assert mysql_db.pool_stats() == {
+        "in_use": 1, "idle": 0, "max_connections": 4, "checkouts": 1, "waits": 0, "reconnects": 0,
+    }
+    connection = mysql_db.connection()
+    mysql_db.close()
+    assert not mysql_db.is_connection_usable()
+    assert mysql_db.pool_stats()["idle"] == 1
+    mysql_db.connect()
+    assert mysql_db.connection() is connection
+    stats = mysql_db.pool_stats()
+    assert (stats["in_use"], stats["idle"], stats["checkouts"]) == (1, 0, 2)
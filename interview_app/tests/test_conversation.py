@@ -2,8 +2,12 @@ import pdb
 import pytest
 from datetime import datetime
 import random
+import time
+import json
 from unittest.mock import patch, MagicMock
 
+from flask import g
+
 from peewee import SqliteDatabase
 from adaptive_concept_selection.question_generation.question_generation_cg import SimulatedStudentExperiment
 from adaptive_concept_selection.knowledge_graph.knowledge_profile import Question, ResponseData
@@ -15,9 +19,8 @@ from tests.pytest_lib import app, client
 from adaptive_concept_selection.db.db_utils import tables_alllocal, init_memory_db, init_test_db
 from defaultsettings import config
 
-def interview_conversation_helper(app, client, policy_id):
+def setup_mock_knowledge_profile(simulator, policy_id):
     """Sets up the mock knowledge profiles in the simulator for simulating mock responses."""
-    simulator = app.config["simulator"]
     if policy_id == 0:
         knowledge_profile = FixedKnowledgeProfile(simulator.kc_list, simulator.llm, simulator.logger)
     elif policy_id == 1:
@@ -56,6 +59,13 @@ def interview_conversation_helper(app, client, policy_id):
         name="get_student_response",
         return_value=mock_simulated_answer
     )
+    return mock_question, mock_answer, reference_answer, mock_simulated_answer
+
+def interview_conversation_helper(app, client, policy_id):
+    """Runs a full mocked interview through the conversation routes."""
+    simulator = app.config["simulator"]
+    mock_question, mock_answer, reference_answer, mock_simulated_answer = setup_mock_knowledge_profile(
+        simulator, policy_id)
 
     response = client.get("/api/interview/beginner", follow_redirects=True)
     assert response.status_code == 200
@@ -127,3 +137,405 @@ def test_interview_conversation_policy1(app, client):
     interview_conversation_helper(app, client, 1)
 
 
+
+def wait_for_job(client, job_url, timeout=5):
+    """Poll a turn job until it finishes."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = client.get(job_url)
+        if response.status_code != 202:
+            return response
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_url} did not finish")
+
+def test_interview_conversation_async(app, client):
+    """Turns requested with ?async=1 run in the background and are idempotent per turn."""
+    simulator = app.config["simulator"]
+    mock_question, mock_answer, reference_answer, _ = setup_mock_knowledge_profile(simulator, 1)
+    interview_id = client.get("/api/interview/beginner", follow_redirects=True).get_json()["interview_id"]
+
+    response = client.get(f"/api/conversation/interviewer/{interview_id}?async=1")
+    assert response.status_code == 202
+    job = response.get_json()
+    job_url = response.headers["Location"]
+
+    response = wait_for_job(client, job_url)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["status"] == "done"
+    assert data["result"]["suggested_conversations"][0]["conversation_response"] == mock_question
+
+    # Polling again returns the same finished job.
+    response = client.get(job_url)
+    assert response.get_json()["job_id"] == job["job_id"]
+    assert response.get_json()["result"] == data["result"]
+
+    client.get(f"/api/conversation/interviewer/select_suggested_conversation/{interview_id}/0")
+    turn_number = simulator.get_last_turn_number(interview_id)
+    # Hold the interview so the job cannot write the turn before the duplicate request arrives.
+    with app.config["simulator_pool"].checkout(interview_id):
+        response = client.post(f"/api/conversation/student/{interview_id}?async=1", json={"response": mock_answer})
+        assert response.status_code == 202
+        student_job = response.get_json()
+        response = client.post(f"/api/conversation/student/{interview_id}?async=1", json={"response": mock_answer})
+        assert response.get_json()["job_id"] == student_job["job_id"]
+
+    data = wait_for_job(client, f"/api/conversation/job/{student_job['job_id']}").get_json()
+    assert data["result"]["processed_answer"] == mock_answer
+    assert data["result"]["reference_answer"] == reference_answer
+    assert data["turn_number"] == turn_number
+    assert simulator.get_last_turn_number(interview_id) == turn_number + 1
+
+def test_interviewer_questions_prefetched(app, client):
+    """With prefetching on, the next questions are generated right after the student's answer."""
+    app.config["PREFETCH_QUESTIONS"] = True
+    simulator = app.config["simulator"]
+    mock_question, mock_answer, _, _ = setup_mock_knowledge_profile(simulator, 1)
+    knowledge_profile = simulator.initialize_knowledge_profile.return_value
+    interview_id = client.get("/api/interview/beginner", follow_redirects=True).get_json()["interview_id"]
+
+    client.get(f"/api/conversation/interviewer/{interview_id}")
+    client.get(f"/api/conversation/interviewer/select_suggested_conversation/{interview_id}/0")
+    response = client.post(f"/api/conversation/student/{interview_id}", json={"response": mock_answer})
+
+    # The prefetch job is keyed by the turn the answer was written to.
+    turn_number = response.get_json()["conversation_turn_number"]
+    prefetched = app.config["turn_jobs"].wait((interview_id, turn_number, "interviewer"), timeout=5)
+    assert prefetched is not None
+    assert prefetched.status == "done"
+    assert knowledge_profile.get_next_interaction.call_count == 2
+
+    # The route serves the committed prefetch instead of stepping again.
+    with patch("routes.interview.interviewer_turn", side_effect=AssertionError("stepped again")):
+        response = client.get(f"/api/conversation/interviewer/{interview_id}")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["suggested_conversations"][0]["conversation_response"] == mock_question
+    assert data["suggested_conversations"][0]["conversation_turn_number"] == turn_number + 1
+    assert knowledge_profile.get_next_interaction.call_count == 2
+
+def test_prefetch_dropped_on_update_or_timeout(app, client):
+    """Prefetched questions are not served after a row update, nor waited on past the timeout."""
+    import threading
+    from services.turns import interviewer_turn, turn_job_key
+    app.config["PREFETCH_QUESTIONS"] = True
+    simulator = app.config["simulator"]
+    _, mock_answer, _, _ = setup_mock_knowledge_profile(simulator, 1)
+    interview_id = client.get("/api/interview/beginner", follow_redirects=True).get_json()["interview_id"]
+    client.get(f"/api/conversation/interviewer/{interview_id}")
+    response = client.post(f"/api/conversation/student/{interview_id}", json={"response": mock_answer})
+    turn_number = response.get_json()["conversation_turn_number"]
+    turn_jobs = app.config["turn_jobs"]
+    key = turn_job_key(interview_id, "interviewer")
+    job = turn_jobs.wait(key, timeout=5)
+    assert job.status == "done"
+
+    # Selecting reference concepts drops the prefetch; the turn is read back from the database.
+    client.get(f"/api/conversation/student/select_reference_concepts/{interview_id}/{turn_number}?concepts=lists")
+    assert turn_jobs.find(key) is None
+    assert turn_jobs.get(job.job_id) is job
+    with patch("routes.interview.interviewer_turn", wraps=interviewer_turn) as turn:
+        response = client.get(f"/api/conversation/interviewer/{interview_id}")
+    assert response.status_code == 200
+    turn.assert_called_once()
+
+    # A prefetch that does not finish in time is generated by the request instead.
+    release = threading.Event()
+    turn_jobs.submit(key, lambda: (release.wait(5), (None, False))[1])
+    app.config["PREFETCH_WAIT_TIMEOUT"] = 0.05
+    fallback = ({"suggested_conversations": [], "status": "success"}, False)
+    try:
+        with patch("routes.interview.interviewer_turn", return_value=fallback) as turn:
+            response = client.get(f"/api/conversation/interviewer/{interview_id}")
+    finally:
+        release.set()
+    assert response.get_json() == fallback[0]
+    turn.assert_called_once()
+
+def parse_events(body):
+    """Split a text/event-stream body into (event, data) pairs, skipping comments."""
+    events = []
+    for chunk in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in chunk.splitlines() if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def test_interview_conversation_stream(app, client):
+    """The streaming routes emit suggestions and answer fields as separate events."""
+    simulator = app.config["simulator"]
+    mock_question, mock_answer, reference_answer, _ = setup_mock_knowledge_profile(simulator, 1)
+    interview_id = client.get("/api/interview/beginner", follow_redirects=True).get_json()["interview_id"]
+
+    response = client.get(f"/api/conversation/interviewer/{interview_id}/stream")
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    events = parse_events(response.get_data(as_text=True))
+    assert [event for event, _ in events] == ["accepted", "suggestion", "done"]
+    assert events[1][1]["conversation_response"] == mock_question
+    assert events[2][1]["suggestion_count"] == 1
+
+    client.get(f"/api/conversation/interviewer/select_suggested_conversation/{interview_id}/0")
+    response = client.post(f"/api/conversation/student/{interview_id}/stream", json={"response": mock_answer})
+    events = dict(parse_events(response.get_data(as_text=True)))
+    assert events["processed_answer"] == {"processed_answer": mock_answer}
+    assert events["reference_answer"] == {"reference_answer": reference_answer}
+    assert "metadata" in events
+    assert events["done"]["status"] == "success"
+
+    response = client.get("/api/conversation/interviewer/0/stream")
+    assert response.status_code == 404
+
+def test_interview_record_since_turn_and_etag(app, client):
+    """The record endpoint supports incremental fetches and conditional requests."""
+    simulator = app.config["simulator"]
+    mock_question, mock_answer, _, _ = setup_mock_knowledge_profile(simulator, 1)
+    interview_id = client.get("/api/interview/beginner", follow_redirects=True).get_json()["interview_id"]
+    client.get(f"/api/conversation/interviewer/{interview_id}")
+    client.get(f"/api/conversation/interviewer/select_suggested_conversation/{interview_id}/0")
+    client.post(f"/api/conversation/student/{interview_id}", json={"response": mock_answer})
+
+    response = client.get(f"/api/interview/record/{interview_id}")
+    history = response.get_json()["interview_conversation_history"]
+    etag = response.headers["ETag"]
+    assert [conv["conversation_turn_number"] for conv in history] == [0, 1]
+
+    response = client.get(f"/api/interview/record/{interview_id}?since_turn=0")
+    history = response.get_json()["interview_conversation_history"]
+    assert [conv["conversation_response"] for conv in history] == [mock_answer]
+    assert response.headers["ETag"] != etag
+
+    # An unchanged record answers 304 without touching the simulator.
+    simulator_pool = app.config["simulator_pool"]
+    simulator_pool.checkout = MagicMock(side_effect=AssertionError("record was rebuilt"))
+    # The tests share one app context; start this request's query count from zero.
+    g.pop("timings", None)
+    response = client.get(f"/api/interview/record/{interview_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.get_data() == b""
+    assert 'db;desc="1 queries"' in response.headers["Server-Timing"]
+    del simulator_pool.checkout
+
+    # A new turn changes the ETag.
+    client.get(f"/api/conversation/interviewer/{interview_id}")
+    response = client.get(f"/api/interview/record/{interview_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    # So does every reference-concept update, including a repeated one.
+    for concepts in ("lists", "tuples"):
+        etag = response.headers["ETag"]
+        client.get(f"/api/conversation/student/select_reference_concepts/{interview_id}/1?concepts={concepts}")
+        response = client.get(f"/api/interview/record/{interview_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        history = response.get_json()["interview_conversation_history"]
+        assert json.loads(history[1]["conversation_reference_kcs"]) == [concepts]
+
+def test_version_tracks_repeated_updates(app, client):
+    """Every update of a row, not only the first, invalidates cached sessions."""
+    from db.models import InterviewConversation, database_proxy
+    from db.transactions import deferred_atomic
+    from services.session_cache import bump_interview_version
+    simulator = app.config["simulator"]
+    _, mock_answer, _, _ = setup_mock_knowledge_profile(simulator, 1)
+    interview_id = client.get("/api/interview/beginner", follow_redirects=True).get_json()["interview_id"]
+    client.get(f"/api/conversation/interviewer/{interview_id}")
+    client.post(f"/api/conversation/student/{interview_id}", json={"response": mock_answer})
+
+    session_cache = app.config["session_cache"]
+    for concepts in (["lists"], ["tuples"]):
+        # Written by another worker: this worker's session is not invalidated directly.
+        with deferred_atomic(database_proxy.obj):
+            (InterviewConversation.update(conversation_reference_kcs=json.dumps(concepts))
+             .where((InterviewConversation.conversation_interview_id == interview_id) &
+                    (InterviewConversation.conversation_turn_number == 1))
+             .execute())
+            bump_interview_version(interview_id)
+        invalidations = session_cache.stats()["invalidations"]
+        history = client.get(f"/api/interview/record/{interview_id}").get_json()["interview_conversation_history"]
+        assert session_cache.stats()["invalidations"] == invalidations + 1
+        assert json.loads(history[-1]["conversation_reference_kcs"]) == concepts
+
+def test_end_interview_summary(app, client):
+    """Ending an interview summarizes it without rebuilding the simulator state."""
+    simulator = app.config["simulator"]
+    mock_question, mock_answer, _, _ = setup_mock_knowledge_profile(simulator, 1)
+    interview_id = client.get("/api/interview/beginner", follow_redirects=True).get_json()["interview_id"]
+    client.get(f"/api/conversation/interviewer/{interview_id}")
+    client.get(f"/api/conversation/interviewer/select_suggested_conversation/{interview_id}/0")
+    client.post(f"/api/conversation/student/{interview_id}", json={"response": mock_answer})
+
+    simulator_pool = app.config["simulator_pool"]
+    simulator_pool.checkout = MagicMock(side_effect=AssertionError("interview was rebuilt"))
+    response = client.get(f"/api/conversation/interview/end/{interview_id}")
+    del simulator_pool.checkout
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["interview_id"] == interview_id
+    assert data["total_conversation_turns"] == 2
+    assert data["responded_suggestions"] == 2
+    assert [turn["turn_number"] for turn in data["turns"]] == [0, 1]
+    assert data["kc_coverage"] == len(data["covered_kcs"])
+    assert set(data["reference_kc_overlap"]) == set(data["covered_kcs"]) & set(data["reference_kcs"])
+    assert data["total_time_taken"] is not None
+
+    # The summary is cached until the interview gets a new turn.
+    assert interview_id in app.config["interview_summaries"]
+    client.get(f"/api/conversation/interviewer/{interview_id}")
+    assert interview_id not in app.config["interview_summaries"]
+    data = client.get(f"/api/conversation/interview/end/{interview_id}").get_json()
+    assert data["total_conversation_turns"] == 3
+
+    # A cached summary costs one lookup of the interview's version.
+    g.pop("timings", None)
+    response = client.get(f"/api/conversation/interview/end/{interview_id}")
+    assert 'db;desc="1 queries"' in response.headers["Server-Timing"]
+
+    # Rows written by another worker are seen too, even though no listener ran here.
+    from db.models import InterviewConversation, database_proxy
+    from db.transactions import deferred_atomic
+    from services.session_cache import bump_interview_version
+    with deferred_atomic(database_proxy.obj):
+        (InterviewConversation.update(conversation_responded=1)
+         .where(InterviewConversation.conversation_interview_id == interview_id).execute())
+        bump_interview_version(interview_id)
+    data = client.get(f"/api/conversation/interview/end/{interview_id}").get_json()
+    assert data["responded_suggestions"] == 3
+
+    response = client.get("/api/conversation/interview/end/0")
+    assert response.status_code == 404
+
+def test_turn_writes_are_atomic(app, client):
+    """A turn's rows commit in one transaction; a failing step leaves nothing behind."""
+    from db.models import InterviewConversation, TurnClaim, database_proxy
+    simulator = app.config["simulator"]
+    mock_question, mock_answer, _, _ = setup_mock_knowledge_profile(simulator, 1)
+    interview_id = client.get("/api/interview/beginner", follow_redirects=True).get_json()["interview_id"]
+    client.get(f"/api/conversation/interviewer/{interview_id}")
+    client.get(f"/api/conversation/interviewer/select_suggested_conversation/{interview_id}/0")
+
+    simulator_pool = app.config["simulator_pool"]
+    with simulator_pool.checkout(interview_id) as session:
+        pass
+    in_transaction = []
+
+    def failing_step(*args, **kwargs):
+        # Generating runs outside any transaction; the first write opens one.
+        in_transaction.append(database_proxy.in_transaction())
+        InterviewConversation.create(conversation_interview_id=interview_id, conversation_turn_number=1,
+                                     conversation_turn_id=1, conversation_response="partial")
+        in_transaction.append(database_proxy.in_transaction())
+        raise RuntimeError("LLM unavailable")
+
+    session.simulator.step = failing_step
+    with pytest.raises(RuntimeError):
+        client.post(f"/api/conversation/student/{interview_id}", json={"response": mock_answer})
+    assert in_transaction == [False, True]
+    assert not InterviewConversation.select().where(
+        (InterviewConversation.conversation_interview_id == interview_id) &
+        (InterviewConversation.conversation_response == "partial")).exists()
+    # The failed session was dropped and its claim released, so the retry runs
+    # on a freshly reset simulator.
+    assert app.config["session_cache"].get(interview_id) is None
+    assert not TurnClaim.select().where((TurnClaim.claim_interview_id == interview_id) &
+                                        (TurnClaim.claim_turn_id == 1)).exists()
+
+    response = client.post(f"/api/conversation/student/{interview_id}", json={"response": mock_answer})
+    assert response.status_code == 200
+    assert response.get_json()["processed_answer"] == mock_answer
+
+def test_turn_steps_once(app, client):
+    """Concurrent submissions of the same answer share one step; another worker replays it."""
+    import threading
+    from db.models import InterviewConversation, TurnClaim
+    from services.single_flight import TurnSingleFlight
+    simulator = app.config["simulator"]
+    mock_question, mock_answer, _, _ = setup_mock_knowledge_profile(simulator, 1)
+    interview_id = client.get("/api/interview/beginner", follow_redirects=True).get_json()["interview_id"]
+    client.get(f"/api/conversation/interviewer/{interview_id}")
+    client.get(f"/api/conversation/interviewer/select_suggested_conversation/{interview_id}/0")
+
+    simulator_pool = app.config["simulator_pool"]
+    flights = simulator_pool.flights
+    with simulator_pool.checkout(interview_id) as session:
+        pass
+    step = session.simulator.step
+    steps = []
+
+    def slow_step(*args, **kwargs):
+        steps.append(kwargs)
+        # Hold the step until the duplicate submission has joined it.
+        deadline = time.monotonic() + 5
+        while flights.stats()["joined"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return step(*args, **kwargs)
+
+    session.simulator.step = slow_step
+    responses = []
+
+    def submit():
+        responses.append(client.post(f"/api/conversation/student/{interview_id}", json={"response": mock_answer}))
+
+    threads = [threading.Thread(target=submit) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert len(steps) == 1
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].get_json() == responses[1].get_json()
+    assert InterviewConversation.select().where(
+        (InterviewConversation.conversation_interview_id == interview_id) &
+        (InterviewConversation.conversation_turn_id == 1)).count() == 1
+    claim = TurnClaim.get(TurnClaim.claim_interview_id == interview_id, TurnClaim.claim_turn_id == 1)
+    assert claim.claim_done == 0
+
+    # A worker that missed the step in memory hits the claim and replays the committed turn.
+    other_worker = TurnSingleFlight()
+    key = (interview_id, claim.claim_turn_number, 1)
+    with simulator_pool.checkout(interview_id) as session:
+        obs, _, done, _, _ = session.step(other_worker, key, action=mock_answer, turn_id=1)
+    assert len(steps) == 1 and done is False
+    assert obs["conversation_history_data"][-1].conversation_response == mock_answer
+    assert other_worker.stats()["claim_conflicts"] == 1
+    assert flights.stats()["joined"] == 1 and flights.stats()["steps"] >= 1
+
+def test_turn_claim_waits_for_other_worker(app, client):
+    """A step claimed by another worker is waited for, then its committed turn is served."""
+    import threading
+    from datetime import datetime
+    from db.models import InterviewConversation
+    from services.single_flight import TurnSingleFlight
+    from services.turns import turn_key
+    simulator = app.config["simulator"]
+    setup_mock_knowledge_profile(simulator, 1)
+    knowledge_profile = simulator.initialize_knowledge_profile.return_value
+    interview_id = client.get("/api/interview/beginner", follow_redirects=True).get_json()["interview_id"]
+
+    key = turn_key(interview_id, 0)
+    assert key == (interview_id, -1, 0)
+    other_worker = TurnSingleFlight()
+    claim = other_worker.claim(key)
+    flights = app.config["simulator_pool"].flights
+    conflicts = flights.stats()["claim_conflicts"]
+    responses = []
+    thread = threading.Thread(target=lambda: responses.append(
+        client.get(f"/api/conversation/interviewer/{interview_id}")))
+    thread.start()
+    deadline = time.monotonic() + 5
+    while flights.stats()["claim_conflicts"] == conflicts and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # The other worker writes its turn and finishes the claim; the claim was
+    # committed on its own, so this did not wait on a lock.
+    InterviewConversation.create(conversation_interview_id=interview_id, conversation_turn_number=0,
+                                 conversation_turn_id=0, conversation_response="Other worker's question",
+                                 conversation_responded=0, conversation_timestamp=datetime.now())
+    other_worker.finish(claim, False)
+    thread.join(5)
+
+    assert responses[0].status_code == 200
+    suggestions = responses[0].get_json()["suggested_conversations"]
+    assert [conv["conversation_response"] for conv in suggestions] == ["Other worker's question"]
+    assert knowledge_profile.get_next_interaction.call_count == 0
+    assert turn_key(interview_id, 0) == key
@@ -0,0 +1,149 @@
+from unittest.mock import patch
+
+from db import db_utils
+from db.models import Student, StudentArtifact, Artifact
+from tests.pytest_lib import app, client, runner
+
+def test_seed_snapshot_is_cached_on_disk(app, tmp_path, monkeypatch):
+    """Seed rows are parsed once, then loaded from the snapshot until the resources change."""
+    monkeypatch.setattr(db_utils, "SEED_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(db_utils, "_seed_snapshot", None)
+    counts = (Student.select().count(), StudentArtifact.select().count(), Artifact.select().count())
+
+    with patch.object(db_utils, "build_seed_snapshot", wraps=db_utils.build_seed_snapshot) as build:
+        snapshot = db_utils.load_seed_snapshot()
+        assert build.call_count == 1
+        assert len(list(tmp_path.glob("seed-*.json"))) == 1
+
+        # A new process only reads the JSON file.
+        monkeypatch.setattr(db_utils, "_seed_snapshot", None)
+        assert db_utils.load_seed_snapshot() == snapshot
+        assert build.call_count == 1
+
+        # Changed resources produce a new key and a rebuild.
+        monkeypatch.setattr(db_utils, "_seed_snapshot", None)
+        with patch.object(db_utils, "seed_snapshot_key", return_value="changed"):
+            db_utils.load_seed_snapshot()
+        assert build.call_count == 2
+
+        # A corrupt or planted file is only data: it is rebuilt, never executed.
+        monkeypatch.setattr(db_utils, "_seed_snapshot", None)
+        path = next(tmp_path.glob(f"seed-{db_utils.seed_snapshot_key()}.json"))
+        path.write_bytes(b"\x80\x04cos\nsystem\n.")
+        assert db_utils.load_seed_snapshot() == snapshot
+        assert build.call_count == 3
+
+    assert (len(snapshot["students"]), len(snapshot["student_artifacts"]), len(snapshot["artifacts"])) == counts
+    student_ids = {student.student_level: student.student_type_id for student in Student.select()}
+    artifact = StudentArtifact.select().order_by(StudentArtifact.student_artifact_id).first()
+    statement, solution, kcs, level = snapshot["student_artifacts"][0]
+    assert (artifact.problem_statement, artifact.extracted_kcs, artifact.student_id) == (
+        statement, kcs, student_ids[level])
+
+def test_kc_set_field_round_trip():
+    """KC id sets are stored as compact bitsets."""
+    from db.fields import encode_kc_set, decode_kc_set, kc_mask
+    bitset = encode_kc_set([3, 0, 9, 3])
+    assert len(bitset) == 2
+    assert decode_kc_set(bitset) == frozenset({0, 3, 9})
+    assert kc_mask(bitset, 4).tolist() == [True, False, False, True]
+    assert encode_kc_set([]) == b"" and decode_kc_set(b"") == frozenset()
+
+def test_conversation_kc_sets(app, client, runner):
+    """Turns keep bitset copies of the conversation KCs; migrate-kc-sets backfills existing rows."""
+    from db.db_functions import parse_kcs
+    from db.kc_sets import interview_kc_coverage
+    from db.models import ConversationKCSet, InterviewConversation
+    from tests.test_export import run_interview
+
+    interview_id = run_interview(app, client, 1)
+    dictionary = app.config["kc_dictionary"]
+    conversations = list(InterviewConversation.select().where(
+        InterviewConversation.conversation_interview_id == interview_id))
+    kc_sets = {row.conversation_id: row for row in ConversationKCSet.select().where(
+        ConversationKCSet.conversation_interview_id == interview_id)}
+    assert set(kc_sets) == {conversation.conversation_id for conversation in conversations}
+    for conversation in conversations:
+        kc_set = kc_sets[conversation.conversation_id]
+        for column in ("conversation_k_cs", "conversation_reference_kcs"):
+            kc_ids = getattr(kc_set, column) or frozenset()
+            assert set(dictionary.names(sorted(kc_ids))) == set(parse_kcs(getattr(conversation, column)))
+
+    assert any(kc_set.conversation_k_cs for kc_set in kc_sets.values())
+
+    # Coverage and reference overlap match the KC columns; rows missed by the
+    # turn listener are encoded on the way.
+    ConversationKCSet.delete().where(ConversationKCSet.conversation_id == conversations[-1].conversation_id).execute()
+    coverage = interview_kc_coverage(dictionary, interview_id)
+    covered = {kc for conversation in conversations if conversation.conversation_responded == 1
+               for kc in parse_kcs(conversation.conversation_k_cs)}
+    reference = {kc for conversation in conversations for kc in parse_kcs(conversation.conversation_reference_kcs)}
+    assert coverage["covered_kcs"] == sorted(covered)
+    assert coverage["reference_kcs"] == sorted(reference)
+    assert coverage["reference_kc_overlap"] == sorted(covered & reference)
+    assert ConversationKCSet.get_or_none(conversation_id=conversations[-1].conversation_id) is not None
+
+    # A turn only encodes its own rows.
+    encoded = []
+    encode = dictionary.encode
+    dictionary.encode = lambda value: encoded.append(value) or encode(value)
+    try:
+        client.get(f"/api/conversation/interviewer/{interview_id}")
+    finally:
+        del dictionary.encode
+    assert len(encoded) == 2 * (InterviewConversation.select().where(
+        InterviewConversation.conversation_interview_id == interview_id).count() - len(conversations))
+
+    # Selecting reference concepts re-encodes that turn.
+    turn_number = max(conversation.conversation_turn_number for conversation in conversations)
+    client.get(f"/api/conversation/student/select_reference_concepts/{interview_id}/{turn_number}"
+               "?concepts=brand new concept")
+    row = InterviewConversation.get((InterviewConversation.conversation_interview_id == interview_id) &
+                                    (InterviewConversation.conversation_turn_number == turn_number))
+    kc_ids = ConversationKCSet.get_by_id(row.conversation_id).conversation_reference_kcs
+    assert dictionary.names(sorted(kc_ids)) == ["brand new concept"]
+
+    ConversationKCSet.delete().execute()
+    result = runner.invoke(args=["migrate-kc-sets"])
+    assert f"Encoded {InterviewConversation.select().count()} rows into conversation_kc_set." in result.output
+    assert ConversationKCSet.get_by_id(conversations[0].conversation_id).conversation_k_cs == \
+        kc_sets[conversations[0].conversation_id].conversation_k_cs
+    result = runner.invoke(args=["migrate-kc-sets"])
+    assert "Encoded 0 rows into conversation_kc_set." in result.output
+
+def test_deferred_atomic_begins_at_first_write(app):
+    """Reads run outside a transaction; writes from the first one on commit or roll back together."""
+    from db.transactions import deferred_atomic
+    from db.models import InterviewConversation, database_proxy
+    states = []
+    with deferred_atomic(app.db):
+        InterviewConversation.select().count()
+        states.append(database_proxy.in_transaction())
+        InterviewConversation.create(conversation_interview_id=54321, conversation_response="kept")
+        states.append(database_proxy.in_transaction())
+    states.append(database_proxy.in_transaction())
+    assert states == [False, True, False]
+
+    try:
+        with deferred_atomic(app.db):
+            InterviewConversation.create(conversation_interview_id=54321, conversation_response="rolled back")
+            raise RuntimeError("step failed")
+    except RuntimeError:
+        pass
+    responses = [row.conversation_response for row in
+                 InterviewConversation.select().where(InterviewConversation.conversation_interview_id == 54321)]
+    InterviewConversation.delete().where(InterviewConversation.conversation_interview_id == 54321).execute()
+    assert responses == ["kept"]
+
+def test_migrate_interview_version(runner):
+    """The version column is added to an existing table, and the command is idempotent."""
+    from peewee import SqliteDatabase
+    db = SqliteDatabase(":memory:")
+    db.execute_sql("CREATE TABLE student_interview_record (interview_id INTEGER PRIMARY KEY)")
+    db.execute_sql("INSERT INTO student_interview_record (interview_id) VALUES (1)")
+    assert db_utils.migrate_interview_version(db)
+    assert db.execute_sql("SELECT interview_version FROM student_interview_record").fetchone() == (0,)
+    assert not db_utils.migrate_interview_version(db)
+
+    result = runner.invoke(args=["migrate-interview-version"])
+    assert "already exists" in result.output
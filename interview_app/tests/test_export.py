@@ -0,0 +1,145 @@
+import gzip
+import json
+import pytest
+
+from peewee import JOIN
+
+from db.models import InterviewConversation, StudentInterviewRecord
+from tests.pytest_lib import app, client, runner
+from tests.test_conversation import setup_mock_knowledge_profile
+
+def run_interview(app, client, policy_id):
+    setup_mock_knowledge_profile(app.config["simulator"], policy_id)
+    interview_id = client.get(f"/api/interview/beginner/{policy_id}", follow_redirects=True).get_json()["interview_id"]
+    client.get(f"/api/conversation/interviewer/{interview_id}")
+    client.get(f"/api/conversation/interviewer/select_suggested_conversation/{interview_id}/0")
+    client.post(f"/api/conversation/student/{interview_id}", json={"response": "An answer"})
+    return interview_id
+
+def exported_conversations(policy=None):
+    query = (InterviewConversation.select()
+             .join(StudentInterviewRecord, on=(
+                 InterviewConversation.conversation_interview_id == StudentInterviewRecord.interview_id)))
+    if policy is not None:
+        query = query.where(StudentInterviewRecord.interview_policy == policy)
+    return query.count()
+
+def interviews_without_conversations(policy=None):
+    query = (StudentInterviewRecord.select()
+             .join(InterviewConversation, JOIN.LEFT_OUTER, on=(
+                 InterviewConversation.conversation_interview_id == StudentInterviewRecord.interview_id))
+             .where(InterviewConversation.conversation_id.is_null()))
+    if policy is not None:
+        query = query.where(StudentInterviewRecord.interview_policy == policy)
+    return query.count()
+
+def exported_rows(policy=None):
+    return exported_conversations(policy) + interviews_without_conversations(policy)
+
+def test_export_interviews_command(app, client, runner, tmp_path):
+    """The CLI pages through all conversations, then interviews without any, and writes gzipped NDJSON."""
+    interview_ids = [run_interview(app, client, 0), run_interview(app, client, 1)]
+    empty_interview_id = client.get("/api/interview/beginner/1", follow_redirects=True).get_json()["interview_id"]
+    output = tmp_path / "interviews.ndjson.gz"
+
+    result = runner.invoke(args=["export-interviews", str(output), "--batch-size", "2"])
+    assert f"Exported {exported_rows()} rows" in result.output
+    with gzip.open(output, "rt") as fileobj:
+        rows = [json.loads(line) for line in fileobj]
+    assert len(rows) == exported_rows()
+    conversation_ids = [row["conversation_id"] for row in rows[:exported_conversations()]]
+    assert conversation_ids == sorted(conversation_ids)
+    empty = [row for row in rows[exported_conversations():]]
+    assert all(row["conversation_id"] is None for row in empty)
+    assert empty_interview_id in [row["interview_id"] for row in empty]
+    rows = [row for row in rows if row["interview_id"] in interview_ids]
+    assert [row["interview_id"] for row in rows] == [interview_ids[0]] * 2 + [interview_ids[1]] * 2
+    assert [row["conversation_turn_number"] for row in rows] == [0, 1, 0, 1]
+    assert rows[0]["student_level"] == "beginner"
+    assert isinstance(rows[0]["conversation_metadata"], dict)
+
+    result = runner.invoke(args=["export-interviews", str(output), "--policy", "1"])
+    assert f"Exported {exported_rows(policy=1)} rows" in result.output
+    result = runner.invoke(args=["export-interviews", str(output), "--since", "2999-01-01"])
+    assert "Exported 0 rows" in result.output
+
+def test_export_endpoint(app, client):
+    """The admin export streams NDJSON and requires the admin token."""
+    interview_id = run_interview(app, client, 1)
+
+    assert client.get("/api/admin/export").status_code == 404
+    app.config["ADMIN_TOKEN"] = "secret"
+    assert client.get("/api/admin/export", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+    headers = {"X-Admin-Token": "secret"}
+    response = client.get("/api/admin/export?level=beginner&batch_size=1", headers=headers)
+    assert response.status_code == 200
+    assert response.mimetype == "application/gzip"
+    rows = [json.loads(line) for line in gzip.decompress(response.get_data()).splitlines()]
+    assert {row["student_level"] for row in rows} == {"beginner"}
+    assert len([row for row in rows if row["interview_id"] == interview_id]) == 2
+
+    response = client.get("/api/admin/export?since=2999-01-01", headers=headers)
+    assert gzip.decompress(response.get_data()) == b""
+    assert client.get("/api/admin/export?since=yesterday", headers=headers).status_code == 400
+    assert client.get("/api/admin/export?format=csv", headers=headers).status_code == 400
+
+def test_export_parquet(app, client, runner, tmp_path):
+    """Parquet exports write one row group per page."""
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    run_interview(app, client, 1)
+    output = tmp_path / "interviews.parquet"
+
+    runner.invoke(args=["export-interviews", str(output), "--format", "parquet", "--batch-size", "3"])
+    parquet_file = pyarrow_parquet.ParquetFile(output)
+    assert parquet_file.metadata.num_rows == exported_rows()
+    assert parquet_file.metadata.num_row_groups == (-(-exported_conversations() // 3)
+                                                    + -(-interviews_without_conversations() // 3))
+    conversation_ids = parquet_file.read().column("conversation_id").to_pylist()[:exported_conversations()]
+    assert conversation_ids == sorted(conversation_ids)
+
+def test_cohort_analytics(app, client, runner):
+    """Cohort coverage and mastery come from the knowledge-state matrix, refreshed incrementally."""
+    app.config["ADMIN_TOKEN"] = "secret"
+    headers = {"X-Admin-Token": "secret"}
+    analytics = app.config["cohort_analytics"]
+    interview_id = run_interview(app, client, 1)
+
+    report = client.get("/api/admin/analytics/cohorts?policy=1&level=beginner", headers=headers).get_json()
+    [cohort] = report["cohorts"]
+    assert cohort["policy"] == 1 and cohort["level"] == "beginner"
+    assert cohort["interviews"] >= 1
+    assert all(0 < rates["coverage"] <= 1 and 0 <= rates["mastery"] <= rates["coverage"]
+               for rates in cohort["kcs"].values())
+    loads, watermark = analytics.loads, report["watermark"]
+
+    # Without new turns the cached report is served without reading conversations.
+    assert client.get("/api/admin/analytics/cohorts", headers=headers).get_json()["watermark"] == watermark
+    assert analytics.loads == loads
+
+    # A new student turn only loads the conversations written since.
+    client.get(f"/api/conversation/interviewer/{interview_id}")
+    client.get(f"/api/conversation/interviewer/select_suggested_conversation/{interview_id}/0")
+    client.post(f"/api/conversation/student/{interview_id}", json={"response": "Another answer"})
+    report = client.get("/api/admin/analytics/cohorts?policy=1&level=beginner", headers=headers).get_json()
+    assert report["watermark"] > watermark and analytics.loads == loads + 1
+
+    result = runner.invoke(args=["cohort-analytics", "--policy", "1"])
+    assert json.loads(result.output)["cohorts"][0]["policy"] == 1
+
+def test_cohort_analytics_matrix():
+    """The latest value per interview and KC decides coverage and mastery."""
+    from services.cohort_analytics import CohortAnalytics
+    analytics = CohortAnalytics()
+    analytics._load_interviews = lambda interview_ids: None
+    analytics._apply([
+        (1, 10, json.dumps({"changed_knowledge_state": {"loops": 1, "lists": 0}})),
+        (2, 11, json.dumps({"changed_knowledge_state": {"loops": 0}})),
+        (3, 10, json.dumps({"changed_knowledge_state": {"lists": 1}})),
+        (4, 11, "not json"),
+    ])
+    report = analytics._build_report()
+    [cohort] = report["cohorts"]
+    assert cohort["interviews"] == 2
+    assert cohort["kcs"] == {"loops": {"coverage": 1.0, "mastery": 0.5},
+                             "lists": {"coverage": 0.5, "mastery": 0.5}}
@@ -1,7 +1,10 @@
 import pdb
+import json
+import pytest
 from unittest.mock import MagicMock
 from datetime import datetime
-from db.models import Student, StudentInterviewRecord
+from db.models import Student, StudentInterviewRecord, Artifact
+from services.lazy_simulator import resolve_simulator
 
 from tests.pytest_lib import app, client, runner
 
@@ -78,4 +81,180 @@ def test_create_interview_post_nocode(app, client, monkeypatch):
     assert data["interview_artifact"]["problem_solution"] == problem_solution
 
     response = client.post('/api/interview', json={}, follow_redirects=True)
-    assert response.status_code == 400
\ No newline at end of file
+    assert response.status_code == 400
+
+
+def test_interview_record_uses_session_cache(app, client):
+    """Repeated record fetches are served from the session cache instead of a reset."""
+    response = client.get('/api/interview/beginner', follow_redirects=True)
+    assert response.status_code == 200
+    interview_id = response.get_json()['interview_id']
+
+    for _ in range(3):
+        response = client.get(f'/api/interview/record/{interview_id}')
+        assert response.status_code == 200
+        assert response.get_json()['interview_id'] == interview_id
+
+    # The redirect after creation already loaded the session.
+    stats = app.config["session_cache"].stats()
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+def test_interviews_get_separate_simulators(app, client):
+    """Each interview is served by its own simulator sharing the prototype's LLM client."""
+    interview_ids = [
+        client.get('/api/interview/beginner', follow_redirects=True).get_json()['interview_id']
+        for _ in range(2)
+    ]
+    prototype = app.config["simulator"]
+    simulator_pool = app.config["simulator_pool"]
+    simulators = []
+    for interview_id in interview_ids:
+        with simulator_pool.checkout(interview_id) as session:
+            simulators.append(session.simulator)
+    assert simulators[0] is not simulators[1]
+    assert all(simulator is not resolve_simulator(prototype) for simulator in simulators)
+    assert all(simulator.llm is prototype.llm for simulator in simulators)
+
+def test_simulators_do_not_share_containers(app, client):
+    """Containers changed on one interview's simulator are not seen by another's or the prototype's."""
+    interview_ids = [
+        client.get('/api/interview/beginner', follow_redirects=True).get_json()['interview_id']
+        for _ in range(2)
+    ]
+    prototype = resolve_simulator(app.config["simulator"])
+    simulator_pool = app.config["simulator_pool"]
+    kc_list, graph = list(prototype.kc_list), list(prototype.G)
+    try:
+        with simulator_pool.checkout(interview_ids[0]) as session:
+            session.simulator.kc_list.append("leaked concept")
+            session.simulator.G.append(("leaked concept", kc_list[0]))
+            session.simulator.current_knowledge_state["leaked concept"] = 1
+        with simulator_pool.checkout(interview_ids[1]) as session:
+            assert session.simulator.kc_list == kc_list
+            assert session.simulator.G == graph
+            assert "leaked concept" not in session.simulator.current_knowledge_state
+            assert session.simulator.llm is prototype.llm
+            assert session.simulator.logger is prototype.logger
+        assert prototype.kc_list == kc_list
+        assert prototype.G == graph
+    finally:
+        for interview_id in interview_ids:
+            simulator_pool.invalidate(interview_id)
+
+def test_migrate_indexes_command(app, runner):
+    """Missing indexes are recreated on an existing database, and the command is idempotent."""
+    index_name = next(index.name for index in app.db.get_indexes("interview_conversation")
+                      if index.columns == ["conversation_interview_id", "conversation_turn_number"])
+    app.db.execute_sql(f'DROP INDEX "{index_name}"')
+
+    result = runner.invoke(args=["migrate-indexes"])
+    assert f"Created index {index_name}." in result.output
+    assert index_name in {index.name for index in app.db.get_indexes("interview_conversation")}
+
+    result = runner.invoke(args=["migrate-indexes"])
+    assert "Created 0 missing indexes." in result.output
+
+def test_create_interview_samples_cached_artifacts(app, client):
+    """Artifacts are sampled from the cached id set of valid artifacts for the level."""
+    sampler = app.config["artifact_sampler"]
+    valid_ids = {artifact.artifact_id for artifact in Artifact.select().where(
+        (Artifact.artifact_level == "beginner") & (Artifact.artifact_valid == 1))}
+    for _ in range(3):
+        data = client.get('/api/interview/beginner', follow_redirects=True).get_json()
+        assert data["interview_problem_id"] in valid_ids
+    assert sampler.loads == 1
+
+    sampler.invalidate("beginner")
+    assert set(sampler.ids("beginner")) == valid_ids
+    assert sampler.loads == 2
+    assert sampler.sample("no-such-level") is None
+
+def test_request_metrics(app, client):
+    """Requests report their SQL work in Server-Timing and aggregate on /metrics."""
+    data = client.get('/api/interview/beginner', follow_redirects=True).get_json()
+    response = client.get('/api/interview/record/{}'.format(data['interview_id']))
+    server_timing = response.headers["Server-Timing"]
+    assert server_timing.startswith('db;desc="')
+    assert "llm;dur=" in server_timing and "serialize;dur=" in server_timing
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert 'skillsense_db_queries_per_request_count{endpoint="interview.get_interview_record"}' in body
+    assert "# TYPE skillsense_request_duration_seconds histogram" in body
+    assert "skillsense_session_cache_hits_total" in body
+
+def test_simulator_is_built_lazily(app, client):
+    """The app answers health checks without building the simulator; interviews build it once."""
+    simulator = app.config["simulator"]
+    assert not simulator.loaded
+    response = client.get('/health')
+    assert response.status_code == 200
+    assert not simulator.loaded
+
+    client.get('/api/interview/beginner', follow_redirects=True)
+    assert simulator.loaded
+    prototype = simulator.load()
+    assert prototype.db is app.db
+    client.get('/api/interview/beginner', follow_redirects=True)
+    assert simulator.load() is prototype
+
+def test_preload_freezes_shared_state(app, tmp_path):
+    """preload builds the simulator and freezes the GC so forked workers keep its pages shared."""
+    import gc
+    from skillsense_ai import preload
+    from services.llm_cache import ResponseCache
+    simulator = app.config["simulator"]
+    cache = app.config["llm_cache"] = ResponseCache(str(tmp_path / "llm_cache.sqlite"))
+    cache.get("warm")
+    app.db.connect(reuse_if_open=True)
+    # Keep the shared in-memory test database open.
+    app.db.close = MagicMock()
+    try:
+        preload(app)
+        assert simulator.loaded
+        app.db.close.assert_called_once()
+        assert cache._local.conn is None
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+        del app.db.close
+
+def test_orjson_provider_matches_default(app):
+    """orjson output is byte-for-byte what Flask's provider writes for ASCII payloads."""
+    from flask.json.provider import DefaultJSONProvider
+    from services.json_provider import ORJSONProvider, ORJSON_AVAILABLE
+    if not ORJSON_AVAILABLE:
+        pytest.skip("orjson is not installed")
+    assert isinstance(app.json, ORJSONProvider)
+    payload = {"b": [1, 2.5, None, True], "a": {"z": "text", "y": {"10": "sorted", "9": "keys"}},
+               "when": datetime(2025, 1, 2, 3, 4, 5)}
+    expected = DefaultJSONProvider(app).dumps(payload, separators=(",", ":"))
+    assert app.json.dumps(payload) == expected
+    assert app.json.loads(expected)["when"] == "Thu, 02 Jan 2025 03:04:05 GMT"
+
+def test_record_response_compression(app, client):
+    """Large records are gzipped on request, with a weak ETag that still revalidates."""
+    import gzip
+    data = client.get('/api/interview/beginner', follow_redirects=True).get_json()
+    url = '/api/interview/record/{}'.format(data['interview_id'])
+    client.get('/api/conversation/interviewer/{}'.format(data['interview_id']))
+    plain = client.get(url)
+    assert "Content-Encoding" not in plain.headers
+    assert len(plain.get_data()) >= 1024
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert json.loads(gzip.decompress(response.get_data())) == plain.get_json()
+    assert response.headers["ETag"] == "W/" + plain.headers["ETag"]
+    assert "compress;dur=" in response.headers["Server-Timing"]
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+    # Small responses are sent as they are.
+    response = client.get('/health', headers={"Accept-Encoding": "gzip"})
+    assert len(response.get_data()) < 1024
+    assert "Content-Encoding" not in response.headers
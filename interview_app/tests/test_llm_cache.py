@@ -0,0 +1,126 @@
+from unittest.mock import MagicMock
+
+from services.llm_cache import CachingLLM, ResponseCache, llm_context_scope
+from tests.pytest_lib import app, client, runner
+
+def test_caching_llm(tmp_path, monkeypatch):
+    """Identical calls in the same context are answered from the persistent cache."""
+    llm = MagicMock()
+    llm.complete.side_effect = lambda prompt, **kwargs: f"answer to {prompt}"
+    cache = ResponseCache(str(tmp_path / "llm_cache.sqlite"), ttl=60, max_entries=2)
+    cached = CachingLLM(llm, cache)
+
+    with llm_context_scope(artifact_id=1, policy=0):
+        assert cached.complete("q1", state={"b": 1, "a": 0}) == "answer to q1"
+        assert cached.complete("q1", state={"a": 0, "b": 1}) == "answer to q1"
+    assert llm.complete.call_count == 1
+    with llm_context_scope(artifact_id=2, policy=0):
+        cached.complete("q1", state={"a": 0, "b": 1})
+    assert llm.complete.call_count == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+    # The cache survives a restart.
+    restarted = CachingLLM(llm, ResponseCache(cache.path, ttl=60))
+    with llm_context_scope(artifact_id=1, policy=0):
+        assert restarted.complete("q1", state={"a": 0, "b": 1}) == "answer to q1"
+    assert llm.complete.call_count == 2
+
+    # Entries expire after the TTL, and the least recently used go over the size cap.
+    import services.llm_cache as llm_cache
+    now = llm_cache.time.time()
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now + 120)
+    with llm_context_scope(artifact_id=1, policy=0):
+        cached.complete("q1", state={"a": 0, "b": 1})
+    assert llm.complete.call_count == 3
+    cached.complete("q2")
+    cached.complete("q3")
+    cache.prune()
+    assert cache._connection().execute("SELECT COUNT(*) FROM llm_response").fetchone()[0] == 2
+
+def test_responses_are_stored_as_json(tmp_path, monkeypatch):
+    """Responses round-trip through JSON, models included; pickles are never loaded."""
+    import pickle
+    from adaptive_concept_selection.knowledge_graph.knowledge_profile import Question, ResponseData
+    cache = ResponseCache(str(tmp_path / "llm_cache.sqlite"))
+    response = ResponseData(questions=[Question(question_text="What is a list?", question_rationale="basics")],
+                            metadata={"kcs": ["lists"]})
+    value = (["lists", "tuples"], {"answer": response}, None)
+    assert cache.put("key", value)
+    assert cache.get("key") == (True, value)
+    stored = cache._connection().execute("SELECT value FROM llm_response WHERE key = 'key'").fetchone()[0]
+    assert '"model": "adaptive_concept_selection.knowledge_graph.knowledge_profile:ResponseData"' in stored
+    assert not cache.put("unsupported", object())
+
+    # A planted pickle is a miss, and unpickling it is never attempted.
+    cache._connection().execute("UPDATE llm_response SET value = ? WHERE key = 'key'", (pickle.dumps(value),))
+    monkeypatch.setattr(pickle, "loads", MagicMock(side_effect=AssertionError("unpickled")))
+    assert cache.get("key") == (False, None)
+
+def test_cache_connections_are_per_process(tmp_path, monkeypatch):
+    """A forked worker opens its own connection instead of using the master's."""
+    import os
+    cache = ResponseCache(str(tmp_path / "llm_cache.sqlite"))
+    master = cache._connection()
+    assert cache._connection() is master
+    pid = os.getpid()
+    monkeypatch.setattr(os, "getpid", lambda: pid + 1)
+    worker = cache._connection()
+    assert worker is not master
+    master.execute("SELECT 1")  # left open for the master, not closed by the worker
+    cache.close()
+    assert cache._local.conn is None
+
+def test_llm_cache_wraps_simulator(app, client, tmp_path):
+    """With the cache enabled, the simulator's LLM client is wrapped and reported on /metrics."""
+    app.config["llm_cache"] = ResponseCache(str(tmp_path / "llm_cache.sqlite"))
+    simulator = app.config["simulator"]
+    assert isinstance(simulator.llm, CachingLLM)
+    for _ in range(2):
+        simulator.llm.complete("student")
+    assert app.config["llm_cache"].stats()["hits"] == 1
+    body = client.get("/metrics").get_data(as_text=True)
+    assert "skillsense_llm_cache_hits_total 1.0" in body
+
+def test_warm_artifacts(app, client, runner, tmp_path):
+    """Warming runs interview creation without writing it; the next interview reads the cache."""
+    from db.models import Artifact, StudentInterviewRecord, database_proxy
+    assert runner.invoke(args=["warm-artifacts", "--limit", "1"]).exit_code != 0
+
+    cache = app.config["llm_cache"] = ResponseCache(str(tmp_path / "llm_cache.sqlite"))
+    artifact = Artifact.select().order_by(Artifact.artifact_id).first()
+    interviews = StudentInterviewRecord.select().count()
+    scheduler = app.config["llm_scheduler"]
+    call = scheduler.call
+    in_transaction = []
+
+    def recording_call(*args, **kwargs):
+        in_transaction.append(database_proxy.in_transaction())
+        return call(*args, **kwargs)
+
+    scheduler.call = recording_call
+    try:
+        result = runner.invoke(args=["warm-artifacts", "--limit", "1", "--policy", "1"])
+    finally:
+        del scheduler.call
+    assert result.exit_code == 0, result.output
+    # The LLM calls ran without a write transaction open.
+    assert in_transaction and not any(in_transaction)
+    assert "Warmed 1 artifact/policy pairs" in result.output
+    assert StudentInterviewRecord.select().count() == interviews
+    assert cache.stats()["stores"] >= 1
+
+    hits = cache.stats()["hits"]
+    response = client.get(f"/api/interview/{artifact.artifact_level}/1/{artifact.artifact_id}")
+    assert response.status_code == 302
+    assert cache.stats()["hits"] > hits
+
+def test_resubmitted_code_is_cached(app, client, tmp_path):
+    """A resubmitted solution, up to line endings and trailing whitespace, skips extraction."""
+    cache = app.config["llm_cache"] = ResponseCache(str(tmp_path / "llm_cache.sqlite"))
+    payload = {"submitted_problem": "Sum a list", "submitted_code": "def f(xs):\n    return sum(xs)\n",
+               "submitted_code_level": "beginner", "interview_policy": 1}
+    assert client.post("/api/interview", json=payload).status_code == 302
+    hits = cache.stats()["hits"]
+    payload["submitted_code"] = "def f(xs):  \r\n    return sum(xs)\r\n"
+    assert client.post("/api/interview", json=payload).status_code == 302
+    assert cache.stats()["hits"] > hits
@@ -0,0 +1,101 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+from services.llm_scheduler import (LLMScheduler, ScheduledLLM, llm_priority_scope,
+                                    PRIORITY_HIGH, PRIORITY_SPECULATIVE)
+from tests.pytest_lib import app, client
+
+def test_scheduler_coalesces_and_bounds_calls():
+    """Identical calls in flight share one LLM call; no more than max_in_flight run at once."""
+    release = threading.Event()
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def complete(prompt):
+        with lock:
+            running.append(prompt)
+            peak.append(len(running))
+        release.wait(5)
+        with lock:
+            running.remove(prompt)
+        return f"answer to {prompt}"
+
+    llm = MagicMock()
+    llm.complete.side_effect = complete
+    scheduler = LLMScheduler(max_in_flight=2)
+    scheduled = ScheduledLLM(llm, scheduler)
+
+    results = {}
+    prompts = ["q1", "q1", "q1", "q2", "q3"]
+    threads = [threading.Thread(target=lambda i=i, p=p: results.__setitem__(i, scheduled.complete(p)))
+               for i, p in enumerate(prompts)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while ((scheduler.stats()["running"] < 2 or scheduler.stats()["calls"] < len(prompts))
+           and time.monotonic() < deadline):
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert [results[i] for i in range(len(prompts))] == [f"answer to {p}" for p in prompts]
+    assert max(peak) <= 2
+    stats = scheduler.stats()
+    assert llm.complete.call_count + stats["coalesced"] == len(prompts)
+    assert stats["coalesced"] >= 1 and stats["running"] == 0 and stats["queued"] == 0
+
+def test_scheduler_prioritizes_and_budgets_tokens():
+    """Waiting calls are admitted by priority, and the token budget throttles admission."""
+    release = threading.Event()
+    order = []
+
+    def complete(prompt):
+        order.append(prompt)
+        if prompt == "blocker":
+            release.wait(5)
+        return prompt
+
+    llm = MagicMock()
+    llm.complete.side_effect = complete
+    scheduler = LLMScheduler(max_in_flight=1)
+    scheduled = ScheduledLLM(llm, scheduler)
+
+    def call(prompt, priority):
+        with llm_priority_scope(priority):
+            scheduled.complete(prompt)
+
+    threads = [threading.Thread(target=call, args=("blocker", PRIORITY_HIGH))]
+    threads[0].start()
+    while scheduler.stats()["running"] < 1:
+        time.sleep(0.01)
+    for prompt, priority in (("prefetch", PRIORITY_SPECULATIVE), ("answer", PRIORITY_HIGH)):
+        thread = threading.Thread(target=call, args=(prompt, priority))
+        thread.start()
+        threads.append(thread)
+        while scheduler.stats()["queued"] < len(threads) - 1:
+            time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert order == ["blocker", "answer", "prefetch"]
+
+    # 600 tokens a minute refill 10 a second; each call costs at least its 2 completion tokens.
+    budgeted = LLMScheduler(tokens_per_minute=600, completion_tokens=2)
+    budgeted.tokens = 0
+    started = time.monotonic()
+    budgeted.call("complete", lambda prompt: prompt, ("q",), {})
+    assert time.monotonic() - started >= 0.2
+    assert budgeted.stats()["tokens_used"] >= 3
+
+def test_scheduler_wraps_simulator(app, client):
+    """The simulator's LLM calls go through the app's scheduler and show up on /metrics."""
+    simulator = app.config["simulator"]
+    assert isinstance(simulator.llm, ScheduledLLM)
+    simulator.llm.complete("student")
+    assert app.config["llm_scheduler"].stats()["calls"] == 1
+    body = client.get("/metrics").get_data(as_text=True)
+    assert "skillsense_llm_calls_total 1.0" in body
+    assert "skillsense_llm_queue_depth 0.0" in body
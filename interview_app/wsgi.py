@@ -1,4 +1,8 @@
-from skillsense_ai import create_app
+from db.config import CONFIG
+from skillsense_ai import create_app, preload
 
 application = create_app()
 
+# With gunicorn --preload, build the simulator once in the master process.
+if CONFIG.getboolean("app", "preload_simulator", fallback=False):
+    preload(application)